@@ -1,14 +1,14 @@
-import io
+import asyncio
 import logging
 import os
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
 
 # Always load .env from the project root
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterator, List, Optional, Union
 
-import cv2
 import numpy as np
 from dotenv import load_dotenv
 from fastapi import (
@@ -17,27 +17,50 @@ from fastapi import (
     FastAPI,
     File,
     HTTPException,
+    Query,
     Request,
     UploadFile,
     status,
 )
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from prometheus_client import Counter, Histogram, Summary, make_asgi_app
 from pydantic import BaseModel, ValidationError
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
 
+from backend.src.batching import PredictionBatcher
+from backend.src.encoding import encode_image
+from backend.src.executor import InferenceExecutor, InferenceQueueFullError
 from backend.src.predict_helpers import (
-    create_image_response,
-    decode_image,
+    MODEL_INPUT_SIZE,
+    decode_upload,
+    detect_image,
+    get_model_version,
+    image_response,
+    log_cached_prediction_background,
     log_prediction_background,
-    run_model_prediction,
+    lookup_cached_prediction,
+    negotiate_response_format,
+    predict_image,
+    read_upload,
+    run_batch_prediction,
+    run_blocking,
+    store_cached_prediction,
+    stream_batch_predictions,
     validate_image_file,
 )
-from ml.predict import get_prediction_from_array
-from monitoring.core.monitor import SUPABASE_BUCKET, BrainTumorImageMonitor, supabase
+from backend.src.prediction_cache import PredictionCache
+from backend.src.timing import StageTimer
+from backend.src.upload_limit import UploadSizeLimitMiddleware
+from ml.predict import MODEL_PATH, model_registry, set_inference_threads
+
+if TYPE_CHECKING:
+    from monitoring.core.monitor import BrainTumorImageMonitor
+    from monitoring.core.report_jobs import DriftReportJob, DriftReportJobs
+    from monitoring.core.report_store import ReportCache
 
 project_root = Path(__file__).resolve().parents[3]
 env_path = project_root / ".env"
@@ -47,12 +70,94 @@ load_dotenv(dotenv_path=env_path)
 monitor_router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
 
+def create_monitor(database_url: str) -> "BrainTumorImageMonitor":
+    # The monitoring stack (pandas, GCS, Supabase) is imported on first use, not with the API
+    from monitoring.core.monitor import BrainTumorImageMonitor
+
+    return BrainTumorImageMonitor(database_url)
+
+
+async def start_monitor(app: FastAPI) -> None:
+    """
+    Set up the monitor on a worker thread once the server is running. It downloads reference images
+    from GCS, so /predict is served without monitoring until it is ready.
+    """
+    try:
+        app.state.monitor = await run_in_threadpool(create_monitor, DATABASE_URL)
+        logger.info("Monitoring system initialized successfully")
+    except Exception:
+        logger.exception("Monitoring system failed to initialize; predictions are not being monitored")
+
+
+async def warm_up_predictors(executor: InferenceExecutor) -> None:
+    """Run one blank prediction per inference worker, so the first request does not pay for predictor setup."""
+    image = np.zeros((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+    try:
+        await asyncio.gather(*(executor.predict(run_batch_prediction, [image]) for _ in range(executor.workers)))
+        logger.info("Inference workers warmed up")
+    except Exception:
+        logger.exception("Warm-up prediction failed")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> None:
-    app.state.monitor = BrainTumorImageMonitor(DATABASE_URL)
-    logger.info("Monitoring system initialized successfully")
+    # Split the cores between inference workers instead of letting every worker use all of them
+    set_inference_threads(max(1, (os.cpu_count() or 1) // (INFERENCE_WORKERS * SERVER_WORKERS)))
+    # Requests run on the executor's private models, so the registry's shared model is not loaded;
+    # only the weights are hashed, for the model version in cache keys and metrics
+    app.state.model_registry = model_registry
+    logger.info("Serving model %s (version %s)", MODEL_PATH, model_registry.version(MODEL_PATH))
+    executor = InferenceExecutor(
+        lambda: model_registry.new_instance(MODEL_PATH),
+        workers=INFERENCE_WORKERS,
+        max_queue=INFERENCE_MAX_QUEUE,
+        version=lambda: model_registry.version(MODEL_PATH),
+    )
+    app.state.inference_executor = executor
+    logger.info("Inference executor started (workers=%d, max_queue=%d)", INFERENCE_WORKERS, INFERENCE_MAX_QUEUE)
+    if PREDICT_MAX_BATCH_SIZE > 1:
+        app.state.batcher = PredictionBatcher(
+            lambda images: executor.predict(run_batch_prediction, images),
+            max_batch_size=PREDICT_MAX_BATCH_SIZE,
+            max_wait_ms=PREDICT_MAX_BATCH_WAIT_MS,
+            max_concurrent_batches=INFERENCE_WORKERS,
+            max_pending=INFERENCE_MAX_QUEUE * PREDICT_MAX_BATCH_SIZE,
+        )
+        app.state.batcher.start()
+        logger.info(
+            "Prediction batching enabled (max_batch_size=%d, max_wait_ms=%.1f)",
+            PREDICT_MAX_BATCH_SIZE,
+            PREDICT_MAX_BATCH_WAIT_MS,
+        )
+    if PREDICTION_CACHE_MAX_MB > 0:
+        app.state.prediction_cache = PredictionCache(
+            max_bytes=int(PREDICTION_CACHE_MAX_MB * 1024 * 1024),
+            ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+            store_images=PREDICTION_CACHE_STORE_IMAGES,
+        )
+        logger.info(
+            "Prediction cache enabled (max_mb=%.1f, ttl_seconds=%.0f)",
+            PREDICTION_CACHE_MAX_MB,
+            PREDICTION_CACHE_TTL_SECONDS,
+        )
+    if PREDICT_WARMUP:
+        app.state.warmup_task = asyncio.create_task(warm_up_predictors(executor))
+    app.state.monitor_task = asyncio.create_task(start_monitor(app))
     yield
-    # (Optional) Add any cleanup code here
+    app.state.monitor_task.cancel()
+    report_jobs = getattr(app.state, "report_jobs", None)
+    if report_jobs is not None:
+        report_jobs.close()
+    monitor = getattr(app.state, "monitor", None)
+    if monitor is not None:
+        # Write the prediction logs that are still buffered
+        await run_in_threadpool(monitor.close)
+    if PREDICT_WARMUP:
+        app.state.warmup_task.cancel()
+    batcher = getattr(app.state, "batcher", None)
+    if batcher is not None:
+        await batcher.stop()
+    executor.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -93,6 +198,16 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
+@app.exception_handler(InferenceQueueFullError)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFullError) -> JSONResponse:
+    logger.warning(f"Rejecting request, inference queue is full: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=format_error("Server is busy, please retry shortly"),
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(SQLAlchemyError)
 async def database_exception_handler(request: Request, exc: SQLAlchemyError) -> JSONResponse:
     logger.error(f"Database error: {exc}")
@@ -116,9 +231,16 @@ engine = create_engine(DATABASE_URL)
 # --- Monitoring endpoints ---
 
 
-def get_monitor(request: Request) -> BrainTumorImageMonitor:
+def get_monitor(request: Request) -> "BrainTumorImageMonitor":
     monitor = getattr(request.app.state, "monitor", None)
     if monitor is None:
+        task = getattr(request.app.state, "monitor_task", None)
+        if task is not None and not task.done():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Monitoring system is starting up",
+                headers={"Retry-After": "10"},
+            )
         raise HTTPException(status_code=500, detail="Monitor not initialized")
     return monitor
 
@@ -126,54 +248,118 @@ def get_monitor(request: Request) -> BrainTumorImageMonitor:
 @monitor_router.get("/dashboard")
 async def get_monitoring_dashboard(request: Request) -> JSONResponse:
     try:
-        dashboard_data: Dict = get_monitor(request).get_brain_tumor_dashboard_data()
+        dashboard_data: Dict = await run_in_threadpool(get_monitor(request).get_brain_tumor_dashboard_data)
         return JSONResponse(content=dashboard_data)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting dashboard data: {e}")
         raise HTTPException(status_code=500, detail="Error getting dashboard data")
 
 
+def get_report_jobs(request: Request) -> "DriftReportJobs":
+    """The drift report job queue, started with the first report request once the monitor is ready."""
+    monitor = get_monitor(request)
+    jobs = getattr(request.app.state, "report_jobs", None)
+    if jobs is None:
+        from monitoring.core.report_jobs import DriftReportJobs
+
+        jobs = request.app.state.report_jobs = DriftReportJobs(monitor)
+    return jobs
+
+
+def report_job_content(job: "DriftReportJob") -> Dict:
+    return {**job.to_dict(), "status_url": f"/monitoring/drift-report/jobs/{job.job_id}"}
+
+
+@monitor_router.post("/drift-report")
+async def submit_drift_report(request: Request, days: int = 7) -> JSONResponse:
+    """Queue a drift report, or return the job already building or built for the same window."""
+    job = get_report_jobs(request).submit(days)
+    return JSONResponse(status_code=200 if job.done else 202, content=report_job_content(job))
+
+
+@monitor_router.get("/drift-report/jobs/{job_id}")
+async def get_drift_report_job(request: Request, job_id: str) -> JSONResponse:
+    job = get_report_jobs(request).get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Drift report job not found")
+    return JSONResponse(content=report_job_content(job))
+
+
 @monitor_router.get("/drift-report")
 async def generate_drift_report(request: Request, days: int = 7) -> JSONResponse:
+    """Build a drift report (or reuse the one for the same window) and wait for it."""
     try:
-        report_filename: str = get_monitor(request).generate_brain_tumor_drift_report(days)
-        # If the returned value is a full URL, extract just the filename
-        if report_filename.startswith("http"):
-            import os
-
-            report_filename = os.path.basename(report_filename)
+        job = get_report_jobs(request).submit(days)
+        await asyncio.wrap_future(job.future)
+        if job.status == "failed":
+            raise HTTPException(status_code=job.status_code or 500, detail=job.error)
         return JSONResponse(
             content={
                 "message": "Brain tumor drift report generated successfully",
-                "report_path": report_filename,  # <-- just the filename
+                "report_path": job.report_path,  # <-- just the filename
                 "days_analyzed": days,
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating drift report: {e}")
         raise HTTPException(status_code=500, detail="Error generating drift report")
 
 
+def get_report_cache(request: Request) -> "ReportCache":
+    """The local cache of reports, created with the first report request."""
+    cache = getattr(request.app.state, "report_cache", None)
+    if cache is None:
+        from monitoring.core.monitor import default_report_storage
+        from monitoring.core.report_store import ReportCache
+
+        storage = default_report_storage()
+        if storage is None:
+            raise HTTPException(status_code=500, detail="Supabase client not configured")
+        cache = request.app.state.report_cache = ReportCache(storage)
+    return cache
+
+
+# Reports are sent from the cached files in chunks of this size
+REPORT_CHUNK_SIZE = 64 * 1024
+
+
 @monitor_router.get("/report/{report_name}")
-async def get_report(request: Request, report_name: str) -> HTMLResponse:
+async def get_report(request: Request, report_name: str) -> Response:
     try:
-        if supabase:
-            logger.info(f"Trying to download from Supabase bucket '{SUPABASE_BUCKET}' with object path '{report_name}'")
-            response = supabase.storage.from_(SUPABASE_BUCKET).download(report_name)
-            if response:
-                # response is bytes
-                content = response.decode("utf-8")
-                return HTMLResponse(content=content)
-            else:
-                raise HTTPException(status_code=404, detail="Report not found in Supabase Storage")
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="Supabase client not configured",
-            )
+        cache = get_report_cache(request)
+        report = await run_in_threadpool(cache.get, report_name)
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Report not found")
     except Exception as e:
         logger.error(f"Error getting report: {e}")
         raise HTTPException(status_code=500, detail="Error getting report")
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found in Supabase Storage")
+
+    encoding = report.select(request.headers.get("accept-encoding"))
+    headers = {"ETag": report.etag_for(encoding), "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if report.matches(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    # Opened before the cache can evict it, then streamed from the open file in chunks
+    file = await run_in_threadpool(cache.open, report, encoding)
+    if file is None:
+        raise HTTPException(status_code=404, detail="Report not found in Supabase Storage")
+    headers["Content-Length"] = str(os.fstat(file.fileno()).st_size)
+    return StreamingResponse(_read_chunks(file), media_type="text/html; charset=utf-8", headers=headers)
+
+
+def _read_chunks(file: BinaryIO) -> Iterator[bytes]:
+    with file:
+        while chunk := file.read(REPORT_CHUNK_SIZE):
+            yield chunk
 
 
 # Register monitoring router
@@ -185,8 +371,37 @@ def health_check() -> Dict[str, str]:
     return {"status": "ok", "message": "Backend is running"}
 
 
-# Validate file size after reading (10MB limit)
+# Maximum size of a single uploaded image (10MB limit)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+# Request bodies above these sizes are answered with 413 before the multipart form is parsed.
+# /predict allows one image plus multipart framing, /predict/batch many images or zip archives.
+MULTIPART_OVERHEAD = 64 * 1024
+PREDICT_BATCH_MAX_UPLOAD_MB = float(os.getenv("PREDICT_BATCH_MAX_UPLOAD_MB", "512"))
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/predict": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+        "/predict/batch": int(PREDICT_BATCH_MAX_UPLOAD_MB * 1024 * 1024),
+    },
+)
+
+# Micro-batching for /predict: collect up to N images or wait at most T ms before running a batch.
+# A max batch size of 1 disables batching.
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "8"))
+PREDICT_MAX_BATCH_WAIT_MS = float(os.getenv("PREDICT_MAX_BATCH_WAIT_MS", "10"))
+
+# Inference executor: one predictor per worker thread, requests beyond workers + queue get a 503
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(2, os.cpu_count() or 1))))
+INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "32"))
+# Warm every inference worker up with a blank image in the background after startup
+PREDICT_WARMUP = os.getenv("PREDICT_WARMUP", "true").lower() in ("1", "true", "yes")
+# Server processes sharing the cores (WEB_CONCURRENCY, the worker count read by uvicorn and backend.src.serve)
+SERVER_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Prediction cache keyed by upload hash + model version; a budget of 0 MB disables it
+PREDICTION_CACHE_MAX_MB = float(os.getenv("PREDICTION_CACHE_MAX_MB", "64"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+PREDICTION_CACHE_STORE_IMAGES = os.getenv("PREDICTION_CACHE_STORE_IMAGES", "true").lower() in ("1", "true", "yes")
 
 
 # Prometheus metrics
@@ -200,34 +415,59 @@ app.mount("/metrics", make_asgi_app())
 
 @app.post("/predict", status_code=status.HTTP_200_OK)
 async def predict(
-    request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)
-) -> StreamingResponse:
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="'json' for detections only, 'image' for the annotated JPEG"),
+) -> Response:
     predict_counter.inc()
     with predict_latency.time():
         validate_image_file(file)
+        timer = StageTimer(get_model_version(request))
         try:
-            contents: bytes = await file.read()
+            # Chunked read into one buffer; oversized uploads fail with 413 without being buffered
+            with timer.stage("read"):
+                contents = await read_upload(file, MAX_FILE_SIZE)
             predict_size_summary.observe(len(contents))
-            if len(contents) > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                    detail=f"File size exceeds maximum limit of {MAX_FILE_SIZE // (1024 * 1024)}MB",
-                )
             if len(contents) == 0:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Empty file received",
                 )
-            image = decode_image(contents)
-            annotated_image, yolo_result = run_model_prediction(image)
+            response_format = negotiate_response_format(request, format)
+            # Re-uploads of the same scan are answered from the cache without decoding or inference
+            with timer.stage("cache"):
+                cache_key, cached = lookup_cached_prediction(request, contents, response_format)
+            if cached is not None:
+                log_cached_prediction_background(request, background_tasks, contents, cached.prediction_info)
+                if response_format == "json":
+                    return timer.finish(JSONResponse(content=cached.detections))
+                return timer.finish(image_response(cached.images[response_format], response_format))
+            with timer.stage("decode"):
+                image, scale = await run_blocking(request, decode_upload, contents)
+            if response_format == "json":
+                # Detections only: never render or encode the annotated image
+                started = time.perf_counter()
+                yolo_result = await detect_image(request, image)
+                timer.add_model_stages(yolo_result, time.perf_counter() - started)
+                log_prediction_background(request, background_tasks, image, yolo_result, contents, scale)
+                detections = store_cached_prediction(request, cache_key, yolo_result, scale=scale)
+                return timer.finish(JSONResponse(content=detections))
+            started = time.perf_counter()
+            annotated_image, yolo_result = await predict_image(request, image)
+            timer.add_model_stages(yolo_result, time.perf_counter() - started)
             if annotated_image is None:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Prediction failed: no annotated image returned",
                 )
-            log_prediction_background(request, background_tasks, image, yolo_result)
-            return create_image_response(annotated_image)
-        except HTTPException:
+            log_prediction_background(request, background_tasks, image, yolo_result, contents, scale)
+            # Encoding is CPU-bound too, so it runs on the inference executor
+            with timer.stage("encode"):
+                body = await run_blocking(request, encode_image, annotated_image, response_format)
+            store_cached_prediction(request, cache_key, yolo_result, response_format, body, scale=scale)
+            return timer.finish(image_response(body, response_format))
+        except (HTTPException, InferenceQueueFullError):
             raise
         except Exception as e:
             logger.exception("Unexpected error in predict endpoint")
@@ -237,6 +477,13 @@ async def predict(
             )
 
 
+@app.post("/predict/batch", status_code=status.HTTP_200_OK)
+async def predict_batch(request: Request, files: List[UploadFile] = File(...)) -> StreamingResponse:
+    """Predict many images (separate files and/or zip archives) and stream one NDJSON line per image."""
+    predict_counter.inc()
+    return StreamingResponse(stream_batch_predictions(request, files), media_type="application/x-ndjson")
+
+
 @app.get("/patients", status_code=status.HTTP_200_OK)
 def get_patients() -> JSONResponse:
     try:
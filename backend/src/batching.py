@@ -0,0 +1,141 @@
+"""
+Dynamic micro-batching for the /predict endpoint.
+
+Concurrent requests are collected for up to `max_batch_size` images or `max_wait_ms` milliseconds
+(measured from the oldest waiting request), run through one batched forward pass and every caller
+gets back its own result object.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Histogram
+
+from backend.src.executor import InferenceQueueFullError
+
+logger = logging.getLogger(__name__)
+
+batch_size_histogram = Histogram(
+    "predict_batch_size",
+    "Number of images per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+batch_queue_wait = Histogram(
+    "predict_batch_queue_wait_seconds",
+    "Time a prediction request waits in the batching queue before its batch starts",
+)
+
+BatchRunner = Callable[[List[np.ndarray]], Awaitable[List[Any]]]
+
+
+class PredictionBatcher:
+    """Collect concurrent prediction requests into batches for a single forward pass."""
+
+    def __init__(
+        self,
+        run_batch: BatchRunner,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_concurrent_batches: int = 1,
+        max_pending: int = 0,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        # Requests allowed to wait for a batch at once; 0 means unbounded
+        self.max_pending = max(0, max_pending)
+        # (image, future, enqueue time)
+        self._pending: Deque[Tuple[np.ndarray, asyncio.Future, float]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: set = set()
+
+    def start(self) -> None:
+        """Start the collector task on the running event loop."""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self) -> None:
+        """Stop collecting, wait for running batches and fail requests that never got scheduled."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Prediction batcher stopped"))
+
+    async def submit(self, image: np.ndarray) -> Any:
+        """Queue `image` for the next batch and wait for its result."""
+        if self._task is None:
+            raise RuntimeError("Prediction batcher is not running")
+        if self.max_pending and len(self._pending) >= self.max_pending:
+            raise InferenceQueueFullError(f"Prediction batch queue is full ({self.max_pending} requests waiting)")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                while not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                # Deadline is anchored on the oldest request so no caller waits longer than max_wait
+                deadline = loop.time() + self.max_wait - (time.perf_counter() - self._pending[0][2])
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                self._slots.release()
+                raise
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch_size, len(self._pending)))]
+            task = loop.create_task(self._run(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, batch: List[Tuple[np.ndarray, asyncio.Future, float]]) -> None:
+        try:
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                batch_queue_wait.observe(started - enqueued)
+            batch_size_histogram.observe(len(batch))
+            try:
+                results = await self.run_batch([image for image, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} images")
+            except Exception as e:
+                logger.error(f"Batched prediction failed for {len(batch)} images: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
@@ -0,0 +1,82 @@
+"""
+Encoding of annotated prediction images.
+
+The output format is negotiated from the `format` query parameter or the `Accept` header (JPEG,
+WebP or PNG, each with its own configurable quality), and the encoded buffer is sent as-is in a
+bytes response with a Content-Length instead of being copied into a stream.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from fastapi.responses import Response
+
+JPEG_QUALITY = int(os.getenv("PREDICT_JPEG_QUALITY", "90"))
+WEBP_QUALITY = int(os.getenv("PREDICT_WEBP_QUALITY", "80"))
+PNG_COMPRESSION = int(os.getenv("PREDICT_PNG_COMPRESSION", "3"))
+
+
+@dataclass(frozen=True)
+class ImageFormat:
+    media_type: str
+    extension: str
+    params: Tuple[int, ...]
+
+
+IMAGE_FORMATS = {
+    "image/jpeg": ImageFormat("image/jpeg", ".jpg", (cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY)),
+    "image/webp": ImageFormat("image/webp", ".webp", (cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY)),
+    "image/png": ImageFormat("image/png", ".png", (cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION)),
+}
+FORMAT_ALIASES = {"jpeg": "image/jpeg", "jpg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+# Used for "image/*", "*/*" and requests without an Accept header
+DEFAULT_IMAGE_TYPE = FORMAT_ALIASES.get(os.getenv("PREDICT_IMAGE_FORMAT", "jpeg").lower(), "image/jpeg")
+
+
+def parse_accept(header: str) -> List[str]:
+    """Media ranges of an Accept header ordered by q-value (stable for ties), without q=0 entries."""
+    ranges = []
+    for position, media_range in enumerate(header.split(",")):
+        parts = [part.strip() for part in media_range.split(";")]
+        if not parts[0]:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, parts[0].lower()))
+    return [media_type for _, _, media_type in sorted(ranges)]
+
+
+def negotiate_image_type(media_type: str) -> Optional[str]:
+    """The encoder media type serving an Accept media range, or None when it is not an image range."""
+    if media_type in IMAGE_FORMATS:
+        return media_type
+    if media_type in ("image/*", "*/*"):
+        return DEFAULT_IMAGE_TYPE
+    return None
+
+
+def encode_image(image: np.ndarray, media_type: str = DEFAULT_IMAGE_TYPE) -> memoryview:
+    """Encode `image` and return a view of OpenCV's output buffer, without copying it."""
+    image_format = IMAGE_FORMATS[media_type]
+    ok, encoded = cv2.imencode(image_format.extension, image, list(image_format.params))
+    if not ok:
+        raise ValueError(f"Could not encode image as {media_type}")
+    return memoryview(encoded.reshape(-1))
+
+
+class EncodedImageResponse(Response):
+    """Bytes response whose body may be a memoryview, sent with an exact Content-Length."""
+
+    def render(self, content) -> memoryview:
+        return memoryview(content)
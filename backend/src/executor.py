@@ -0,0 +1,143 @@
+"""
+Bounded executor for CPU-bound inference work.
+
+The ultralytics predictor is not thread-safe, so the executor owns one predictor instance per worker
+thread and hands them out for the duration of a call. Given a `version` callable (the model registry's
+weights version), a predictor built from older weights is rebuilt before its next call, so swapping the
+weights on disk is picked up by every worker. Work beyond `workers + max_queue` in-flight
+calls is rejected immediately with `InferenceQueueFullError` instead of queueing without bound; bulk
+callers such as /predict/batch use `run_waiting`/`predict_waiting` to wait for a free slot instead.
+"""
+
+import asyncio
+import functools
+import logging
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+inference_in_flight = Gauge("inference_in_flight", "Inference executor calls running or waiting for a worker")
+inference_rejected_counter = Counter(
+    "inference_rejected_total", "Inference executor calls rejected because the wait queue was full"
+)
+
+
+class InferenceQueueFullError(Exception):
+    """Raised when the inference executor cannot accept more work."""
+
+
+class InferenceExecutor:
+    """Fixed-size thread pool with one predictor per worker and a bounded wait queue."""
+
+    def __init__(
+        self,
+        predictor_factory: Callable[[], Any],
+        workers: int = 2,
+        max_queue: int = 32,
+        version: Optional[Callable[[], str]] = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.predictor_factory = predictor_factory
+        self.version = version
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        # One (version, predictor) per worker thread, so a worker never waits for a predictor
+        self._predictors: "queue.SimpleQueue[Tuple[Optional[str], Any]]" = queue.SimpleQueue()
+        for _ in range(self.workers):
+            self._predictors.put(self._build_predictor())
+        self._in_flight = 0
+        # Callers waiting for a free slot, woken in arrival order
+        self._waiters: "Deque[asyncio.Future]" = deque()
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _reserve(self) -> None:
+        # Only touched from the event loop thread, so no lock is needed
+        if self._in_flight >= self.capacity:
+            inference_rejected_counter.inc()
+            raise InferenceQueueFullError(f"Inference queue is full ({self.capacity} calls in flight)")
+        self._in_flight += 1
+        inference_in_flight.inc()
+
+    async def _reserve_waiting(self) -> None:
+        while self._in_flight >= self.capacity:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Woken but cancelled before taking the slot: pass the wakeup on
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_next()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_flight += 1
+        inference_in_flight.inc()
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        inference_in_flight.dec()
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def _run_reserved(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._release()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run `fn(*args, **kwargs)` on a worker thread."""
+        self._reserve()
+        return await self._run_reserved(fn, *args, **kwargs)
+
+    async def run_waiting(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Like `run`, but wait for a free slot instead of raising when the executor is full."""
+        await self._reserve_waiting()
+        return await self._run_reserved(fn, *args, **kwargs)
+
+    async def predict(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args, model=predictor)` on a worker thread with a predictor owned by that call."""
+        return await self.run(self._call_with_predictor, fn, *args)
+
+    async def predict_waiting(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Like `predict`, but wait for a free slot instead of raising when the executor is full."""
+        return await self.run_waiting(self._call_with_predictor, fn, *args)
+
+    def _build_predictor(self) -> Tuple[Optional[str], Any]:
+        # The version is read first, so weights replaced while loading are seen as a change on the next call
+        version = self.version() if self.version is not None else None
+        return version, self.predictor_factory()
+
+    def _call_with_predictor(self, fn: Callable[..., Any], *args: Any) -> Any:
+        built = self._predictors.get()
+        try:
+            if self.version is not None and built[0] != self.version():
+                logger.info("Model weights changed (version %s -> %s); rebuilding predictor", built[0], self.version())
+                built = self._build_predictor()
+            return fn(*args, model=built[1])
+        finally:
+            self._predictors.put(built)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
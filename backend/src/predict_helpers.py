@@ -1,25 +1,88 @@
+import asyncio
+import functools
 import io
+import json
 import logging
-from typing import Any, Dict, Optional
+import os
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import cv2
 import numpy as np
 from fastapi import BackgroundTasks, HTTPException, Request, UploadFile
-from fastapi.responses import StreamingResponse
+from PIL import Image
 from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
-from ml.predict import get_prediction_from_array
+from backend.src.encoding import (
+    DEFAULT_IMAGE_TYPE,
+    FORMAT_ALIASES,
+    EncodedImageResponse,
+    encode_image,
+    negotiate_image_type,
+    parse_accept,
+)
+from backend.src.prediction_cache import CachedPrediction
+from backend.src.upload_limit import too_large_detail
+from ml.predict import MODEL_PATH, PREDICT_TILED, get_prediction_from_array, get_predictions_from_batch, record_speed
 
 logger = logging.getLogger(__name__)
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Images of a /predict/batch upload that are decoded concurrently and predicted as one model batch
+BATCH_PREDICT_WINDOW = int(os.getenv("BATCH_PREDICT_WINDOW", "16"))
+
+# Uploads are read in chunks of this size into a preallocated buffer
+UPLOAD_CHUNK_SIZE = 256 * 1024
+# The JPEG header (including EXIF) is looked for in this many leading bytes
+JPEG_HEADER_BYTES = 128 * 1024
+
+# JPEGs at least twice the model input size are decoded at 1/2, 1/4 or 1/8 resolution directly.
+# Tiled inference needs the full resolution, so there it is off unless asked for
+REDUCED_DECODE_DEFAULT = "false" if PREDICT_TILED else "true"
+PREDICT_REDUCED_DECODE = os.getenv("PREDICT_REDUCED_DECODE", REDUCED_DECODE_DEFAULT).lower() in ("1", "true", "yes")
+MODEL_INPUT_SIZE = 640
+REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
 
 def validate_image_file(file: UploadFile) -> None:
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
 
+async def read_upload(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> memoryview:
+    """
+    Read an upload in chunks into one preallocated buffer and return a zero-copy view of it.
+    Fails with 413 before reading anything when the declared size is too large, and as soon as the
+    bytes read cross `max_size` otherwise, so at most `max_size` bytes are ever held per upload.
+    """
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=413, detail=too_large_detail(max_size))
+    capacity = file.size if file.size is not None else min(max_size, UPLOAD_CHUNK_SIZE)
+    buffer = bytearray(capacity)
+    total = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        end = total + len(chunk)
+        if end > max_size:
+            raise HTTPException(status_code=413, detail=too_large_detail(max_size))
+        if end > len(buffer):
+            # Size was unknown (or wrong): grow geometrically, never beyond the limit
+            buffer.extend(bytes(min(max(end, 2 * len(buffer)), max_size) - len(buffer)))
+        buffer[total:end] = chunk
+        total = end
+    return memoryview(buffer)[:total]
+
+
 def decode_image(contents: bytes) -> np.ndarray:
     nparr = np.frombuffer(contents, np.uint8)
     image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
@@ -30,48 +93,457 @@ def decode_image(contents: bytes) -> np.ndarray:
     return image
 
 
-def run_model_prediction(image: np.ndarray) -> tuple[np.ndarray, Any]:
-    annotated_image, yolo_result = get_prediction_from_array(image)
+def _jpeg_longest_side(contents: bytes) -> Optional[int]:
+    """Longest side of a JPEG read from its header only, or None for other or unreadable formats."""
+    try:
+        # Only the leading bytes are wrapped, so large uploads are not copied for a header peek
+        with Image.open(io.BytesIO(contents[:JPEG_HEADER_BYTES])) as header:
+            return max(header.size) if header.format == "JPEG" else None
+    except Exception:
+        return None
+
+
+def reduced_decode_factor(longest: Optional[int], min_side: int = MODEL_INPUT_SIZE) -> int:
+    """
+    Largest JPEG downscale factor that keeps the longest side at or above `min_side`, so the
+    letterbox still only shrinks the image.
+    """
+    if longest is None:
+        return 1
+    for factor in REDUCED_DECODE_FLAGS:
+        if longest // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_upload(contents: bytes) -> Tuple[np.ndarray, float]:
+    """
+    Decode an upload for inference, using OpenCV's reduced-resolution JPEG decode for large scans.
+    Returns the image and the factor mapping its pixel coordinates back onto the uploaded image.
+    """
+    longest = _jpeg_longest_side(contents) if PREDICT_REDUCED_DECODE else None
+    factor = reduced_decode_factor(longest)
+    if factor == 1:
+        return decode_image(contents), 1.0
+    image = cv2.imdecode(np.frombuffer(contents, np.uint8), REDUCED_DECODE_FLAGS[factor])
+    if image is None:
+        logger.error("cv2.imdecode failed: invalid image file")
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    scale = longest / max(image.shape[:2])
+    logger.info("Image shape: %s (decoded at 1/%d), dtype: %s", image.shape, factor, image.dtype)
+    return image, scale
+
+
+def get_predictor(request: Request) -> Optional[Any]:
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is None:
+        return None
+    return registry.get(MODEL_PATH)
+
+
+def get_model_version(request: Request) -> str:
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is None:
+        return "unknown"
+    return registry.version(MODEL_PATH)
+
+
+def lookup_cached_prediction(
+    request: Request, contents: bytes, response_format: str
+) -> Tuple[Optional[str], Optional[CachedPrediction]]:
+    """
+    Return (cache key, cached entry) for an upload. The key is None when the app has no prediction
+    cache, the entry is None on a miss or when no image in the wanted format is stored yet.
+    """
+    cache = getattr(request.app.state, "prediction_cache", None)
+    if cache is None:
+        return None, None
+    key = cache.key(contents, get_model_version(request))
+    return key, cache.get(key, media_type=None if response_format == "json" else response_format)
+
+
+def store_cached_prediction(
+    request: Request,
+    key: Optional[str],
+    yolo_result: Any,
+    media_type: Optional[str] = None,
+    image: Optional[Union[bytes, memoryview]] = None,
+    scale: float = 1.0,
+) -> Dict[str, Any]:
+    """Serialize `yolo_result`, store it under `key` when caching is enabled and return the detections."""
+    detections = serialize_detections(yolo_result, scale)
+    cache = getattr(request.app.state, "prediction_cache", None)
+    # Keys end with the model version; if the weights changed during the request, the result may
+    # come from either version, so it is not cached
+    if cache is not None and key is not None and key.endswith(f":{get_model_version(request)}"):
+        cache.put(key, detections, build_prediction_info(yolo_result), media_type, image)
+    return detections
+
+
+def negotiate_response_format(request: Request, format: Optional[str] = None) -> str:
+    """
+    Pick "json" (detections only) or the media type of the annotated image for a prediction response.
+    An explicit `format` query parameter wins ("json", "image" or an image format such as "webp");
+    otherwise the Accept header's most preferred JSON or image type is used.
+    """
+    if format:
+        format = format.lower()
+        if format == "json":
+            return "json"
+        if format == "image":
+            return DEFAULT_IMAGE_TYPE
+        if format not in FORMAT_ALIASES:
+            raise HTTPException(status_code=400, detail="format must be 'json', 'image', 'jpeg', 'webp' or 'png'")
+        return FORMAT_ALIASES[format]
+    for media_type in parse_accept(request.headers.get("accept", "")):
+        if media_type == "application/json":
+            return "json"
+        image_type = negotiate_image_type(media_type)
+        if image_type is not None:
+            return image_type
+    return DEFAULT_IMAGE_TYPE
+
+
+def run_model_prediction(image: np.ndarray, model: Optional[Any] = None) -> tuple[np.ndarray, Any]:
+    annotated_image, yolo_result = get_prediction_from_array(image, model=model)
     if annotated_image is None:
         logger.error("Model did not return an annotated image")
         raise HTTPException(status_code=500, detail="Prediction failed: no annotated image returned")
     return annotated_image, yolo_result
 
 
+def run_batch_prediction(images: List[np.ndarray], model: Optional[Any] = None) -> List[Any]:
+    return get_predictions_from_batch(images, model=model)
+
+
+def render_prediction(yolo_result: Any) -> np.ndarray:
+    start = time.perf_counter()
+    annotated_image = yolo_result.plot() if yolo_result is not None else None
+    record_speed(yolo_result, "plot", (time.perf_counter() - start) * 1000)
+    if annotated_image is None:
+        logger.error("Model did not return an annotated image")
+        raise HTTPException(status_code=500, detail="Prediction failed: no annotated image returned")
+    return annotated_image
+
+
+async def run_blocking(request: Request, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run CPU-bound work off the event loop, on the app's inference executor when one is configured."""
+    executor = getattr(request.app.state, "inference_executor", None)
+    if executor is None:
+        return await run_in_threadpool(fn, *args)
+    return await executor.run(fn, *args)
+
+
+async def predict_image(request: Request, image: np.ndarray) -> tuple[np.ndarray, Any]:
+    """Run the prediction through the app's batcher or inference executor, whichever is configured."""
+    batcher = getattr(request.app.state, "batcher", None)
+    if batcher is not None:
+        yolo_result = await batcher.submit(image)
+        return await run_blocking(request, render_prediction, yolo_result), yolo_result
+    executor = getattr(request.app.state, "inference_executor", None)
+    if executor is not None:
+        return await executor.predict(run_model_prediction, image)
+    return await run_in_threadpool(run_model_prediction, image, get_predictor(request))
+
+
+async def detect_image(request: Request, image: np.ndarray) -> Any:
+    """Run the model on `image` and return the raw result object, without rendering it."""
+    batcher = getattr(request.app.state, "batcher", None)
+    if batcher is not None:
+        return await batcher.submit(image)
+    executor = getattr(request.app.state, "inference_executor", None)
+    if executor is not None:
+        results = await executor.predict(run_batch_prediction, [image])
+    else:
+        results = await run_in_threadpool(run_batch_prediction, [image], get_predictor(request))
+    return results[0]
+
+
+def serialize_detections(yolo_result: Any, scale: float = 1.0) -> Dict[str, Any]:
+    """
+    Convert a YOLO result into JSON-serializable boxes (xyxy pixels), confidences and classes.
+    `scale` maps coordinates of a reduced-resolution decode back onto the uploaded image.
+    """
+    detections: List[Dict[str, Any]] = []
+    boxes = getattr(yolo_result, "boxes", None)
+    if boxes is not None and len(boxes) > 0:
+        names = getattr(yolo_result, "names", {}) or {}
+        xyxy = boxes.xyxy.cpu().numpy() * scale
+        confidences = boxes.conf.cpu().numpy()
+        classes = boxes.cls.cpu().numpy().astype(int)
+        for box, confidence, class_id in zip(xyxy, confidences, classes):
+            detections.append(
+                {
+                    "box": [round(float(v), 2) for v in box],
+                    "confidence": round(float(confidence), 4),
+                    "class_id": int(class_id),
+                    "class_name": str(names.get(int(class_id), class_id)),
+                }
+            )
+    orig_shape = getattr(yolo_result, "orig_shape", None)
+    return {
+        "image_size": [round(orig_shape[1] * scale), round(orig_shape[0] * scale)] if orig_shape is not None else None,
+        "num_detections": len(detections),
+        "detections": detections,
+    }
+
+
+def build_prediction_info(yolo_result: Optional[Any]) -> Dict[str, Any]:
+    if yolo_result is not None and hasattr(yolo_result, "boxes"):
+        confidences = yolo_result.boxes.conf.cpu().numpy() if hasattr(yolo_result.boxes, "conf") else []
+        classes = yolo_result.boxes.cls.cpu().numpy() if hasattr(yolo_result.boxes, "cls") else []
+        confidence = float(confidences.max()) if len(confidences) > 0 else 0.0
+        class_idx = int(classes[confidences.argmax()]) if len(classes) > 0 else -1
+        num_detections = len(confidences)
+    else:
+        confidence = 0.0
+        class_idx = -1
+        num_detections = 0
+    return {
+        "confidence": confidence,
+        "class": str(class_idx),
+        "num_detections": num_detections,
+        "model_version": "yolov8n",
+    }
+
+
 def log_prediction_background(
     request: Request,
     background_tasks: BackgroundTasks,
     image: np.ndarray,
     yolo_result: Optional[Any],
+    contents: Optional[Union[bytes, memoryview]] = None,
+    scale: float = 1.0,
 ) -> None:
+    """
+    Schedule monitoring for a prediction. The reference snapshot has its images at full resolution, so
+    when `image` is a reduced decode (`scale` != 1) the background task decodes `contents` again.
+    """
     try:
-        if yolo_result is not None and hasattr(yolo_result, "boxes"):
-            confidences = yolo_result.boxes.conf.cpu().numpy() if hasattr(yolo_result.boxes, "conf") else []
-            classes = yolo_result.boxes.cls.cpu().numpy() if hasattr(yolo_result.boxes, "cls") else []
-            confidence = float(confidences.max()) if len(confidences) > 0 else 0.0
-            class_idx = int(classes[confidences.argmax()]) if len(classes) > 0 else -1
-            num_detections = len(confidences)
-        else:
-            confidence = 0.0
-            class_idx = -1
-            num_detections = 0
-        prediction_info: Dict[str, Any] = {
-            "confidence": confidence,
-            "class": str(class_idx),
-            "num_detections": num_detections,
-            "model_version": "yolov8n",
-        }
+        prediction_info = build_prediction_info(yolo_result)
         monitor = getattr(request.app.state, "monitor", None)
         if monitor is not None:
-            background_tasks.add_task(monitor.log_prediction, image, prediction_info)
+            full_image = image if scale == 1.0 or contents is None else None
+            background_tasks.add_task(_log_upload_prediction, monitor, contents, prediction_info, full_image)
         else:
             logger.warning("Monitor system is not initialized; skipping monitoring log.")
     except Exception as e:
         logger.warning(f"Failed to schedule logging for monitoring: {e}")
 
 
-def create_image_response(annotated_image: np.ndarray) -> StreamingResponse:
-    result = cv2.imencode(".jpg", annotated_image)
-    _, img_encoded = result
-    logger.info("Returning annotated image, size: %d bytes", len(img_encoded))
-    return StreamingResponse(io.BytesIO(img_encoded.tobytes()), media_type="image/jpeg")
+def log_cached_prediction_background(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    contents: bytes,
+    prediction_info: Dict[str, Any],
+) -> None:
+    """Schedule monitoring for a cache hit; the upload is only decoded in the background task."""
+    monitor = getattr(request.app.state, "monitor", None)
+    if monitor is None:
+        logger.warning("Monitor system is not initialized; skipping monitoring log.")
+        return
+    background_tasks.add_task(_log_upload_prediction, monitor, contents, prediction_info)
+
+
+def _log_upload_prediction(
+    monitor: Any,
+    contents: Optional[Union[bytes, memoryview]],
+    prediction_info: Dict[str, Any],
+    image: Optional[np.ndarray] = None,
+) -> None:
+    """Log a prediction with the upload at full resolution: `image` when given, else `contents` decoded."""
+    try:
+        monitor.log_prediction(image if image is not None else decode_image(contents), prediction_info)
+    except Exception as e:
+        logger.warning(f"Failed to log prediction for monitoring: {e}")
+
+
+def image_response(body: Union[bytes, memoryview], media_type: str) -> EncodedImageResponse:
+    logger.info("Returning annotated image (%s), size: %d bytes", media_type, len(body))
+    return EncodedImageResponse(content=body, media_type=media_type)
+
+
+def create_image_response(annotated_image: np.ndarray, media_type: str = DEFAULT_IMAGE_TYPE) -> EncodedImageResponse:
+    return image_response(encode_image(annotated_image, media_type), media_type)
+
+
+# --- Batch prediction (/predict/batch) ---
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+BatchSource = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+
+def _is_zip_upload(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+async def _read_upload(file: UploadFile) -> memoryview:
+    validate_image_file(file)
+    return await read_upload(file)
+
+
+async def _read_zip_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo) -> bytes:
+    # Check the declared size before inflating anything, so a zip bomb is never decompressed
+    if member.file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=too_large_detail(MAX_FILE_SIZE))
+    return await run_in_threadpool(archive.read, member)
+
+
+async def _raise_http(status_code: int, detail: str) -> bytes:
+    raise HTTPException(status_code=status_code, detail=detail)
+
+
+async def iter_batch_sources(files: List[UploadFile]) -> AsyncIterator[BatchSource]:
+    """Yield (name, reader) pairs for every image in the upload, expanding zip archives lazily."""
+    for file in files:
+        if not _is_zip_upload(file):
+            yield file.filename or "", functools.partial(_read_upload, file)
+            continue
+        try:
+            archive = await run_in_threadpool(zipfile.ZipFile, file.file)
+        except zipfile.BadZipFile:
+            yield file.filename or "", functools.partial(_raise_http, 400, "Invalid zip archive")
+            continue
+        for member in archive.infolist():
+            if member.is_dir() or not member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            yield member.filename, functools.partial(_read_zip_member, archive, member)
+
+
+@dataclass(frozen=True)
+class _BatchImage:
+    index: int
+    name: str
+    image: np.ndarray
+    scale: float
+    cache_key: Optional[str]
+    contents: Union[bytes, memoryview]
+
+
+def _batch_line(index: int, name: str, **fields: Any) -> bytes:
+    return (json.dumps({"index": index, "filename": name, **fields}) + "\n").encode()
+
+
+async def run_blocking_waiting(request: Request, fn: Callable[..., Any], *args: Any) -> Any:
+    """Like `run_blocking`, but wait for a free executor slot instead of failing fast when it is full."""
+    executor = getattr(request.app.state, "inference_executor", None)
+    if executor is None:
+        return await run_in_threadpool(fn, *args)
+    return await executor.run_waiting(fn, *args)
+
+
+async def detect_images(request: Request, images: List[np.ndarray]) -> List[Any]:
+    """Run the model over `images` in one batched call, waiting for a free executor slot when it is full."""
+    executor = getattr(request.app.state, "inference_executor", None)
+    if executor is not None:
+        return await executor.predict_waiting(run_batch_prediction, images)
+    return await run_in_threadpool(run_batch_prediction, images, get_predictor(request))
+
+
+# Arguments of _log_upload_prediction for the images of one window
+BatchLogs = List[Tuple[Union[bytes, memoryview], Dict[str, Any], Optional[np.ndarray]]]
+# Monitoring of finished windows still running; referenced here so the tasks are not garbage collected
+_batch_logging_tasks: Set["asyncio.Future[None]"] = set()
+
+
+def _log_batch(monitor: Any, logs: BatchLogs) -> None:
+    for contents, prediction_info, image in logs:
+        _log_upload_prediction(monitor, contents, prediction_info, image)
+
+
+async def _start_batch_logging(
+    monitor: Any, logs: BatchLogs, previous: Optional["asyncio.Future[None]"]
+) -> Optional["asyncio.Future[None]"]:
+    """
+    Log a window's predictions in the background, after its lines were sent. The previous window's
+    logging is waited for first, so at most one window of images is held for monitoring.
+    """
+    if previous is not None:
+        await asyncio.shield(previous)
+    if monitor is None or not logs:
+        return None
+    task = asyncio.ensure_future(run_in_threadpool(_log_batch, monitor, logs))
+    _batch_logging_tasks.add(task)
+    task.add_done_callback(_batch_logging_tasks.discard)
+    return task
+
+
+async def _prepare_batch_item(
+    request: Request, index: int, name: str, read: Callable[[], Awaitable[bytes]], logs: BatchLogs
+) -> Union[bytes, _BatchImage]:
+    """Read and decode one image; errors and cache hits come back as their finished NDJSON line."""
+    try:
+        contents = await read()
+        if len(contents) == 0:
+            raise HTTPException(status_code=400, detail="Empty file received")
+        cache_key, cached = lookup_cached_prediction(request, contents, "json")
+        if cached is not None:
+            logs.append((contents, cached.prediction_info, None))
+            return _batch_line(index, name, **cached.detections)
+        image, scale = await run_blocking_waiting(request, decode_upload, contents)
+    except HTTPException as e:
+        return _batch_line(index, name, error=e.detail)
+    except Exception:
+        logger.exception(f"Batch prediction failed for {name}")
+        return _batch_line(index, name, error="Internal server error during prediction")
+    return _BatchImage(index, name, image, scale, cache_key, contents)
+
+
+async def _predict_batch_window(
+    request: Request, sources: List[Tuple[int, str, Callable[[], Awaitable[bytes]]]], logs: BatchLogs
+) -> AsyncIterator[bytes]:
+    """
+    Decode a window of images concurrently and run the decoded ones through the model as one batch.
+    What to log to the monitor is added to `logs`, for the caller to log after the lines are sent.
+    """
+    prepared = await asyncio.gather(*(_prepare_batch_item(request, *source, logs) for source in sources))
+    items = [item for item in prepared if isinstance(item, _BatchImage)]
+    for item in prepared:
+        if isinstance(item, bytes):
+            yield item
+    if not items:
+        return
+    try:
+        results = await detect_images(request, [item.image for item in items])
+    except Exception:
+        logger.exception(f"Batch prediction failed for {len(items)} images")
+        for item in items:
+            yield _batch_line(item.index, item.name, error="Internal server error during prediction")
+        return
+    for item, yolo_result in zip(items, results):
+        # A reduced decode is decoded again at full resolution when it is logged
+        logs.append((item.contents, build_prediction_info(yolo_result), item.image if item.scale == 1.0 else None))
+        detections = store_cached_prediction(request, item.cache_key, yolo_result, scale=item.scale)
+        yield _batch_line(item.index, item.name, **detections)
+
+
+async def stream_batch_predictions(
+    request: Request, files: List[UploadFile], window: int = BATCH_PREDICT_WINDOW
+) -> AsyncIterator[bytes]:
+    """
+    Predict every image in `files` and yield one NDJSON line per image.
+    Images are taken `window` at a time: read and decoded concurrently, then predicted in one batched
+    model call, so memory stays flat for any upload size. When the inference executor is full the
+    upload waits for it rather than failing its images. Monitoring runs in the background after each
+    window's lines are sent, like the background task of /predict.
+    """
+    monitor = getattr(request.app.state, "monitor", None)
+    logging: Optional["asyncio.Future[None]"] = None
+    sources: List[Tuple[int, str, Callable[[], Awaitable[bytes]]]] = []
+    index = 0
+    async for name, read in iter_batch_sources(files):
+        sources.append((index, name, read))
+        index += 1
+        if len(sources) >= window:
+            logs: BatchLogs = []
+            async for line in _predict_batch_window(request, sources, logs):
+                yield line
+            logging = await _start_batch_logging(monitor, logs, logging)
+            sources = []
+    if sources:
+        logs = []
+        async for line in _predict_batch_window(request, sources, logs):
+            yield line
+        await _start_batch_logging(monitor, logs, logging)
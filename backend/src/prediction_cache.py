@@ -0,0 +1,127 @@
+"""
+Content-addressed cache of /predict results.
+
+Entries are keyed by the sha256 of the raw upload bytes plus the model version, so re-uploading the
+same scan skips decoding, inference, plotting and encoding, while a new model version never serves
+stale detections. The cache holds at most `max_bytes` of payload, evicting least recently used
+entries first, and entries expire `ttl_seconds` after they were stored.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Union
+
+from prometheus_client import Counter, Gauge
+
+prediction_cache_hits = Counter("prediction_cache_hits_total", "Prediction requests served from the cache")
+prediction_cache_misses = Counter("prediction_cache_misses_total", "Prediction requests not found in the cache")
+prediction_cache_evictions = Counter(
+    "prediction_cache_evictions_total", "Prediction cache entries evicted to stay within the byte budget"
+)
+prediction_cache_bytes = Gauge("prediction_cache_bytes", "Bytes currently held by the prediction cache")
+
+
+@dataclass
+class CachedPrediction:
+    detections: Dict[str, Any]
+    prediction_info: Dict[str, Any]
+    # Encoded annotated images by media type, e.g. {"image/jpeg": b"..."}
+    images: Dict[str, Union[bytes, memoryview]] = field(default_factory=dict)
+    expires_at: float = 0.0
+    size: int = 0
+
+
+class PredictionCache:
+    """Byte-budgeted LRU cache with a TTL for serialized detections and encoded annotated images."""
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        store_images: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.store_images = store_images
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedPrediction]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(contents: bytes, model_version: str) -> str:
+        return f"{hashlib.sha256(contents).hexdigest()}:{model_version}"
+
+    def get(self, key: str, media_type: Optional[str] = None) -> Optional[CachedPrediction]:
+        """
+        Return the live entry for `key`, or None on a miss. With a `media_type` an entry without an
+        image encoded in that format counts as a miss, so the caller renders it and `put`s the image.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= self._clock():
+                self._remove(key)
+                entry = None
+            if entry is None or (media_type is not None and media_type not in entry.images):
+                prediction_cache_misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            prediction_cache_hits.inc()
+            return entry
+
+    def put(
+        self,
+        key: str,
+        detections: Dict[str, Any],
+        prediction_info: Dict[str, Any],
+        media_type: Optional[str] = None,
+        image: Optional[Union[bytes, memoryview]] = None,
+    ) -> None:
+        with self._lock:
+            existing = self._entries.get(key)
+            # Keep images stored by earlier requests for the same upload in other formats
+            images = dict(existing.images) if existing is not None else {}
+            if self.store_images and media_type is not None and image is not None:
+                # A memoryview keeps the encoder's buffer alive, so nothing is copied
+                images[media_type] = image
+            entry = CachedPrediction(
+                detections=detections,
+                prediction_info=prediction_info,
+                images=images,
+                expires_at=self._clock() + self.ttl_seconds,
+                size=len(json.dumps(detections)) + len(key) + sum(len(body) for body in images.values()),
+            )
+            if entry.size > self.max_bytes:
+                return
+            if existing is not None:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                prediction_cache_evictions.inc()
+            prediction_cache_bytes.set(self._bytes)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        prediction_cache_bytes.set(self._bytes)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            prediction_cache_bytes.set(0)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,144 @@
+"""
+Pre-fork server for the API.
+
+`uvicorn --workers N` starts N fresh interpreters that each import torch and ultralytics and load
+their own copy of the weights. This entry point does the imports and loads the weights once in a
+master process and then forks the workers, so the pages holding code and weights are shared
+copy-on-write between them and only what a worker writes becomes its own memory.
+
+    python -m backend.src.serve --workers 4 --port 8000
+
+Combine with MMAP_WEIGHTS=true to keep the weights in the page cache rather than in the heap.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Any, Set
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before replacing a worker that exited, so a crashing app does not fork in a tight loop
+RESTART_DELAY_SECONDS = 1.0
+
+
+def preload(app_path: str) -> Any:
+    """Import the app and load the weights it serves: one model per inference thread."""
+    from uvicorn.importer import import_from_string
+
+    app = import_from_string(app_path)
+
+    # The app imports the monitoring stack when the monitor starts; importing it here shares it too
+    import monitoring.core.monitor  # noqa: F401
+    from backend.src.api import INFERENCE_WORKERS
+    from ml.predict import MODEL_PATH, model_registry
+
+    if MODEL_PATH.endswith(".onnx"):
+        # ONNX Runtime sessions own thread pools too, so they are created after the fork
+        logger.info("ONNX model %s is loaded by each worker; only the imports are shared", MODEL_PATH)
+    else:
+        import torch
+
+        # Intra-op thread pools do not survive fork, so the master never starts one;
+        # each worker sets its thread count in the app lifespan
+        torch.set_num_threads(1)
+        model_registry.preload(MODEL_PATH, instances=INFERENCE_WORKERS)
+        logger.info("Preloaded %s (version %s)", MODEL_PATH, model_registry.version(MODEL_PATH))
+    # Move everything allocated so far out of the collector's reach, so collections in the workers
+    # do not write to (and un-share) the pages of these objects
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def run_worker(app: Any, sock: socket.socket, log_level: str) -> None:
+    import uvicorn
+
+    from backend.src.api import engine
+
+    # Drop any database connections inherited from the master instead of sharing them
+    engine.dispose(close=False)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(app_path: str, host: str, port: int, workers: int, log_level: str = "info") -> None:
+    # Read by the app to split the cores between the workers' inference threads
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    app = preload(app_path)
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children: Set[int] = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            # uvicorn installs its own handlers; until then a signal must not run the master's
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(app, sock, log_level)
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+        logger.info("Started worker %d", pid)
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info("Serving on %s:%d with %d pre-forked workers (master %d)", host, port, workers, os.getpid())
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with status %d, starting a new one", pid, status)
+            time.sleep(RESTART_DELAY_SECONDS)
+            spawn()
+    sock.close()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Serve the API from workers forked after the model is loaded")
+    p.add_argument("--app", default="backend.src.api:app", help="App import string")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    p.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    p.add_argument("--log-level", default="info")
+    args = p.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+    if not hasattr(os, "fork"):
+        sys.exit("Pre-fork serving needs os.fork; use uvicorn --workers on this platform")
+    serve(args.app, args.host, args.port, max(1, args.workers), args.log_level)
+
+
+if __name__ == "__main__":
+    main()
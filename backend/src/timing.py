@@ -0,0 +1,85 @@
+"""
+Per-stage latency accounting for /predict.
+
+A `StageTimer` collects how long each stage of one request took (upload read, decode, the
+preprocess / forward / postprocess split reported by the model, plotting, encoding, ...). The
+durations go to one Prometheus histogram labelled by stage and model version and can be echoed
+in a `Server-Timing` response header. Recording is a dict update per stage, so it stays on in
+production.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from fastapi.responses import Response
+from prometheus_client import Histogram
+
+# Stages reported by the model on its result object, in milliseconds (see ultralytics Results.speed)
+MODEL_STAGES = ("preprocess", "inference", "postprocess", "plot")
+
+# Also send the stage durations back in a Server-Timing header
+PREDICT_SERVER_TIMING = os.getenv("PREDICT_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+predict_stage_latency = Histogram(
+    "predict_stage_latency_seconds",
+    "Latency of each /predict stage in seconds",
+    ["stage", "model_version"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def observe_stage(stage: str, model_version: str, seconds: float) -> None:
+    predict_stage_latency.labels(stage=stage, model_version=model_version).observe(seconds)
+
+
+class StageTimer:
+    def __init__(self, model_version: str):
+        self.model_version = model_version
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add_model_stages(self, yolo_result: Any, elapsed: float) -> None:
+        """
+        Split the `elapsed` seconds spent waiting for a prediction into the stages the model reported
+        on `yolo_result`; whatever is left was spent queueing for the batcher or executor.
+        """
+        speed = getattr(yolo_result, "speed", None)
+        reported = {
+            stage: speed[stage] / 1000 for stage in MODEL_STAGES if isinstance(speed, dict) and speed.get(stage)
+        }
+        if not reported:
+            self.add("inference", elapsed)
+            return
+        for stage, seconds in reported.items():
+            self.add(stage, seconds)
+        self.add("queue", max(0.0, elapsed - sum(reported.values())))
+
+    def observe(self) -> None:
+        for stage, seconds in self.stages.items():
+            observe_stage(stage, self.model_version, seconds)
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self._start
+        entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def finish(self, response: Response) -> Response:
+        """Record the stages and, when enabled, attach them to `response` as a Server-Timing header."""
+        self.observe()
+        if PREDICT_SERVER_TIMING:
+            response.headers["Server-Timing"] = self.server_timing()
+        return response
@@ -0,0 +1,88 @@
+"""
+ASGI middleware that rejects oversized request bodies before they are parsed.
+
+FastAPI parses multipart forms before the endpoint runs, so a size check inside `/predict` only
+happens after the whole upload has been received and spooled. This middleware answers 413 as soon
+as the declared Content-Length, or the bytes actually received for chunked uploads, exceed the
+limit configured for the path.
+"""
+
+import json
+from typing import Dict
+
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def too_large_detail(limit: int) -> str:
+    return f"File size exceeds maximum limit of {limit // (1024 * 1024)}MB"
+
+
+class UploadTooLarge(HTTPException):
+    """
+    Raised from `receive` once a request body crosses its size limit. Being an HTTPException, it
+    passes through FastAPI's body parsing and is answered by the regular 413 handler.
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=too_large_detail(limit))
+
+
+class UploadSizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        # path -> maximum request body size in bytes
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if response_started:
+                raise
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send: Send, limit: int) -> None:
+        body = json.dumps({"detail": too_large_detail(limit)}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
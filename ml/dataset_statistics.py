@@ -3,9 +3,10 @@ import os
 from collections import Counter
 
 import matplotlib.pyplot as plt
-from google.cloud import storage
 from PIL import Image
 
+from ml.gcs import GCSFetcher
+
 
 def get_image_shape(image_path):
     with Image.open(image_path) as img:
@@ -48,29 +49,27 @@ def analyze_local_dataset(base_dir="data/BrainTumor/BrainTumorYolov8", out_dir="
             plt.close()
 
 
-def download_gcs_files(bucket, prefix, local_dir):
+def download_gcs_files(blobs, local_dir, fetcher):
     os.makedirs(local_dir, exist_ok=True)
-    blobs = list(bucket.list_blobs(prefix=prefix))
     local_files = []
-    for blob in blobs:
-        if not blob.name.endswith("/"):
-            local_path = os.path.join(local_dir, os.path.basename(blob.name))
-            blob.download_to_filename(local_path)
-            local_files.append(local_path)
+    for blob, data in fetcher.download(blobs):
+        local_path = os.path.join(local_dir, os.path.basename(blob.name))
+        with open(local_path, "wb") as f:
+            f.write(data)
+        local_files.append(local_path)
     return local_files
 
 
 def dataset_statistics_gcs(bucket_name="brain-tumor-data", base_prefix="BrainTumorYolov8", out_dir="ml/data_changes"):
     os.makedirs(out_dir, exist_ok=True)
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+    fetcher = GCSFetcher(bucket_name)
     for split in ["train", "valid", "test"]:
-        image_prefix = f"{base_prefix}/{split}/images/"
-        label_prefix = f"{base_prefix}/{split}/labels/"
+        # One listing per split for both the images and the labels
+        pairs = fetcher.list_labeled(f"{base_prefix}/{split}/")
         local_images = os.path.join(out_dir, f"gcs_{split}_images")
         local_labels = os.path.join(out_dir, f"gcs_{split}_labels")
-        image_files = download_gcs_files(bucket, image_prefix, local_images)
-        label_files = download_gcs_files(bucket, label_prefix, local_labels)
+        image_files = download_gcs_files([pair.image for pair in pairs], local_images, fetcher)
+        label_files = download_gcs_files([pair.label for pair in pairs if pair.label], local_labels, fetcher)
         print(f"\n{split.capitalize()} set (GCS):")
         print(f"Number of images: {len(image_files)}")
         if image_files:
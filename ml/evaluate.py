@@ -28,6 +28,21 @@ def find_best_weights(model_name: str, project_dir: str = "models") -> str:
     return best_path
 
 
+def evaluate_weights(weights: str, data_yaml: str, split: str, **val_kwargs) -> dict:
+    """
+    Runs `val()` for any weights file ultralytics can load (.pt, .onnx, ...)
+    and returns the core detection metrics as a dict.
+    """
+    model = YOLO(weights, task="detect")
+    metrics = model.val(data=data_yaml, split=split, **val_kwargs)
+    return {
+        "Mean Precision": metrics.box.mp,
+        "Mean Recall": metrics.box.mr,
+        "mAP@0.5": metrics.box.map50,
+        "mAP@0.5:0.95": metrics.box.map,
+    }
+
+
 def evaluate_model(
     model_name: str,
     data_yaml: str,
@@ -40,21 +55,10 @@ def evaluate_model(
     # 1) locate best.pt
     weights = find_best_weights(model_name)
 
-    # 2) load model
-    model = YOLO(weights)
-
-    # 3) run validation
-    metrics = model.val(data=data_yaml, split=split)
-
-    # 4) build metrics dict just like in your notebook
-    results_dict = {
-        "Mean Precision": metrics.box.mp,
-        "Mean Recall": metrics.box.mr,
-        "mAP@0.5": metrics.box.map50,
-        "mAP@0.5:0.95": metrics.box.map,
-    }
+    # 2) + 3) load model and run validation
+    results_dict = evaluate_weights(weights, data_yaml, split)
 
-    # 5) DataFrame for easy viewing / CI
+    # 4) DataFrame for easy viewing / CI
     df = pd.DataFrame(results_dict.items(), columns=["Metric", "Value"])
     print(df)
     return df
@@ -0,0 +1,52 @@
+import argparse
+import os
+import shutil
+
+from ultralytics import YOLO
+
+from ml.predict import BEST_MODEL_PATH, ONNX_MODEL_PATH
+
+
+def export_onnx(
+    weights: str = BEST_MODEL_PATH,
+    output: str = ONNX_MODEL_PATH,
+    imgsz: int = 640,
+    dynamic: bool = True,
+    simplify: bool = True,
+    opset: int = 17,
+) -> str:
+    """
+    Export YOLO `weights` to ONNX for the ONNX Runtime serving backend and return the output path.
+    A dynamic batch axis is kept by default so the micro-batcher can run several images per session call.
+    """
+    model = YOLO(weights)
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=simplify, opset=opset)
+    if os.path.abspath(exported) != os.path.abspath(output):
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        shutil.move(exported, output)
+    print(f"Exported {weights} to {output}")
+    return output
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Export trained YOLO weights to ONNX for CPU serving")
+    p.add_argument("--weights", type=str, default=BEST_MODEL_PATH, help="PyTorch weights to export")
+    p.add_argument("--output", type=str, default=ONNX_MODEL_PATH, help="Where to write the .onnx file")
+    p.add_argument("--imgsz", type=int, default=640, help="Model input size")
+    p.add_argument("--static-batch", action="store_true", help="Export with a fixed batch size of 1")
+    p.add_argument("--no-simplify", action="store_true", help="Skip onnxslim graph simplification")
+    p.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    args = p.parse_args()
+
+    export_onnx(
+        weights=args.weights,
+        output=args.output,
+        imgsz=args.imgsz,
+        dynamic=not args.static_batch,
+        simplify=not args.no_simplify,
+        opset=args.opset,
+    )
+
+
+if __name__ == "__main__":
+    main()
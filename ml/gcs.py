@@ -0,0 +1,113 @@
+"""
+Concurrent in-memory downloads from Google Cloud Storage.
+
+A dataset split is listed once, every image is paired with its YOLO label file from that listing and
+the blobs are downloaded with `download_as_bytes` by a bounded thread pool sharing one client, whose
+connection pool is sized to the number of threads. Images are decoded from the downloaded buffer, so
+nothing is written to disk.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import cv2
+import numpy as np
+
+GCS_FETCH_WORKERS = int(os.getenv("GCS_FETCH_WORKERS", "16"))
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def storage_client(max_connections: int = GCS_FETCH_WORKERS) -> Any:
+    """A storage client whose HTTP session keeps enough connections open for `max_connections` threads."""
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    client = storage.Client()
+    # The default pool keeps 10 connections; more threads would open and drop one per request
+    client._http.mount("https://", HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections))
+    return client
+
+
+@dataclass
+class LabeledBlob:
+    image: Any
+    label: Optional[Any] = None
+
+
+@dataclass
+class LabeledImage:
+    name: str
+    image: Optional[np.ndarray]
+    label: Optional[str]
+
+
+def _split_key(name: str) -> Tuple[str, str]:
+    # ".../train/images/x.jpg" and ".../train/labels/x.txt" share ("/.../train", "x")
+    path = PurePosixPath(name)
+    return str(path.parent.parent), path.stem
+
+
+def pair_labels(blobs: Iterable[Any]) -> List[LabeledBlob]:
+    """Pair every image under an `images/` prefix with the label file of the same stem under `labels/`."""
+    images = []
+    labels: Dict[Tuple[str, str], Any] = {}
+    for blob in blobs:
+        path = PurePosixPath(blob.name)
+        if path.parent.name == "images" and path.suffix.lower() in IMAGE_SUFFIXES:
+            images.append(blob)
+        elif path.parent.name == "labels" and path.suffix == ".txt":
+            labels[_split_key(blob.name)] = blob
+    return [LabeledBlob(blob, labels.get(_split_key(blob.name))) for blob in images]
+
+
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Decode an encoded image into a BGR array like `cv2.imread`; None if it cannot be decoded."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class GCSFetcher:
+    """List and download blobs of one bucket with a bounded pool of threads sharing a client."""
+
+    def __init__(self, bucket_name: str, client: Optional[Any] = None, max_workers: int = GCS_FETCH_WORKERS):
+        self.bucket_name = bucket_name
+        self.max_workers = max(1, max_workers)
+        self.client = client if client is not None else storage_client(self.max_workers)
+
+    def list_blobs(self, prefix: str) -> List[Any]:
+        return [blob for blob in self.client.list_blobs(self.bucket_name, prefix=prefix) if not blob.name.endswith("/")]
+
+    def list_labeled(self, prefix: str) -> List[LabeledBlob]:
+        """Images under `prefix` paired with their label files, from a single listing."""
+        return pair_labels(self.list_blobs(prefix))
+
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """Apply `fn` in the pool and yield results in order, with at most 2 x max_workers in flight."""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gcs-fetch") as pool:
+            pending: deque = deque()
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= 2 * self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def download(self, blobs: Iterable[Any]) -> Iterator[Tuple[Any, bytes]]:
+        return self.map(lambda blob: (blob, blob.download_as_bytes()), blobs)
+
+    def fetch_labeled_images(self, pairs: Iterable[LabeledBlob]) -> Iterator[LabeledImage]:
+        """Download and decode images together with the text of their labels."""
+
+        def fetch(pair: LabeledBlob) -> LabeledImage:
+            # cv2.imdecode releases the GIL, so decoding overlaps with the other threads' downloads
+            image = decode_image(pair.image.download_as_bytes())
+            label = pair.label.download_as_bytes().decode() if pair.label is not None else None
+            return LabeledImage(pair.image.name, image, label)
+
+        return self.map(fetch, pairs)
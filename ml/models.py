@@ -84,13 +84,14 @@ def get_prediction_from_array(image: np.ndarray):
     if image is None:
         return None, None
 
-    # Ensure BGR uint8 640×640
+    # Ensure BGR uint8; the model letterboxes to 640 itself, keeping the aspect ratio
     if image.dtype != np.uint8:
         image = (image * 255).astype(np.uint8)
-    if image.shape[:2] != (640, 640):
-        image = resize_image(image, size=(640, 640))
 
-    model = YOLO(best_model_path)
+    # Reuse the process-wide model instead of deserializing the weights on every call
+    from ml.predict import model_registry
+
+    model = model_registry.get(best_model_path)
     results = model.predict(source=image, imgsz=640, conf=0.5)
     annotated_image = results[0].plot()
     return results, annotated_image
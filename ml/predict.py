@@ -1,23 +1,425 @@
+import ast
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
 import numpy as np
-from ultralytics import YOLO
 
-from ml.utils import resize_image
+from ml.utils import (
+    letterbox_batch,
+    merge_tile_detections,
+    postprocess_detections,
+    scale_boxes_to_original,
+    tile_image,
+)
+
+logger = logging.getLogger(__name__)
 
 BEST_MODEL_PATH = "ml/models/yolov8n/weights/epoch10_yolov8n.pt"
+ONNX_MODEL_PATH = "ml/models/yolov8n/weights/epoch10_yolov8n.onnx"
+QUANTIZED_MODEL_PATH = "ml/models/yolov8n/weights/epoch10_yolov8n.int8.onnx"
+
+# Serving runtime: "torch" (ultralytics/PyTorch), "onnx" (ONNX Runtime on CPU)
+# or "onnx-int8" (ONNX Runtime with the INT8 model written by ml/quantize.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+DEFAULT_MODEL_PATHS = {"torch": BEST_MODEL_PATH, "onnx": ONNX_MODEL_PATH, "onnx-int8": QUANTIZED_MODEL_PATH}
+# Weights served by the API; defaults to the file matching the selected backend
+MODEL_PATH = os.getenv("MODEL_PATH", DEFAULT_MODEL_PATHS.get(INFERENCE_BACKEND, BEST_MODEL_PATH))
+# ONNX Runtime intra-op threads per session (0 follows set_inference_threads, else the CPU count)
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+
+# Number of distinct model versions kept in memory at the same time
+MAX_CACHED_MODELS = int(os.getenv("MAX_CACHED_MODELS", "2"))
+# Serve PyTorch weights from a memory-mapped float32 copy of the fused model, so every process
+# loading the same weights shares their pages through the page cache
+MMAP_WEIGHTS = os.getenv("MMAP_WEIGHTS", "false").lower() in ("1", "true", "yes")
+MMAP_WEIGHTS_DIR = os.getenv("MMAP_WEIGHTS_DIR", os.path.join(tempfile.gettempdir(), "medview-weights"))
+
+# Tiled inference for high-resolution scans: images larger than a tile are cut into overlapping
+# tiles that are detected at full resolution instead of being downscaled to the model input size
+PREDICT_TILED = os.getenv("PREDICT_TILED", "false").lower() in ("1", "true", "yes")
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "128"))
+# Most tiles sent through the model in one forward pass
+TILE_MAX_BATCH = int(os.getenv("TILE_MAX_BATCH", "16"))
+# Intersection-over-smaller threshold above which boxes from neighbouring tiles are merged
+TILE_MERGE_IOU = float(os.getenv("TILE_MERGE_IOU", "0.5"))
+# Also detect on the whole downscaled image, for lesions larger than a tile
+TILE_INCLUDE_FULL = os.getenv("TILE_INCLUDE_FULL", "true").lower() in ("1", "true", "yes")
+
+
+# Intra-op threads per predictor, set by the API from the CPU count; 0 until then
+_inference_threads = 0
+
+
+def set_inference_threads(threads: int) -> None:
+    """
+    Give every predictor `threads` intra-op threads: torch's thread pool for PyTorch weights, or the
+    ONNX Runtime sessions created from now on. torch is only imported when it serves the model.
+    """
+    global _inference_threads
+    _inference_threads = max(1, threads)
+    if not MODEL_PATH.endswith(".onnx"):
+        import torch
+
+        torch.set_num_threads(_inference_threads)
+
+
+def _file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the sha256 hex digest of a weights file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class InferenceBackend:
+    """
+    Common interface of the model runtimes used for serving.
+
+    `predict` mirrors `YOLO.predict`: it takes one BGR image or a list of them and returns one
+    ultralytics `Results` per image, so callers can plot and read boxes the same way for every backend.
+    """
+
+    name = "base"
+
+    def predict(self, source: Union[np.ndarray, List[np.ndarray]], imgsz: int = 640, conf: float = 0.5, **kwargs):
+        raise NotImplementedError
+
+
+def record_speed(result: Any, stage: str, milliseconds: float) -> None:
+    """Add `milliseconds` to `stage` in the per-image timings (`Results.speed`) of a prediction result."""
+    speed = getattr(result, "speed", None)
+    if isinstance(speed, dict):
+        speed[stage] = (speed.get(stage) or 0.0) + milliseconds
+
+
+class TorchBackend(InferenceBackend):
+    """
+    PyTorch inference through the ultralytics YOLO wrapper.
+
+    Images are letterboxed once into a model-ready tensor (see `ml.utils.letterbox_batch`) and
+    passed to ultralytics as a tensor, which skips its own resize and conversion; boxes are then
+    mapped back onto the original images.
+
+    With `mmap=True` the fused model's tensors are replaced by memory-mapped ones (see
+    `_map_weights`), so they live in the page cache instead of the process heap.
+    """
+
+    name = "torch"
+
+    def __init__(self, path: str, mmap: bool = MMAP_WEIGHTS):
+        import torch
+        from ultralytics import YOLO
+
+        self.path = path
+        self.model = YOLO(path)
+        stride = getattr(self.model.model, "stride", None)
+        self.stride = int(stride.max()) if stride is not None else 32
+        if isinstance(self.model.model, torch.nn.Module):
+            # Fuse now rather than on the first predict, so a model loaded before forking
+            # (see backend.src.serve) is not rewritten, and un-shared, by every worker
+            with torch.no_grad():
+                self.model.model.fuse(verbose=False)
+            if mmap:
+                self._map_weights()
+
+    def _map_weights(self) -> None:
+        """
+        Swap the fused model's tensors for ones mapped from a float32 state dict on disk. The file is
+        written once per weights version; checkpoints store half-precision weights, which cannot be
+        mapped directly because loading converts them to float32.
+        """
+        import torch
+
+        net = self.model.model
+        os.makedirs(MMAP_WEIGHTS_DIR, exist_ok=True)
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        mapped = os.path.join(MMAP_WEIGHTS_DIR, f"{name}.{_file_digest(self.path)[:12]}.fused.pt")
+        if not os.path.isfile(mapped):
+            tmp = f"{mapped}.{os.getpid()}.tmp"
+            torch.save({k: v.float() if v.is_floating_point() else v for k, v in net.state_dict().items()}, tmp)
+            os.replace(tmp, mapped)
+        state = torch.load(mapped, map_location="cpu", mmap=True, weights_only=True)
+        net.load_state_dict(state, assign=True)
+
+    def predict(self, source, imgsz=640, conf=0.5, **kwargs):
+        import torch
+
+        images = source if isinstance(source, list) else [source]
+        if not images:
+            return []
+        start = time.perf_counter()
+        batch, transforms = letterbox_batch(images, imgsz, stride=self.stride, auto=True)
+        letterbox_ms = (time.perf_counter() - start) * 1000 / len(images)
+        results = self.model.predict(source=torch.from_numpy(batch), imgsz=imgsz, conf=conf, verbose=False, **kwargs)
+        for result, image, (ratio, pad) in zip(results, images, transforms):
+            record_speed(result, "preprocess", letterbox_ms)
+            boxes = result.boxes.data.cpu().numpy().copy()
+            boxes[:, :4] = scale_boxes_to_original(boxes[:, :4], ratio, pad, image.shape[:2])
+            result.orig_img = image
+            result.orig_shape = image.shape[:2]
+            result.update(boxes=torch.from_numpy(boxes))
+        return results
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime inference on CPU with NumPy letterbox preprocessing and NMS postprocessing."""
+
+    name = "onnx"
+
+    def __init__(self, path: str, intra_op_threads: int = ORT_INTRA_OP_THREADS):
+        import onnxruntime as ort
+
+        self.path = path
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads <= 0:
+            intra_op_threads = _inference_threads or os.cpu_count() or 1
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports without a dynamic batch axis only accept one image per run
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        imgsz = ast.literal_eval(metadata["imgsz"]) if "imgsz" in metadata else [640, 640]
+        self.imgsz = int(imgsz[0])
+
+    def _preprocess(self, images: List[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[float, Tuple[int, int]]]]:
+        return letterbox_batch(images, self.imgsz)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        if self.dynamic_batch or len(batch) == 1:
+            return self.session.run(None, {self.input_name: batch})[0]
+        outputs = [self.session.run(None, {self.input_name: batch[i : i + 1]})[0] for i in range(len(batch))]
+        return np.concatenate(outputs)
+
+    def predict(self, source, imgsz=640, conf=0.5, iou=0.7, **kwargs):
+        import torch
+        from ultralytics.engine.results import Results
+
+        images = source if isinstance(source, list) else [source]
+        if not images:
+            return []
+        start = time.perf_counter()
+        batch, transforms = self._preprocess(images)
+        preprocessed = time.perf_counter()
+        outputs = self._run(batch)
+        inferred = time.perf_counter()
+        results = []
+        for image, output, (ratio, pad) in zip(images, outputs, transforms):
+            detections = postprocess_detections(output, conf=conf, iou=iou)
+            detections[:, :4] = scale_boxes_to_original(detections[:, :4], ratio, pad, image.shape[:2])
+            results.append(Results(image, path="", names=self.names, boxes=torch.from_numpy(detections)))
+        # Per-image timings in milliseconds, like ultralytics reports them
+        speed = {
+            "preprocess": (preprocessed - start) * 1000 / len(images),
+            "inference": (inferred - preprocessed) * 1000 / len(images),
+            "postprocess": (time.perf_counter() - inferred) * 1000 / len(images),
+        }
+        for result in results:
+            result.speed = dict(speed)
+        return results
+
+
+def load_backend(path: str, backend: Optional[str] = None) -> InferenceBackend:
+    """Load `path` with the given backend, inferring it from the file extension when not given."""
+    backend = (backend or ("onnx" if path.endswith(".onnx") else "torch")).lower()
+    # Quantized models are plain ONNX graphs with QDQ / integer ops, served by the same session code
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxBackend(path)
+    if backend == "torch":
+        return TorchBackend(path)
+    raise ValueError(f"Unknown inference backend '{backend}', expected 'torch', 'onnx' or 'onnx-int8'")
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded YOLO models.
+
+    Models are keyed by (absolute weights path, file hash), so replacing the weights on disk
+    loads the new version on the next lookup while the least recently used versions are evicted
+    once more than `max_models` are held.
+    """
+
+    def __init__(self, max_models: int = MAX_CACHED_MODELS, loader: Callable[[str], Any] = load_backend):
+        self.max_models = max(1, max_models)
+        self.loader = loader
+        self._models: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        # (path) -> (mtime_ns, size, digest), so the weights are only hashed again when they change
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        # Instances loaded ahead of time by `preload`, handed out by `new_instance`
+        self._spares: Dict[Tuple[str, str], List[Any]] = {}
+        self._lock = threading.RLock()
+
+    def version(self, path: str = MODEL_PATH) -> str:
+        """Return the short content hash identifying the weights currently at `path`."""
+        return self._key(path)[1][:12]
+
+    def _key(self, path: str) -> Tuple[str, str]:
+        abs_path = os.path.abspath(path)
+        if not os.path.isfile(abs_path):
+            # Let the loader resolve names it knows how to fetch (e.g. "yolov8n.pt")
+            return abs_path, path
+        stat = os.stat(abs_path)
+        with self._lock:
+            cached = self._digests.get(abs_path)
+            if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                cached = (stat.st_mtime_ns, stat.st_size, _file_digest(abs_path))
+                self._digests[abs_path] = cached
+        return abs_path, cached[2]
+
+    def get(self, path: str = MODEL_PATH) -> Any:
+        """Return a ready model for `path`, loading it on first use."""
+        key = self._key(path)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            logger.info("Loading model weights from %s (version %s)", path, key[1][:12])
+            model = self.loader(path)
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                evicted, _ = self._models.popitem(last=False)
+                logger.info("Evicted model %s (version %s) from registry", evicted[0], evicted[1][:12])
+            return model
+
+    def new_instance(self, path: str = MODEL_PATH) -> Any:
+        """Load a private, uncached model instance, e.g. one per inference worker thread."""
+        key = self._key(path)
+        with self._lock:
+            spares = self._spares.get(key)
+            if spares:
+                return spares.pop()
+        return self.loader(path)
+
+    def preload(self, path: str = MODEL_PATH, instances: int = 0) -> None:
+        """
+        Hash the weights at `path` and load `instances` private models for later `new_instance` calls,
+        e.g. in a pre-fork master so that forked workers start with the weights already in memory.
+        The shared model is not loaded: with an inference executor, requests only use private ones.
+        """
+        key = self._key(path)
+        spares = [self.loader(path) for _ in range(instances)]
+        with self._lock:
+            self._spares.setdefault(key, []).extend(spares)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._digests.clear()
+            self._spares.clear()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+model_registry = ModelRegistry()
+
+
+def _prepare_image(image: np.ndarray) -> np.ndarray:
+    # Resizing happens once, in the backend's letterbox, so the aspect ratio is preserved
+    if image.dtype != np.uint8:
+        image = (image * 255).astype(np.uint8)
+    return image
+
+
+def predict_tiled(
+    images: List[np.ndarray],
+    model: Any,
+    tile_size: int = TILE_SIZE,
+    overlap: int = TILE_OVERLAP,
+    max_batch: int = TILE_MAX_BATCH,
+    include_full: bool = TILE_INCLUDE_FULL,
+    conf: float = 0.5,
+    merge_iou: float = TILE_MERGE_IOU,
+) -> List[Any]:
+    """
+    Detect on overlapping `tile_size` tiles of each image and return one result per image with the
+    boxes merged across tiles in original-image coordinates. Tiles of all images are pooled and
+    sent through the model `max_batch` at a time; images no larger than a tile are predicted whole.
+    """
+    import torch
+    from ultralytics.engine.results import Results
+
+    sources: List[np.ndarray] = []
+    # (image index, offset of the source within that image)
+    owners: List[Tuple[int, Tuple[int, int]]] = []
+    for index, image in enumerate(images):
+        height, width = image.shape[:2]
+        if height > tile_size or width > tile_size:
+            tiles, offsets = tile_image(image, tile_size, overlap)
+            if include_full:
+                tiles.append(image)
+                offsets.append((0, 0))
+        else:
+            tiles, offsets = [image], [(0, 0)]
+        sources.extend(tiles)
+        owners.extend((index, offset) for offset in offsets)
+
+    tile_results = []
+    for start in range(0, len(sources), max(1, max_batch)):
+        chunk = sources[start : start + max_batch]
+        tile_results.extend(model.predict(source=chunk, imgsz=tile_size, conf=conf))
+
+    detections: List[List[np.ndarray]] = [[] for _ in images]
+    offsets_by_image: List[List[Tuple[int, int]]] = [[] for _ in images]
+    speeds: List[Dict[str, float]] = [{} for _ in images]
+    for (index, offset), result in zip(owners, tile_results):
+        detections[index].append(result.boxes.data.cpu().numpy())
+        offsets_by_image[index].append(offset)
+        for stage, milliseconds in (getattr(result, "speed", None) or {}).items():
+            speeds[index][stage] = speeds[index].get(stage, 0.0) + (milliseconds or 0.0)
+
+    names = tile_results[0].names if tile_results else {}
+    results = []
+    for image, boxes, offsets, speed in zip(images, detections, offsets_by_image, speeds):
+        start = time.perf_counter()
+        merged = merge_tile_detections(boxes, offsets, iou=merge_iou)
+        result = Results(image, path="", names=names, boxes=torch.from_numpy(merged))
+        result.speed = speed
+        record_speed(result, "postprocess", (time.perf_counter() - start) * 1000)
+        results.append(result)
+    return results
+
+
+def get_predictions_from_batch(images: List[np.ndarray], model: Optional[Any] = None) -> List[Any]:
+    """
+    Run a single batched YOLO forward pass over `images` and return one result object per image, in order.
+    """
+    if not images:
+        return []
+    prepared = [_prepare_image(image) for image in images]
+    best_model = model if model is not None else model_registry.get(MODEL_PATH)
+    if PREDICT_TILED:
+        return predict_tiled(prepared, best_model)
+    return best_model.predict(source=prepared, imgsz=640, conf=0.5)
 
 
-def get_prediction_from_array(image: np.ndarray):
+def get_prediction_from_array(image: np.ndarray, model: Optional[Any] = None):
     """
     Run YOLO prediction on an input image array and return the annotated image and the YOLO result object.
+    `model` defaults to the registry's copy of the best model.
     """
     if image is not None:
-        if image.dtype != np.uint8:
-            image = (image * 255).astype(np.uint8)
-        if image.shape[:2] != (640, 640):
-            image = resize_image(image, size=(640, 640))
-        best_model = YOLO(BEST_MODEL_PATH)
-        results = best_model.predict(source=image, imgsz=640, conf=0.5)
+        image = _prepare_image(image)
+        best_model = model if model is not None else model_registry.get(MODEL_PATH)
+        if PREDICT_TILED:
+            results = predict_tiled([image], best_model)
+        else:
+            results = best_model.predict(source=image, imgsz=640, conf=0.5)
+        start = time.perf_counter()
         annotated_image = results[0].plot()
+        record_speed(results[0], "plot", (time.perf_counter() - start) * 1000)
         return annotated_image, results[0]
     else:
         return None, None
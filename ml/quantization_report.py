@@ -0,0 +1,135 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from ml.evaluate import evaluate_weights
+from ml.predict import ONNX_MODEL_PATH, QUANTIZED_MODEL_PATH
+from ml.quantize import sample_calibration_images
+
+DEFAULT_DATA_YAML = os.path.join(os.path.dirname(__file__), "configs", "data_config", "data.yaml")
+DEFAULT_BENCHMARK_DIR = os.path.join("data", "BrainTumor", "BrainTumorYolov8", "valid", "images")
+
+
+def _benchmark_images(image_dir: Optional[str], num_images: int) -> List[np.ndarray]:
+    """Validation images when available, otherwise blurred noise of the serving resolution."""
+    if image_dir and os.path.isdir(image_dir):
+        paths = sample_calibration_images(image_dir, num_images)
+        images = [cv2.imread(path) for path in paths]
+        return [image for image in images if image is not None]
+    rng = np.random.default_rng(0)
+    return [
+        cv2.GaussianBlur(rng.integers(0, 255, (640, 640, 3), dtype=np.uint8), (31, 31), 0) for _ in range(num_images)
+    ]
+
+
+def _memory_mb() -> Dict[str, float]:
+    """Current and peak resident memory of this process in MB."""
+    status = {}
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    status[key] = int(value.split()[0]) / 1024
+    else:
+        # ru_maxrss is in bytes on macOS and survives exec, so it is only a rough fallback
+        status["VmHWM"] = status["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**20
+    return status
+
+
+def _benchmark_worker(model_path: str, image_dir: Optional[str], num_images: int, runs: int, warmup: int) -> Dict:
+    """Measure single-image latency and peak RSS of one model, in its own process."""
+    from ml.predict import load_backend
+
+    images = _benchmark_images(image_dir, num_images)
+    rss_before = _memory_mb()["VmRSS"]
+    backend = load_backend(model_path)
+    for i in range(warmup):
+        backend.predict(images[i % len(images)])
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        backend.predict(images[i % len(images)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    memory = _memory_mb()
+    return {
+        "Latency p50 (ms)": float(np.percentile(latencies, 50)),
+        "Latency p95 (ms)": float(np.percentile(latencies, 95)),
+        "Peak RSS (MB)": memory["VmHWM"],
+        "Model RSS (MB)": memory["VmRSS"] - rss_before,
+    }
+
+
+def benchmark_model(
+    model_path: str, image_dir: Optional[str] = None, num_images: int = 20, runs: int = 50, warmup: int = 5
+) -> Dict:
+    """Run `_benchmark_worker` in a fresh process so the RSS of one model does not leak into the next."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(_benchmark_worker, (model_path, image_dir, num_images, runs, warmup))
+
+
+def build_report(
+    models: Dict[str, str],
+    data_yaml: str = DEFAULT_DATA_YAML,
+    split: str = "val",
+    image_dir: Optional[str] = DEFAULT_BENCHMARK_DIR,
+    runs: int = 50,
+    skip_map: bool = False,
+) -> pd.DataFrame:
+    """
+    Compare models on mAP@0.5 (through the `ml/evaluate.py` validation flow), single-image CPU
+    latency, RSS and file size. `models` maps a label to a weights path.
+    """
+    rows = []
+    for label, path in models.items():
+        row = {"Model": label, "Path": path, "Size (MB)": os.path.getsize(path) / 2**20}
+        if not skip_map:
+            metrics = evaluate_weights(path, data_yaml, split, batch=1, imgsz=640, verbose=False)
+            row["mAP@0.5"] = metrics["mAP@0.5"]
+        row.update(benchmark_model(path, image_dir=image_dir, runs=runs))
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    if "mAP@0.5" in df and len(df) > 1:
+        df["mAP@0.5 delta"] = df["mAP@0.5"] - df["mAP@0.5"].iloc[0]
+    if len(df) > 1:
+        df["p95 speedup"] = df["Latency p95 (ms)"].iloc[0] / df["Latency p95 (ms)"]
+    return df
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(
+        description="Compare the INT8 quantized model against FP32 on accuracy, latency and RSS"
+    )
+    p.add_argument("--fp32", type=str, default=ONNX_MODEL_PATH, help="Baseline FP32 model (.onnx or .pt)")
+    p.add_argument("--int8", type=str, default=QUANTIZED_MODEL_PATH, help="Quantized model from ml/quantize.py")
+    p.add_argument("--data", type=str, default=DEFAULT_DATA_YAML, help="Path to data.yaml used for mAP")
+    p.add_argument("--split", type=str, default="val", help="Dataset split to evaluate on")
+    p.add_argument("--images", type=str, default=DEFAULT_BENCHMARK_DIR, help="Images used for the latency runs")
+    p.add_argument("--runs", type=int, default=50, help="Timed single-image predictions per model")
+    p.add_argument("--skip-map", action="store_true", help="Only measure latency and memory")
+    p.add_argument("--output", type=str, default=None, help="Optional CSV file to write the report to")
+    args = p.parse_args()
+
+    df = build_report(
+        {"fp32": args.fp32, "int8": args.int8},
+        data_yaml=args.data,
+        split=args.split,
+        image_dir=args.images,
+        runs=args.runs,
+        skip_map=args.skip_map,
+    )
+    print(df.to_string(index=False))
+    if args.output:
+        df.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import glob
+import os
+import random
+from typing import Iterator, List, Optional
+
+import cv2
+
+from ml.predict import ONNX_MODEL_PATH, QUANTIZED_MODEL_PATH
+from ml.utils import letterbox_batch
+
+# Images of the training split used to calibrate activation ranges for static quantization
+DEFAULT_CALIBRATION_DIR = os.path.join("data", "BrainTumor", "BrainTumorYolov8", "train", "images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def sample_calibration_images(image_dir: str, num_images: int = 200, seed: int = 0) -> List[str]:
+    """Return a reproducible random slice of the images under `image_dir`."""
+    paths = sorted(
+        path
+        for path in glob.glob(os.path.join(image_dir, "**", "*"), recursive=True)
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise FileNotFoundError(f"No calibration images found under {image_dir}")
+    random.Random(seed).shuffle(paths)
+    return paths[:num_images]
+
+
+def _input_shape(model_path: str):
+    import onnx
+
+    model = onnx.load(model_path, load_external_data=False)
+    model_input = model.graph.input[0]
+    dims = model_input.type.tensor_type.shape.dim
+    return model_input.name, int(dims[2].dim_value or 640)
+
+
+def _head_nodes_to_exclude(model_path: str) -> List[str]:
+    """
+    Names of the non-convolution nodes of the Detect head.
+
+    The head concatenates box coordinates (0..imgsz) and class probabilities (0..1) into one
+    tensor, which a single INT8 scale cannot represent, so the decode stays in FP32.
+    """
+    import onnx
+
+    nodes = onnx.load(model_path, load_external_data=False).graph.node
+    prefixes = [node.name.split("/")[1] for node in nodes if node.name.startswith("/model.")]
+    if not prefixes:
+        return []
+    head = max(prefixes, key=lambda prefix: int(prefix.split(".")[1]))
+    return [node.name for node in nodes if node.name.startswith(f"/{head}/") and node.op_type != "Conv"]
+
+
+class ImageCalibrationReader:
+    """Feeds letterboxed calibration images to the ONNX Runtime static quantizer one at a time."""
+
+    def __init__(self, image_paths: List[str], input_name: str, imgsz: int = 640):
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._inputs = self._iter_inputs(image_paths)
+
+    def _iter_inputs(self, image_paths: List[str]) -> Iterator[dict]:
+        for path in image_paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            # letterbox_batch reuses its buffer, so hand the quantizer a copy
+            yield {self.input_name: letterbox_batch([image], self.imgsz)[0].copy()}
+
+    def get_next(self) -> Optional[dict]:
+        return next(self._inputs, None)
+
+
+def quantize_model(
+    model_path: str = ONNX_MODEL_PATH,
+    output: str = QUANTIZED_MODEL_PATH,
+    mode: str = "static",
+    calibration_dir: str = DEFAULT_CALIBRATION_DIR,
+    num_calibration_images: int = 200,
+    per_channel: bool = True,
+) -> str:
+    """
+    Quantize an exported FP32 ONNX model to INT8 and return the output path.
+
+    `static` calibrates activation ranges on a slice of the training split and writes a QDQ model,
+    which ONNX Runtime fuses into integer convolutions on CPU. `dynamic` only quantizes the weights
+    and computes activation scales at runtime, so it needs no data but is usually slower for CNNs.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    exclude = _head_nodes_to_exclude(model_path)
+    if mode == "dynamic":
+        quantize_dynamic(
+            model_path, output, weight_type=QuantType.QInt8, per_channel=per_channel, nodes_to_exclude=exclude
+        )
+    elif mode == "static":
+        input_name, imgsz = _input_shape(model_path)
+        images = sample_calibration_images(calibration_dir, num_calibration_images)
+        # Shape inference and constant folding first, as recommended by the ONNX Runtime quantizer
+        prepared = f"{output}.prep.onnx"
+        quant_pre_process(model_path, prepared, skip_symbolic_shape=True)
+        try:
+            quantize_static(
+                prepared,
+                output,
+                ImageCalibrationReader(images, input_name, imgsz),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=per_channel,
+                calibrate_method=CalibrationMethod.MinMax,
+                nodes_to_exclude=exclude,
+            )
+        finally:
+            if os.path.exists(prepared):
+                os.remove(prepared)
+    else:
+        raise ValueError(f"Unknown quantization mode '{mode}', expected 'static' or 'dynamic'")
+    print(f"Quantized {model_path} ({mode}) to {output}")
+    return output
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Quantize the exported ONNX model to INT8 for CPU serving")
+    p.add_argument("--model", type=str, default=ONNX_MODEL_PATH, help="FP32 ONNX model to quantize")
+    p.add_argument("--output", type=str, default=QUANTIZED_MODEL_PATH, help="Where to write the INT8 model")
+    p.add_argument("--mode", choices=["static", "dynamic"], default="static", help="Quantization mode")
+    p.add_argument(
+        "--calibration-dir",
+        type=str,
+        default=DEFAULT_CALIBRATION_DIR,
+        help="Training images used to calibrate static quantization",
+    )
+    p.add_argument("--num-calibration-images", type=int, default=200, help="Size of the calibration slice")
+    p.add_argument("--per-tensor", action="store_true", help="Use per-tensor instead of per-channel weight scales")
+    args = p.parse_args()
+
+    quantize_model(
+        model_path=args.model,
+        output=args.output,
+        mode=args.mode,
+        calibration_dir=args.calibration_dir,
+        num_calibration_images=args.num_calibration_images,
+        per_channel=not args.per_tensor,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+import threading
+
 import cv2
+import numpy as np
 
 
 def resize_image(image, size=(640, 640)):
@@ -7,3 +10,220 @@ def resize_image(image, size=(640, 640)):
 
 def normalize_image(image):
     return image / 255.0
+
+
+def letterbox(image, new_shape=640, color=(114, 114, 114)):
+    """
+    Resize `image` keeping its aspect ratio and pad it to a `new_shape` square, like ultralytics does.
+    Returns the padded image, the scale ratio and the (left, top) padding in pixels.
+    """
+    height, width = image.shape[:2]
+    ratio = min(new_shape / height, new_shape / width)
+    new_unpad = (int(round(width * ratio)), int(round(height * ratio)))
+    dw, dh = (new_shape - new_unpad[0]) / 2, (new_shape - new_unpad[1]) / 2
+    if (width, height) != new_unpad:
+        image = cv2.resize(image, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+
+def letterbox_shape(shapes, new_shape=640, stride=32, auto=False):
+    """
+    Model input (height, width) for images of the given (height, width) `shapes`. With `auto` the
+    padding is trimmed to the next multiple of `stride` when all images share a shape, like
+    ultralytics' rectangular inference; otherwise every image is padded to a `new_shape` square.
+    """
+    if not auto or len(set(shapes)) != 1:
+        return new_shape, new_shape
+    height, width = shapes[0]
+    ratio = min(new_shape / height, new_shape / width)
+    unpad_h, unpad_w = int(round(height * ratio)), int(round(width * ratio))
+    return unpad_h + (new_shape - unpad_h) % stride, unpad_w + (new_shape - unpad_w) % stride
+
+
+def letterbox_into(image, out, color=114):
+    """
+    Letterbox `image` into the preallocated HxWx3 uint8 `out` with a single resize written straight
+    into the centre of the buffer, then fill only the border. Returns the scale ratio and the
+    (left, top) padding, matching `letterbox`.
+    """
+    height, width = image.shape[:2]
+    out_h, out_w = out.shape[:2]
+    ratio = min(out_h / height, out_w / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    dw, dh = (out_w - new_w) / 2, (out_h - new_h) / 2
+    top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+    inner = out[top : top + new_h, left : left + new_w]
+    if (width, height) != (new_w, new_h):
+        cv2.resize(image, (new_w, new_h), dst=inner, interpolation=cv2.INTER_LINEAR)
+    else:
+        inner[...] = image
+    out[:top] = color
+    out[top + new_h :] = color
+    out[top : top + new_h, :left] = color
+    out[top : top + new_h, left + new_w :] = color
+    return ratio, (left, top)
+
+
+class PreprocessBuffers(threading.local):
+    """
+    Per-thread scratch buffers for `letterbox_batch`, reused across calls so steady-state
+    preprocessing allocates nothing. Each inference worker thread gets its own set.
+    """
+
+    def __init__(self):
+        self.canvases = {}
+        self.batches = {}
+
+    def canvas(self, height, width):
+        key = (height, width)
+        if key not in self.canvases:
+            self.canvases[key] = np.empty((height, width, 3), dtype=np.uint8)
+        return self.canvases[key]
+
+    def batch(self, size, height, width):
+        key = (size, height, width)
+        if key not in self.batches:
+            # Keep the last few batch sizes only; the micro-batcher produces many different ones
+            if len(self.batches) >= 8:
+                self.batches.pop(next(iter(self.batches)))
+            self.batches[key] = np.empty((size, 3, height, width), dtype=np.float32)
+        return self.batches[key]
+
+
+_buffers = PreprocessBuffers()
+
+
+def letterbox_batch(images, new_shape=640, stride=32, auto=False, buffers=_buffers):
+    """
+    Letterbox BGR uint8 `images` into one RGB CHW float32 batch in [0, 1], the model input layout,
+    resizing each image exactly once. Returns the batch and the (ratio, pad) transform of every image.
+
+    The batch is a per-thread buffer that the next call on the same thread overwrites, so callers
+    must finish with it (or copy it) before preprocessing again.
+    """
+    height, width = letterbox_shape([image.shape[:2] for image in images], new_shape, stride, auto)
+    batch = buffers.batch(len(images), height, width)
+    canvas = buffers.canvas(height, width)
+    transforms = []
+    for i, image in enumerate(images):
+        transforms.append(letterbox_into(image, canvas))
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], one pass per channel
+        for channel in range(3):
+            np.multiply(canvas[:, :, 2 - channel], 1 / 255.0, out=batch[i, channel], casting="unsafe")
+    return batch, transforms
+
+
+def scale_boxes_to_original(boxes, ratio, pad, original_shape):
+    """Map xyxy boxes from letterboxed model-input coordinates back to the original image and clip them."""
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, original_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, original_shape[0])
+    return boxes
+
+
+def xywh_to_xyxy(boxes):
+    xyxy = np.empty_like(boxes)
+    half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+    xyxy[:, 0] = boxes[:, 0] - half_w
+    xyxy[:, 1] = boxes[:, 1] - half_h
+    xyxy[:, 2] = boxes[:, 0] + half_w
+    xyxy[:, 3] = boxes[:, 1] + half_h
+    return xyxy
+
+
+def nms(boxes, scores, iou_threshold=0.7, max_det=None, metric="iou"):
+    """
+    Greedy non-maximum suppression over xyxy boxes. Returns the kept indices, highest score first,
+    stopping early once `max_det` boxes are kept. With `metric="ios"` overlap is measured as the
+    intersection over the smaller box, which also suppresses boxes cut off inside a larger one.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0 and (max_det is None or len(keep) < max_det):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        inter_h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = inter_w * inter_h
+        if metric == "ios":
+            overlap = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        else:
+            overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def postprocess_detections(prediction, conf=0.5, iou=0.7, max_det=300, max_wh=7680):
+    """
+    Turn one raw YOLOv8 output of shape (4 + num_classes, num_anchors) into an (N, 6) array of
+    [x1, y1, x2, y2, confidence, class] rows, using class-aware NMS like ultralytics.
+    """
+    prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    confidences = class_scores[np.arange(len(class_scores)), class_ids]
+    mask = confidences > conf
+    if not mask.any():
+        return np.zeros((0, 6), dtype=np.float32)
+    boxes = xywh_to_xyxy(prediction[mask, :4])
+    confidences, class_ids = confidences[mask], class_ids[mask]
+    # Offset boxes per class so a single NMS pass never suppresses across classes
+    keep = nms(boxes + class_ids[:, None] * max_wh, confidences, iou, max_det=max_det)
+    return np.concatenate(
+        [boxes[keep], confidences[keep, None], class_ids[keep, None].astype(np.float32)], axis=1
+    ).astype(np.float32)
+
+
+def tile_origins(length, tile_size=640, overlap=128):
+    """
+    Start offsets of tiles of `tile_size` covering `length` pixels, neighbours overlapping by at
+    least `overlap`. The last tile is aligned to the end, so every tile is full size when the
+    image is at least one tile long.
+    """
+    if length <= tile_size:
+        return [0]
+    step = max(1, tile_size - overlap)
+    origins = list(range(0, length - tile_size, step))
+    origins.append(length - tile_size)
+    return origins
+
+
+def tile_image(image, tile_size=640, overlap=128):
+    """
+    Cut `image` into overlapping tiles. Returns the tiles (views into `image`, no copies) and the
+    (x, y) offset of each tile's top-left corner in the image.
+    """
+    height, width = image.shape[:2]
+    tiles, offsets = [], []
+    for y in tile_origins(height, tile_size, overlap):
+        for x in tile_origins(width, tile_size, overlap):
+            tiles.append(image[y : y + tile_size, x : x + tile_size])
+            offsets.append((x, y))
+    return tiles, offsets
+
+
+def merge_tile_detections(detections, offsets, iou=0.5, max_det=300, max_wh=100000):
+    """
+    Merge per-tile (N, 6) [x1, y1, x2, y2, confidence, class] detections into one array in image
+    coordinates. Boxes are shifted by their tile offset and de-duplicated with class-aware NMS on
+    intersection over the smaller box, so a lesion split by a tile border keeps only its best box.
+    """
+    shifted = []
+    for boxes, (x, y) in zip(detections, offsets):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6).copy()
+        boxes[:, [0, 2]] += x
+        boxes[:, [1, 3]] += y
+        shifted.append(boxes)
+    merged = np.concatenate(shifted) if shifted else np.zeros((0, 6), dtype=np.float32)
+    if len(merged) == 0:
+        return merged
+    keep = nms(merged[:, :4] + merged[:, 5:6] * max_wh, merged[:, 4], iou, max_det=max_det, metric="ios")
+    return merged[keep]
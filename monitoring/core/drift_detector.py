@@ -9,6 +9,8 @@ from typing import Dict, Tuple
 import numpy as np
 import pandas as pd
 
+from .feature_stats import RunningStats
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,14 +32,29 @@ class DriftDetector:
             if reference_data.empty or current_data.empty:
                 return {"error": "Insufficient data for analysis"}
 
+            features = [f for f in self.key_features if f in reference_data.columns and f in current_data.columns]
+            return self.analyze_feature_stats(
+                {f: RunningStats.from_values(reference_data[f]) for f in features},
+                {f: RunningStats.from_values(current_data[f]) for f in features},
+            )
+
+        except Exception as e:
+            logger.error(f"Error analyzing feature drift: {e}")
+            return {"error": str(e)}
+
+    def analyze_feature_stats(
+        self, reference_stats: Dict[str, RunningStats], current_stats: Dict[str, RunningStats]
+    ) -> Dict:
+        """Analyze drift indicators from per-feature summary statistics, e.g. merged hourly buckets."""
+        try:
             analysis = {}
 
             for feature in self.key_features:
-                if feature in reference_data.columns and feature in current_data.columns:
-                    ref_mean = float(reference_data[feature].mean())
-                    ref_std = float(reference_data[feature].std())
-                    curr_mean = float(current_data[feature].mean())
-                    curr_std = float(current_data[feature].std())
+                if feature in reference_stats and feature in current_stats:
+                    ref_mean = float(reference_stats[feature].mean)
+                    ref_std = float(reference_stats[feature].std)
+                    curr_mean = float(current_stats[feature].mean)
+                    curr_std = float(current_stats[feature].std)
 
                     # Calculate drift indicators
                     mean_diff = abs(curr_mean - ref_mean)
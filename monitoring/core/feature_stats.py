@@ -0,0 +1,304 @@
+"""
+Streaming feature statistics for drift monitoring.
+
+Every logged prediction updates the count, mean, M2 (sum of squared deviations from the mean), min
+and max of each monitored feature, and the count of its predicted class, in the hourly bucket of its
+timestamp. The buckets are upserted in the transaction that writes the rows to predictions_log. The
+statistics of any window are then the merge of its buckets (Chan et al.'s parallel variance), so drift
+analysis and the dashboard read O(buckets) rows instead of every logged prediction.
+
+Rows logged before the tables existed, or by anything other than the log writer, are added by
+rebuilding the closed hours from predictions_log, e.g. daily from cron:
+    python -m monitoring.core.feature_stats --days 7
+"""
+
+import argparse
+import logging
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, Column, DateTime, Float, MetaData, String, Table, column, create_engine, func, text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Numeric predictions_log columns with persisted statistics
+STAT_FEATURES = [
+    "prediction_confidence",
+    "num_detections",
+    "processing_time_ms",
+    "image_width",
+    "image_height",
+    "image_channels",
+    "image_size_bytes",
+    "brightness_mean",
+    "brightness_std",
+    "contrast_mean",
+    "contrast_std",
+    "entropy",
+    "skewness",
+    "kurtosis",
+    "mean_intensity",
+    "std_intensity",
+    "tumor_area_ratio",
+    "tumor_detection_confidence",
+    "num_tumors_detected",
+    "largest_tumor_area",
+    "tumor_density",
+    "tumor_location_x",
+    "tumor_location_y",
+    "tumor_shape_regularity",
+]
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = ("postgresql", "sqlite")
+
+metadata = MetaData()
+feature_stats_hourly = Table(
+    "feature_stats_hourly",
+    metadata,
+    Column("bucket", DateTime, primary_key=True),
+    Column("feature", String(64), primary_key=True),
+    Column("n", BigInteger, nullable=False),
+    Column("mean", Float, nullable=False),
+    Column("m2", Float, nullable=False),
+    Column("min_value", Float, nullable=False),
+    Column("max_value", Float, nullable=False),
+)
+class_counts_hourly = Table(
+    "class_counts_hourly",
+    metadata,
+    Column("bucket", DateTime, primary_key=True),
+    Column("prediction_class", String(50), primary_key=True),
+    Column("n", BigInteger, nullable=False),
+)
+
+
+@dataclass
+class RunningStats:
+    """Count, mean, sum of squared deviations, min and max of a stream of values."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+
+    def update(self, value: float) -> None:
+        """Add one value (Welford's algorithm)."""
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Statistics of both streams together."""
+        if other.count == 0:
+            return RunningStats(self.count, self.mean, self.m2, self.min, self.max)
+        if self.count == 0:
+            return RunningStats(other.count, other.mean, other.m2, other.min, other.max)
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return RunningStats(
+            count=count,
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+            min=min(self.min, other.min),
+            max=max(self.max, other.max),
+        )
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any]) -> "RunningStats":
+        """Statistics of a batch of values in one vectorized pass; missing values are skipped."""
+        array = np.asarray(values, dtype=np.float64)
+        array = array[~np.isnan(array)]
+        if array.size == 0:
+            return cls()
+        mean = float(array.mean())
+        return cls(int(array.size), mean, float(np.sum((array - mean) ** 2)), float(array.min()), float(array.max()))
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, like pandas' Series.var()."""
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+def merge_all(stats: Iterable[RunningStats]) -> RunningStats:
+    merged = RunningStats()
+    for item in stats:
+        merged = merged.merge(item)
+    return merged
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def accumulate(
+    rows: Sequence[Dict[str, Any]], features: Sequence[str] = STAT_FEATURES
+) -> Tuple[Dict[Tuple[datetime, str], RunningStats], Dict[Tuple[datetime, str], int]]:
+    """Per-bucket feature statistics and class counts of a batch of predictions_log rows."""
+    by_bucket: Dict[datetime, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        by_bucket[hour_bucket(row["timestamp"])].append(row)
+    stats = {}
+    counts: Dict[Tuple[datetime, str], int] = defaultdict(int)
+    for bucket, bucket_rows in by_bucket.items():
+        for feature in features:
+            values = [row.get(feature) for row in bucket_rows]
+            feature_stats = RunningStats.from_values([math.nan if v is None else v for v in values])
+            if feature_stats.count:
+                stats[(bucket, feature)] = feature_stats
+        for row in bucket_rows:
+            counts[(bucket, str(row.get("prediction_class", "unknown")))] += 1
+    return stats, dict(counts)
+
+
+def supports_upsert(engine: Engine) -> bool:
+    return engine.dialect.name in UPSERT_DIALECTS
+
+
+def create_tables(engine: Engine) -> None:
+    metadata.create_all(engine, checkfirst=True)
+
+
+def upsert_stats(
+    conn: Connection,
+    stats: Dict[Tuple[datetime, str], RunningStats],
+    counts: Dict[Tuple[datetime, str], int],
+) -> None:
+    """Merge per-bucket statistics into the persisted ones, in the database, so concurrent writers add up."""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+
+        least, greatest = func.least, func.greatest
+    elif conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+
+        # SQLite's multi-argument min() and max() are scalar functions
+        least, greatest = func.min, func.max
+    else:
+        raise NotImplementedError(
+            f"Feature statistics need INSERT ... ON CONFLICT, not available on {conn.dialect.name}"
+        )
+
+    if stats:
+        stmt = insert(feature_stats_hourly)
+        old, new = feature_stats_hourly.c, stmt.excluded
+        n = old.n + new.n
+        delta = new.mean - old.mean
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket", "feature"],
+            set_={
+                "n": n,
+                "mean": old.mean + delta * new.n / n,
+                "m2": old.m2 + new.m2 + delta * delta * old.n * new.n / n,
+                "min_value": least(old.min_value, new.min_value),
+                "max_value": greatest(old.max_value, new.max_value),
+            },
+        )
+        conn.execute(
+            stmt,
+            [
+                {
+                    "bucket": bucket,
+                    "feature": feature,
+                    "n": s.count,
+                    "mean": s.mean,
+                    "m2": s.m2,
+                    "min_value": s.min,
+                    "max_value": s.max,
+                }
+                for (bucket, feature), s in stats.items()
+            ],
+        )
+    if counts:
+        stmt = insert(class_counts_hourly)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket", "prediction_class"], set_={"n": class_counts_hourly.c.n + stmt.excluded.n}
+        )
+        conn.execute(stmt, [{"bucket": bucket, "prediction_class": cls, "n": n} for (bucket, cls), n in counts.items()])
+
+
+def load_feature_stats(
+    conn: Connection, since: datetime, features: Optional[Sequence[str]] = None
+) -> Dict[str, RunningStats]:
+    """Statistics of every feature (or of `features`) over the buckets from `since` on, merged per feature."""
+    table = feature_stats_hourly
+    query = table.select().where(table.c.bucket >= hour_bucket(since))
+    if features is not None:
+        query = query.where(table.c.feature.in_(features))
+    merged: Dict[str, RunningStats] = {}
+    for row in conn.execute(query):
+        bucket_stats = RunningStats(row.n, row.mean, row.m2, row.min_value, row.max_value)
+        merged[row.feature] = merged.get(row.feature, RunningStats()).merge(bucket_stats)
+    return merged
+
+
+def load_class_counts(conn: Connection, since: datetime) -> Dict[str, int]:
+    table = class_counts_hourly
+    query = (
+        table.select()
+        .with_only_columns(table.c.prediction_class, func.sum(table.c.n))
+        .where(table.c.bucket >= hour_bucket(since))
+        .group_by(table.c.prediction_class)
+    )
+    return {cls: int(n) for cls, n in conn.execute(query)}
+
+
+def rebuild_stats(engine: Engine, start: datetime, end: datetime, chunk_size: int = 10000) -> int:
+    """Recompute the buckets in [start, end) from predictions_log; returns the number of rows read."""
+    start, end = hour_bucket(start), hour_bucket(end)
+    query = text(
+        f"SELECT timestamp, prediction_class, {', '.join(STAT_FEATURES)} FROM predictions_log "
+        "WHERE timestamp >= :start AND timestamp < :end"
+    ).columns(column("timestamp", DateTime), column("prediction_class", String), *map(column, STAT_FEATURES))
+    stats: Dict[Tuple[datetime, str], RunningStats] = {}
+    counts: Dict[Tuple[datetime, str], int] = defaultdict(int)
+    rows = 0
+    with engine.begin() as conn:
+        for table in (feature_stats_hourly, class_counts_hourly):
+            conn.execute(table.delete().where(table.c.bucket >= start, table.c.bucket < end))
+        result = conn.execution_options(stream_results=True).execute(query, {"start": start, "end": end})
+        while chunk := result.mappings().fetchmany(chunk_size):
+            rows += len(chunk)
+            chunk_stats, chunk_counts = accumulate(chunk)
+            for key, value in chunk_stats.items():
+                stats[key] = stats.get(key, RunningStats()).merge(value)
+            for key, n in chunk_counts.items():
+                counts[key] += n
+        upsert_stats(conn, stats, dict(counts))
+    return rows
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Rebuild the hourly feature statistics from predictions_log")
+    p.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    p.add_argument("--days", type=float, default=7, help="Rebuild the closed hours of the last DAYS days")
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not args.database_url:
+        raise SystemExit("Pass --database-url or set DATABASE_URL")
+
+    engine = create_engine(args.database_url)
+    create_tables(engine)
+    # The current hour is still being written by the log writer, so it is left alone
+    end = hour_bucket(datetime.now())
+    rows = rebuild_stats(engine, end - timedelta(days=args.days), end)
+    logger.info("Rebuilt the hourly feature statistics from %d rows before %s", rows, end)
+
+
+if __name__ == "__main__":
+    main()
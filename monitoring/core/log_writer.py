@@ -0,0 +1,335 @@
+"""
+Buffered, batched writer for the predictions_log table.
+
+Logging a prediction puts its row on a bounded in-process queue and returns. A background thread
+drains the queue and inserts the rows with one multi-row INSERT per batch, every `batch_size` rows
+or `flush_ms` milliseconds after the oldest waiting row, whichever comes first. So the database
+sees one transaction per batch instead of one per prediction.
+
+When the queue is full, the overflow policy decides what happens to a new row:
+    drop  - discard it (counted in prediction_log_dropped_total)
+    block - wait up to `block_timeout` seconds for room, then discard it
+    spill - append it to a local NDJSON file, which the writer inserts once it is idle again
+
+Each process appends to its own spill file. To replay it, the writer first renames the file out of the
+way, so new spills start a fresh one, and deletes the renamed file only once its rows are written.
+Files left by processes that have exited are taken over the same way; those of live processes are
+never touched. Rows are written at least once: a crash during replay can insert some of them twice.
+
+With `feature_stats`, each batch also updates the hourly feature statistics (see feature_stats.py)
+in the same transaction, so the statistics always count exactly the rows in predictions_log.
+"""
+
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import column, insert, table
+from sqlalchemy.engine import Engine
+
+from .feature_stats import accumulate, upsert_stats
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_LOG_QUEUE_SIZE = int(os.getenv("PREDICTION_LOG_QUEUE_SIZE", "10000"))
+PREDICTION_LOG_BATCH_SIZE = int(os.getenv("PREDICTION_LOG_BATCH_SIZE", "200"))
+PREDICTION_LOG_FLUSH_MS = float(os.getenv("PREDICTION_LOG_FLUSH_MS", "500"))
+PREDICTION_LOG_OVERFLOW = os.getenv("PREDICTION_LOG_OVERFLOW", "drop").lower()
+PREDICTION_LOG_BLOCK_TIMEOUT = float(os.getenv("PREDICTION_LOG_BLOCK_TIMEOUT", "5"))
+PREDICTION_LOG_SPILL_DIR = os.getenv(
+    "PREDICTION_LOG_SPILL_DIR", os.path.join(tempfile.gettempdir(), "medview-prediction-log")
+)
+
+OVERFLOW_POLICIES = ("drop", "block", "spill")
+# Seconds to wait before retrying spilled rows after a failed insert
+SPILL_RETRY_SECONDS = 5.0
+
+prediction_log_queue_depth = Gauge("prediction_log_queue_depth", "Prediction log rows waiting to be written")
+prediction_log_flush_rows = Histogram(
+    "prediction_log_flush_rows",
+    "Rows written per predictions_log insert",
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+prediction_log_flush_latency = Histogram(
+    "prediction_log_flush_seconds", "Time to insert and commit one batch of prediction log rows"
+)
+prediction_log_dropped = Counter("prediction_log_dropped_total", "Prediction log rows discarded", ["reason"])
+prediction_log_spilled = Counter("prediction_log_spilled_total", "Prediction log rows written to the spill file")
+
+PREDICTIONS_LOG_COLUMNS = (
+    "timestamp",
+    "prediction_confidence",
+    "prediction_class",
+    "num_detections",
+    "model_version",
+    "processing_time_ms",
+    "image_width",
+    "image_height",
+    "image_channels",
+    "image_size_bytes",
+    "brightness_mean",
+    "brightness_std",
+    "contrast_mean",
+    "contrast_std",
+    "entropy",
+    "skewness",
+    "kurtosis",
+    "mean_intensity",
+    "std_intensity",
+    "tumor_area_ratio",
+    "tumor_detection_confidence",
+    "num_tumors_detected",
+    "largest_tumor_area",
+    "tumor_density",
+    "tumor_location_x",
+    "tumor_location_y",
+    "tumor_shape_regularity",
+)
+predictions_log = table("predictions_log", *(column(name) for name in PREDICTIONS_LOG_COLUMNS))
+
+
+def _encode_row(row: Dict[str, Any]) -> str:
+    return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()})
+
+
+def _decode_row(line: str) -> Dict[str, Any]:
+    row = json.loads(line)
+    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return row
+
+
+def _spill_owner(path: Path) -> Optional[int]:
+    """The pid in a spill file name: predictions_log.<pid>.ndjson or predictions_log.<pid>.<n>.replay."""
+    parts = path.name.split(".")
+    return int(parts[1]) if len(parts) >= 3 and parts[1].isdigit() else None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, it just belongs to another user
+        return True
+    return True
+
+
+class PredictionLogWriter:
+    """Bounded queue of predictions_log rows drained in batches by a background thread."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        max_queue: int = PREDICTION_LOG_QUEUE_SIZE,
+        batch_size: int = PREDICTION_LOG_BATCH_SIZE,
+        flush_ms: float = PREDICTION_LOG_FLUSH_MS,
+        overflow: str = PREDICTION_LOG_OVERFLOW,
+        block_timeout: float = PREDICTION_LOG_BLOCK_TIMEOUT,
+        spill_dir: str = PREDICTION_LOG_SPILL_DIR,
+        feature_stats: bool = False,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.engine = engine
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_ms) / 1000.0
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill_dir = Path(spill_dir)
+        self.feature_stats = feature_stats
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, max_queue))
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._retry_spill_at = 0.0
+
+    @property
+    def spill_path(self) -> Path:
+        # One file per process, so pre-forked workers never interleave their lines
+        return self.spill_dir / f"predictions_log.{os.getpid()}.ndjson"
+
+    def start(self) -> None:
+        """Start the writer thread; called on the first submitted row, so an idle monitor starts none."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """Queue a row for writing; False if the overflow policy discarded it."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            if self.overflow == "block":
+                self._queue.put(row, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow == "spill":
+                self._spill([row])
+                return True
+            prediction_log_dropped.labels(reason="overflow").inc()
+            return False
+        prediction_log_queue_depth.set(self._queue.qsize())
+        return True
+
+    def flush(self) -> None:
+        """Block until every row queued so far has been written (or spilled or dropped)."""
+        self._queue.join()
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Write the queued rows and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Prediction log writer did not finish within %.0fs", timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self._collect()
+                if batch:
+                    try:
+                        self._flush(batch)
+                    finally:
+                        for _ in batch:
+                            self._queue.task_done()
+                elif self._stopping.is_set():
+                    break
+                else:
+                    self._replay_spilled()
+            except Exception:
+                # Whatever went wrong, keep the thread alive for the rows still to come
+                logger.exception("Prediction log writer failed; continuing")
+                self._retry_spill_at = time.monotonic() + SPILL_RETRY_SECONDS
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """Wait for a row, then gather more until the batch is full or the flush interval has passed."""
+        try:
+            batch = [self._queue.get(timeout=0.1 if self._stopping.is_set() else max(self.flush_interval, 0.1))]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stopping.is_set():
+                    # Short waits, so close() does not have to wait out the flush interval
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                if remaining <= 0 or self._stopping.is_set():
+                    break
+        prediction_log_queue_depth.set(self._queue.qsize())
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        """Insert `batch` in one transaction; False (after logging it) if the database refused it."""
+        start = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(predictions_log), batch)
+                if self.feature_stats:
+                    upsert_stats(conn, *accumulate(batch))
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} prediction log rows: {e}")
+            self._retry_spill_at = time.monotonic() + SPILL_RETRY_SECONDS
+            return False
+        prediction_log_flush_latency.observe(time.perf_counter() - start)
+        prediction_log_flush_rows.observe(len(batch))
+        logger.debug("Wrote %d prediction log rows", len(batch))
+        return True
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        if self._write(batch):
+            return True
+        if self.overflow == "spill":
+            self._spill(batch)
+        else:
+            prediction_log_dropped.labels(reason="error").inc(len(batch))
+        return False
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        lines = []
+        for row in rows:
+            try:
+                lines.append(_encode_row(row) + "\n")
+            except (TypeError, ValueError) as e:
+                logger.error(f"Error serializing a prediction log row for the spill file: {e}")
+                prediction_log_dropped.labels(reason="spill").inc()
+        if not lines:
+            return
+        try:
+            with self._lock:
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                with open(self.spill_path, "a") as f:
+                    f.writelines(lines)
+        except OSError as e:
+            logger.error(f"Error spilling {len(lines)} prediction log rows: {e}")
+            prediction_log_dropped.labels(reason="spill").inc(len(lines))
+            return
+        prediction_log_spilled.inc(len(lines))
+
+    def _claim_spilled(self) -> List[Path]:
+        """
+        Rename this process's spill file, and those of processes that have exited, to replay files owned
+        by this process, and return every replay file it owns. Files of live processes are left alone.
+        """
+        pid = os.getpid()
+        for path in sorted(self.spill_dir.glob("predictions_log.*")):
+            owner = _spill_owner(path)
+            if owner is None or (owner == pid and path.suffix == ".replay"):
+                continue
+            if owner != pid and _pid_alive(owner):
+                continue
+            # Under the lock, so this process's own _spill never appends to a file being renamed
+            try:
+                with self._lock:
+                    os.replace(path, self.spill_dir / f"predictions_log.{pid}.{time.time_ns()}.replay")
+            except OSError:
+                # Another process claimed it first
+                continue
+        return sorted(self.spill_dir.glob(f"predictions_log.{pid}.*.replay"))
+
+    def _replay_spilled(self) -> None:
+        """Insert rows spilled by this or an exited process while the queue is idle."""
+        if time.monotonic() < self._retry_spill_at or not self.spill_dir.is_dir():
+            return
+        for path in self._claim_spilled():
+            rows = []
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(_decode_row(line))
+                    except (ValueError, KeyError, TypeError) as e:
+                        # e.g. a line cut short when its process was killed
+                        logger.error(f"Skipping an unreadable spilled prediction log row in {path}: {e}")
+                        prediction_log_dropped.labels(reason="corrupt").inc()
+            logger.info("Replaying %d spilled prediction log rows from %s", len(rows), path)
+            for i in range(0, len(rows), self.batch_size):
+                if not self._write(rows[i : i + self.batch_size]):
+                    # The database is still unavailable: keep the unwritten rows for the next attempt
+                    tmp = path.with_name(f".{path.name}.tmp")
+                    with open(tmp, "w") as f:
+                        f.writelines(_encode_row(row) + "\n" for row in rows[i:])
+                    os.replace(tmp, path)
+                    return
+            path.unlink()
+            if not self._queue.empty():
+                return
@@ -6,30 +6,42 @@ import logging
 import os
 import random
 import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
-import cv2
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from evidently import Report
-from evidently.presets import DataDriftPreset, DataSummaryPreset
 from fastapi import HTTPException
-from google.cloud import storage
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from supabase import Client, create_client
 
+from ml.gcs import GCSFetcher
+
 from .drift_detector import DriftDetector
 from .feature_extractor import ImageFeatureExtractor
+from .feature_stats import RunningStats, create_tables, load_class_counts, load_feature_stats, supports_upsert
+from .log_writer import PredictionLogWriter
+from .reference_snapshot import REFERENCE_SNAPSHOT_DIR, find_snapshot, load_snapshot, snapshot_metadata
+from .report_store import REPORT_STORAGE, REPORT_STORAGE_DIR, LocalReportStorage, ReportStorage, SupabaseReportStorage
+from .sampling import reservoir_sample
 
 load_dotenv()  # Ensure .env is loaded before any os.getenv
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = "reports"
+# Seconds a computed dashboard is served to further requests
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "10"))
+# Logged predictions used as current data for drift analysis: at most CURRENT_DATA_SAMPLE_SIZE rows,
+# sampled uniformly from the window with a reservoir or, on PostgreSQL, with TABLESAMPLE first
+CURRENT_DATA_SAMPLE_SIZE = int(os.getenv("CURRENT_DATA_SAMPLE_SIZE", "5000"))
+CURRENT_DATA_CHUNK_SIZE = int(os.getenv("CURRENT_DATA_CHUNK_SIZE", "10000"))
+CURRENT_DATA_SAMPLING = os.getenv("CURRENT_DATA_SAMPLING", "reservoir").lower()
 
 supabase: Client = None
 if SUPABASE_URL and SUPABASE_KEY:
@@ -38,11 +50,45 @@ if SUPABASE_URL and SUPABASE_KEY:
 logger = logging.getLogger(__name__)
 
 
+def default_report_storage() -> Optional[ReportStorage]:
+    """The storage REPORT_STORAGE selects; None for Supabase when it is not configured."""
+    if REPORT_STORAGE == "local":
+        return LocalReportStorage(REPORT_STORAGE_DIR)
+    return SupabaseReportStorage(supabase, SUPABASE_BUCKET) if supabase else None
+
+
+def render_drift_report(reference_data: pd.DataFrame, current_data: pd.DataFrame, columns: List[str]) -> bytes:
+    """Run the Evidently drift and summary presets on `columns` and return the report as HTML."""
+    # evidently takes seconds to import and is only needed here
+    from evidently import Report
+    from evidently.presets import DataDriftPreset, DataSummaryPreset
+
+    drift_report = Report(
+        metrics=[
+            DataDriftPreset(columns=columns, drift_share=0.1),
+            DataSummaryPreset(columns=columns),
+        ]
+    )
+    snapshot = drift_report.run(current_data=current_data, reference_data=reference_data)
+    # Save directly to file and read it back
+    with tempfile.NamedTemporaryFile("w+", suffix=".html", delete=True, encoding="utf-8") as tmp:
+        snapshot.save_html(tmp.name)
+        tmp.seek(0)
+        return tmp.read().encode("utf-8")
+
+
 class BrainTumorImageMonitor:
     """Data drift monitoring system specifically for brain tumor image classification."""
 
-    def __init__(self, database_url: str, reports_dir: str = "monitoring/reports"):
+    def __init__(
+        self,
+        database_url: str,
+        reports_dir: str = "monitoring/reports",
+        reference_snapshot_dir: str = REFERENCE_SNAPSHOT_DIR,
+        report_storage: Optional[ReportStorage] = None,
+    ):
         self.database_url = database_url
+        self.report_storage = report_storage or default_report_storage()
         self.engine = create_engine(database_url)
         self.reports_dir = Path(reports_dir)
         self.reports_dir.mkdir(parents=True, exist_ok=True)
@@ -50,49 +96,81 @@ class BrainTumorImageMonitor:
         # Initialize components
         self.feature_extractor = ImageFeatureExtractor()
         self.drift_detector = DriftDetector()
+        self.log_writer = PredictionLogWriter(self.engine, feature_stats=self._create_feature_stats_tables())
+        self._dashboard_lock = threading.Lock()
+        self._dashboard_cache: Tuple[float, Optional[Dict]] = (0.0, None)
 
         # Feature columns
         self.image_columns = self.feature_extractor.image_columns
         self.tumor_features = self.feature_extractor.tumor_features
 
         # Reference data from train images
-        self.reference_data = self._load_reference_data_from_gcs()
+        self.reference_snapshot_dir = reference_snapshot_dir
+        # Dataset version of the reference snapshot; the GCS sample is drawn anew by every process
+        self.reference_version = "gcs-sample"
+        self.reference_data = self._load_reference_data()
+        self.reference_stats = self._reference_stats(self.reference_data)
+
+    def _create_feature_stats_tables(self) -> bool:
+        """Create the hourly feature statistics tables; False if they cannot be kept on this database."""
+        if not supports_upsert(self.engine):
+            logger.warning(f"Hourly feature statistics are not supported on {self.engine.dialect.name}")
+            return False
+        try:
+            create_tables(self.engine)
+            return True
+        except SQLAlchemyError as e:
+            logger.error(f"Database error creating the feature statistics tables: {e}")
+            return False
+
+    def _reference_stats(self, reference_data: Optional[pd.DataFrame]) -> Dict[str, RunningStats]:
+        if reference_data is None:
+            return {}
+        return {
+            feature: RunningStats.from_values(reference_data[feature])
+            for feature in self.drift_detector.key_features
+            if feature in reference_data.columns
+        }
 
-    def _load_reference_data_from_gcs(self, n_images: int = 50) -> pd.DataFrame:
+    def _load_reference_data(self) -> pd.DataFrame:
+        """Load the precomputed reference snapshot, or sample training images from GCS if there is none."""
+        path = find_snapshot(self.reference_snapshot_dir, extractor_version=self.feature_extractor.version)
+        if path is not None:
+            try:
+                df = load_snapshot(path)
+                self.reference_version = snapshot_metadata(path)["dataset_version"]
+                logger.info(f"Loaded {len(df)} reference rows from {path}")
+                return df
+            except Exception as e:
+                logger.warning(f"Could not read reference snapshot {path}: {e}")
+        logger.warning(
+            f"No reference snapshot for feature extractor {self.feature_extractor.version} in "
+            f"{self.reference_snapshot_dir}; sampling reference images from GCS"
+        )
+        return self._load_reference_data_from_gcs()
+
+    def _load_reference_data_from_gcs(self, n_images: int = 50, fetcher: Optional[GCSFetcher] = None) -> pd.DataFrame:
         """Download n_images from GCS train/images/ and extract features for reference data."""
         bucket_name = "brain-tumor-data"
-        prefix = "BrainTumorYolov8/train/images/"
-        label_prefix = "BrainTumorYolov8/train/labels/"
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blobs = list(storage_client.list_blobs(bucket_name, prefix=prefix))
-        image_blobs = [b for b in blobs if b.name.lower().endswith((".jpg", ".jpeg", ".png"))]
-        if len(image_blobs) == 0:
+        split_prefix = "BrainTumorYolov8/train/"
+        fetcher = fetcher or GCSFetcher(bucket_name)
+        # One listing of the split gives both the images and their label files
+        pairs = fetcher.list_labeled(split_prefix)
+        if len(pairs) == 0:
             raise RuntimeError("No images found in GCS train/images/ for reference data.")
-        selected_blobs = random.sample(image_blobs, min(n_images, len(image_blobs)))
-        features = []
-        for blob in selected_blobs:
-            with tempfile.NamedTemporaryFile(suffix=Path(blob.name).suffix) as tmp:
-                blob.download_to_filename(tmp.name)
-                img = cv2.imread(tmp.name)
-                label_file = blob.name.replace("images/", "labels/").rsplit(".", 1)[0] + ".txt"
-                label_blob = storage_client.bucket(bucket_name).blob(label_file)
-                prediction_class = "unknown"
-                if label_blob.exists():
-                    label_blob.download_to_filename(tmp.name + ".txt")
-                    with open(tmp.name + ".txt", "r") as f:
-                        label_content = f.read().strip()
-                        if label_content:
-                            # Use the first class index in the label file
-                            prediction_class = label_content.split()[0]
-                if img is not None:
-                    feat = self.feature_extractor.extract_features(img)
-                    feat["prediction_confidence"] = 0.0
-                    feat["prediction_class"] = prediction_class
-                    feat["num_detections"] = 0
-                    feat["model_version"] = "reference"
-                    feat["processing_time_ms"] = 0
-                    features.append(feat)
+        selected = random.sample(pairs, min(n_images, len(pairs)))
+        samples = [sample for sample in fetcher.fetch_labeled_images(selected) if sample.image is not None]
+        features = self.feature_extractor.extract_features_batch([sample.image for sample in samples])
+        for sample, feat in zip(samples, features):
+            prediction_class = "unknown"
+            if sample.label and sample.label.strip():
+                # Use the first class index in the label file
+                prediction_class = sample.label.split()[0]
+            feat["prediction_confidence"] = 0.0
+            feat["prediction_class"] = prediction_class
+            feat["num_detections"] = 0
+            feat["model_version"] = "reference"
+            feat["processing_time_ms"] = 0
         if not features:
             raise RuntimeError("No features extracted from GCS images.")
         df = pd.DataFrame(features)
@@ -113,6 +191,10 @@ class BrainTumorImageMonitor:
                 )
         return df
 
+    def close(self) -> None:
+        """Write the prediction logs still queued and stop the log writer."""
+        self.log_writer.close()
+
     def extract_brain_tumor_features(self, image: np.ndarray) -> Dict[str, float]:
         """Extract comprehensive features from brain tumor images."""
         return self.feature_extractor.extract_features(image)
@@ -135,12 +217,37 @@ class BrainTumorImageMonitor:
         overlap_info = self.drift_detector.check_overlap(reference_data, current_data)
         logger.info(f"Timestamp overlap between reference and current: {overlap_info.get('overlap_count', 0)} records")
 
+    def get_feature_stats(self, days: int = 7) -> Dict[str, RunningStats]:
+        """Statistics of the logged features over the last `days`, merged from the hourly buckets."""
+        if not self.log_writer.feature_stats:
+            return {}
+        try:
+            with self.engine.connect() as conn:
+                return load_feature_stats(conn, datetime.now() - timedelta(days=days))
+        except SQLAlchemyError as e:
+            logger.error(f"Database error getting feature statistics: {e}")
+            return {}
+
     def get_current_data(self, days: int = 7) -> pd.DataFrame:
-        """Get current brain tumor image data from the database."""
+        """
+        Get current brain tumor image data from the database: the predictions logged in the last `days`,
+        streamed in chunks and sampled down to CURRENT_DATA_SAMPLE_SIZE rows.
+        """
+        since = datetime.now() - timedelta(days=days)
         try:
             with self.engine.connect() as conn:
+                window_rows = self._count_window_rows(conn, since)
+                from_clause = "predictions_log"
+                if (
+                    CURRENT_DATA_SAMPLING == "tablesample"
+                    and self.engine.dialect.name == "postgresql"
+                    and window_rows > CURRENT_DATA_SAMPLE_SIZE
+                ):
+                    # Read only a share of the table's pages; the reservoir trims what is left over
+                    percent = min(100.0, 150.0 * CURRENT_DATA_SAMPLE_SIZE / window_rows)
+                    from_clause = f"predictions_log TABLESAMPLE SYSTEM ({percent:.6f})"
                 query = text(
-                    """
+                    f"""
                     SELECT image_width, image_height, image_channels, image_size_bytes,
                            brightness_mean, brightness_std, contrast_mean, contrast_std,
                            entropy, skewness, kurtosis, mean_intensity, std_intensity,
@@ -148,20 +255,35 @@ class BrainTumorImageMonitor:
                            num_tumors_detected, largest_tumor_area, tumor_density,
                            tumor_location_x, tumor_location_y, tumor_shape_regularity,
                            prediction_confidence, prediction_class, timestamp
-                    FROM predictions_log
-                    ORDER BY timestamp DESC
-                    LIMIT 50
+                    FROM {from_clause}
+                    WHERE timestamp >= :since
                 """
                 )
-                result = conn.execute(query)
-                df = pd.DataFrame(result.fetchall(), columns=result.keys())
+                # Server-side cursor where the driver has one, so only a chunk of rows is held at a time
+                chunks = pd.read_sql(
+                    query,
+                    conn.execution_options(stream_results=True),
+                    params={"since": since},
+                    chunksize=CURRENT_DATA_CHUNK_SIZE,
+                    parse_dates=["timestamp"],
+                )
+                df = reservoir_sample(chunks, CURRENT_DATA_SAMPLE_SIZE)
                 if df.empty:
                     return self._create_synthetic_current_data(days)
-                return df
+                logger.info(f"Current data: {len(df)} of {window_rows} predictions from the last {days} days")
+                return df.sort_values("timestamp", ascending=False, ignore_index=True)
         except SQLAlchemyError as e:
             logger.error(f"Database error getting current data: {e}")
             return self._create_synthetic_current_data(days)
 
+    def _count_window_rows(self, conn, since: datetime) -> int:
+        """Predictions logged since `since`, from the hourly class counts when they are kept."""
+        if self.log_writer.feature_stats:
+            return sum(load_class_counts(conn, since).values())
+        return conn.execute(
+            text("SELECT COUNT(*) FROM predictions_log WHERE timestamp >= :since"), {"since": since}
+        ).scalar()
+
     def _create_synthetic_current_data(self, days: int) -> pd.DataFrame:
         """Create synthetic current data with slight drift."""
         n_samples = 100
@@ -209,41 +331,20 @@ class BrainTumorImageMonitor:
                 **image_features,
             }
 
-            # Store in database
-            with self.engine.connect() as conn:
-                # Insert into predictions_log table (no patient_id)
-                insert_query = text(
-                    """
-                    INSERT INTO predictions_log (
-                        timestamp, prediction_confidence, prediction_class,
-                        num_detections, model_version, processing_time_ms,
-                        image_width, image_height, image_channels, image_size_bytes,
-                        brightness_mean, brightness_std, contrast_mean, contrast_std,
-                        entropy, skewness, kurtosis, mean_intensity, std_intensity,
-                        tumor_area_ratio, tumor_detection_confidence,
-                        num_tumors_detected, largest_tumor_area, tumor_density,
-                        tumor_location_x, tumor_location_y, tumor_shape_regularity
-                    ) VALUES (
-                        :timestamp, :prediction_confidence, :prediction_class,
-                        :num_detections, :model_version, :processing_time_ms,
-                        :image_width, :image_height, :image_channels, :image_size_bytes,
-                        :brightness_mean, :brightness_std, :contrast_mean, :contrast_std,
-                        :entropy, :skewness, :kurtosis, :mean_intensity, :std_intensity,
-                        :tumor_area_ratio, :tumor_detection_confidence,
-                        :num_tumors_detected, :largest_tumor_area, :tumor_density,
-                        :tumor_location_x, :tumor_location_y, :tumor_shape_regularity
-                    )
-                """
-                )
-                conn.execute(insert_query, log_data)
-                conn.commit()
-                logger.info(f"Logged brain tumor prediction: {log_data}")
+            # Written to the database in batches by the log writer thread
+            self.log_writer.submit(log_data)
+            logger.debug(f"Queued brain tumor prediction log: {log_data}")
 
         except Exception as e:
             logger.error(f"Error logging brain tumor prediction: {e}")
 
-    def generate_brain_tumor_drift_report(self, days: int = 7) -> str:
-        """Generate comprehensive brain tumor image drift report and upload to Supabase Storage."""
+    def generate_brain_tumor_drift_report(
+        self, days: int = 7, render: Callable[..., bytes] = render_drift_report
+    ) -> str:
+        """
+        Generate comprehensive brain tumor image drift report and upload to Supabase Storage.
+        `render` builds the HTML; report jobs pass one that runs it in a worker process.
+        """
         try:
             reference_data = self.get_reference_data()
             current_data = self.get_current_data(days)
@@ -253,36 +354,14 @@ class BrainTumorImageMonitor:
                     detail="Insufficient data for brain tumor drift analysis",
                 )
             self._log_data_split_and_overlap(reference_data, current_data)
-            drift_report = Report(
-                metrics=[
-                    DataDriftPreset(
-                        columns=self.image_columns + self.tumor_features,
-                        drift_share=0.1,
-                    ),
-                    DataSummaryPreset(columns=self.image_columns + self.tumor_features),
-                ]
-            )
-            snapshot = drift_report.run(current_data=current_data, reference_data=reference_data)
-            import datetime
-            import io
+            html_bytes = render(reference_data, current_data, self.image_columns + self.tumor_features)
 
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             report_filename = f"brain_tumor_drift_report_{timestamp}.html"
-            # Save directly to file and upload to Supabase
-            import tempfile
-
-            with tempfile.NamedTemporaryFile("w+", suffix=".html", delete=True, encoding="utf-8") as tmp:
-                snapshot.save_html(tmp.name)
-                tmp.seek(0)
-                html_bytes = tmp.read().encode("utf-8")
-                if supabase:
-                    supabase.storage.from_(SUPABASE_BUCKET).upload(
-                        report_filename, html_bytes, {"content-type": "text/html"}
-                    )
-                    public_url = supabase.storage.from_(SUPABASE_BUCKET).get_public_url(report_filename)
-                    return public_url
-                else:
-                    raise HTTPException(status_code=500, detail="Supabase client not configured")
+            if self.report_storage is not None:
+                return self.report_storage.upload(report_filename, html_bytes, "text/html")
+            else:
+                raise HTTPException(status_code=500, detail="Supabase client not configured")
         except Exception as e:
             logger.error(f"Error generating brain tumor drift report: {e}")
             raise HTTPException(status_code=500, detail="Error generating brain tumor drift report")
@@ -290,6 +369,15 @@ class BrainTumorImageMonitor:
     def analyze_feature_drift(self, days: int = 7) -> Dict:
         """Analyze feature distributions and drift indicators."""
         try:
+            current_stats = self.get_feature_stats(days)
+            if self.reference_stats and current_stats:
+                logger.info(
+                    f"Drift from hourly statistics of {max(s.count for s in current_stats.values())} predictions "
+                    f"over the last {days} days"
+                )
+                return self.drift_detector.analyze_feature_stats(self.reference_stats, current_stats)
+
+            # No statistics yet (or none kept on this database): compare the rows themselves
             reference_data = self.get_reference_data()
             current_data = self.get_current_data(days)
 
@@ -325,26 +413,54 @@ class BrainTumorImageMonitor:
 
     def get_brain_tumor_dashboard_data(self) -> Dict:
         """Get data for brain tumor monitoring dashboard."""
+        with self._dashboard_lock:
+            cached_at, cached = self._dashboard_cache
+            if cached is not None and time.monotonic() - cached_at < DASHBOARD_CACHE_TTL_SECONDS:
+                return dict(cached)
+        dashboard_data = self._compute_dashboard_data()
+        if "error" not in dashboard_data:
+            with self._dashboard_lock:
+                self._dashboard_cache = (time.monotonic(), dashboard_data)
+        return dict(dashboard_data)
+
+    def _compute_dashboard_data(self) -> Dict:
         try:
-            # Get recent brain tumor predictions
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             with self.engine.connect() as conn:
-                # Query recent predictions
-                query = text(
+                if self.log_writer.feature_stats:
+                    # Today's hourly statistics: a few rows per hour, however many predictions were logged
+                    counts = load_class_counts(conn, today)
+                    stats = load_feature_stats(conn, today, ["prediction_confidence", "tumor_detection_confidence"])
+                    prediction_confidence = stats.get("prediction_confidence", RunningStats())
+                    tumor_confidence = stats.get("tumor_detection_confidence", RunningStats())
+                    row = (
+                        sum(counts.values()),
+                        prediction_confidence.mean if prediction_confidence.count else None,
+                        # The most frequent class, ties going to the first name like MODE()
+                        min(counts, key=lambda name: (-counts[name], name)) if counts else None,
+                        tumor_confidence.mean if tumor_confidence.count else None,
+                        counts.get("malignant", 0),
+                        counts.get("benign", 0),
+                        counts.get("normal", 0),
+                    )
+                else:
+                    # Query recent predictions
+                    query = text(
+                        """
+                        SELECT
+                            COUNT(*) as total_predictions_today,
+                            AVG(prediction_confidence) as average_confidence,
+                            MODE() WITHIN GROUP (ORDER BY prediction_class) as most_common_class,
+                            AVG(tumor_detection_confidence) as avg_tumor_confidence,
+                            COUNT(CASE WHEN prediction_class = 'malignant' THEN 1 END) as malignant_count,
+                            COUNT(CASE WHEN prediction_class = 'benign' THEN 1 END) as benign_count,
+                            COUNT(CASE WHEN prediction_class = 'normal' THEN 1 END) as normal_count
+                        FROM predictions_log
+                        WHERE timestamp >= :today
                     """
-                    SELECT
-                        COUNT(*) as total_predictions_today,
-                        AVG(prediction_confidence) as average_confidence,
-                        MODE() WITHIN GROUP (ORDER BY prediction_class) as most_common_class,
-                        AVG(tumor_detection_confidence) as avg_tumor_confidence,
-                        COUNT(CASE WHEN prediction_class = 'malignant' THEN 1 END) as malignant_count,
-                        COUNT(CASE WHEN prediction_class = 'benign' THEN 1 END) as benign_count,
-                        COUNT(CASE WHEN prediction_class = 'normal' THEN 1 END) as normal_count
-                    FROM predictions_log
-                    WHERE DATE(timestamp) = CURRENT_DATE
-                """
-                )
-                result = conn.execute(query)
-                row = result.fetchone()
+                    )
+                    result = conn.execute(query, {"today": today})
+                    row = result.fetchone()
 
                 if row:
                     dashboard_data = {
@@ -0,0 +1,199 @@
+"""
+Precomputed reference features for drift monitoring.
+
+The features of the training split are computed offline and written to a Parquet snapshot keyed by
+the dataset version (the DVC hash of the split) and the feature extractor version, so the monitor
+loads a fixed reference set at startup instead of sampling and downloading training images.
+
+    python -m monitoring.core.reference_snapshot \
+        --images data/BrainTumor/BrainTumorYolov8/train/images \
+        --labels data/BrainTumor/BrainTumorYolov8/train/labels
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+import yaml
+
+from .feature_extractor import FEATURE_EXTRACTOR_VERSION, FEATURE_THUMBNAIL_SIZE, ImageFeatureExtractor
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+DEFAULT_DVC_FILE = "data/BrainTumor/BrainTumorYolov8/train.dvc"
+# Relative to the package rather than the working directory, which differs between deployments
+REFERENCE_SNAPSHOT_DIR = os.getenv("REFERENCE_SNAPSHOT_DIR", str(Path(__file__).resolve().parents[1] / "reference"))
+# Pin the snapshot to load; by default the newest one written with the current extractor version
+REFERENCE_DATASET_VERSION = os.getenv("REFERENCE_DATASET_VERSION")
+
+SNAPSHOT_PREFIX = "reference_features"
+METADATA_KEY = b"medview.reference"
+
+# Fields the drift report expects on every row; reference rows carry fixed values
+REFERENCE_FIELDS = {
+    "prediction_confidence": 0.0,
+    "num_detections": 0,
+    "model_version": "reference",
+    "processing_time_ms": 0,
+}
+REFERENCE_TIMESTAMP = pd.Timestamp("2020-01-01").as_unit("ns")
+
+
+def dataset_version(dvc_file: str = DEFAULT_DVC_FILE) -> str:
+    """Version of a DVC-tracked dataset split: the hash of its directory."""
+    with open(dvc_file, "r") as f:
+        outs = yaml.safe_load(f)["outs"]
+    return outs[0]["md5"].split(".", 1)[0]
+
+
+def snapshot_path(snapshot_dir: str, version: str, extractor_version: str = FEATURE_EXTRACTOR_VERSION) -> Path:
+    return Path(snapshot_dir) / f"{SNAPSHOT_PREFIX}_{version}_{extractor_version}.parquet"
+
+
+def _label_class(label_path: Path) -> str:
+    """First class index in a YOLO label file, as the GCS reference loader reads it."""
+    if not label_path.is_file():
+        return "unknown"
+    content = label_path.read_text().strip()
+    return content.split()[0] if content else "unknown"
+
+
+def _worker_init() -> None:
+    # The pool already uses every core; OpenCV's own threads would only compete with it
+    cv2.setNumThreads(1)
+
+
+def _extract_one(task: Tuple[str, str, int]) -> Optional[Dict]:
+    image_path, label_path, thumbnail_size = task
+    image = cv2.imread(image_path)
+    if image is None:
+        return None
+    # The simulated tumor features are random: seed per image so a snapshot is reproducible
+    np.random.seed(zlib.crc32(Path(image_path).name.encode()))
+    features = ImageFeatureExtractor(thumbnail_size).extract_features(image)
+    features["prediction_class"] = _label_class(Path(label_path))
+    features.update(REFERENCE_FIELDS)
+    return features
+
+
+def compute_reference_features(
+    image_dir: str, label_dir: str, workers: Optional[int] = None, thumbnail_size: int = FEATURE_THUMBNAIL_SIZE
+) -> pd.DataFrame:
+    """Extract the reference features of every image in `image_dir` using a process pool."""
+    images = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise RuntimeError(f"No images found in {image_dir}")
+    tasks = [(str(p), str(Path(label_dir) / (p.stem + ".txt")), thumbnail_size) for p in images]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        rows = [_extract_one(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init) as pool:
+            rows = list(pool.map(_extract_one, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    features = [row for row in rows if row is not None]
+    if len(features) < len(tasks):
+        logger.warning("Skipped %d unreadable images in %s", len(tasks) - len(features), image_dir)
+    if not features:
+        raise RuntimeError(f"No features extracted from {image_dir}")
+    df = pd.DataFrame(features)
+    df["timestamp"] = REFERENCE_TIMESTAMP
+    return df
+
+
+def write_snapshot(
+    df: pd.DataFrame, path: Path, version: str, extractor_version: str = FEATURE_EXTRACTOR_VERSION
+) -> Path:
+    """Write reference features to Parquet with their versions in the file's schema metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        "dataset_version": version,
+        "extractor_version": extractor_version,
+        "num_images": len(df),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the target and rename, so a reader never sees a partial snapshot
+    tmp_path = path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def snapshot_metadata(path: Path) -> Dict:
+    import pyarrow.parquet as pq
+
+    return json.loads(pq.read_schema(path).metadata[METADATA_KEY])
+
+
+def load_snapshot(path: Path) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    return pq.read_table(path).to_pandas(coerce_temporal_nanoseconds=True)
+
+
+def find_snapshot(
+    snapshot_dir: str = REFERENCE_SNAPSHOT_DIR,
+    version: Optional[str] = REFERENCE_DATASET_VERSION,
+    extractor_version: str = FEATURE_EXTRACTOR_VERSION,
+) -> Optional[Path]:
+    """Snapshot for `version`, or the newest one for `extractor_version` when no version is pinned."""
+    if version:
+        path = snapshot_path(snapshot_dir, version, extractor_version)
+        return path if path.is_file() else None
+    candidates = sorted(
+        Path(snapshot_dir).glob(f"{SNAPSHOT_PREFIX}_*_{extractor_version}.parquet"),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    return candidates[0] if candidates else None
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Precompute the drift monitoring reference features of a dataset split")
+    p.add_argument("--images", default="data/BrainTumor/BrainTumorYolov8/train/images")
+    p.add_argument("--labels", default="data/BrainTumor/BrainTumorYolov8/train/labels")
+    p.add_argument("--dvc-file", default=DEFAULT_DVC_FILE, help="DVC file of the split, for its version")
+    p.add_argument("--dataset-version", default=None, help="Use this version instead of reading the DVC file")
+    p.add_argument("--output-dir", default=REFERENCE_SNAPSHOT_DIR)
+    p.add_argument("--workers", type=int, default=None, help="Extraction processes (default: all cores)")
+    p.add_argument(
+        "--thumbnail-size",
+        type=int,
+        default=FEATURE_THUMBNAIL_SIZE,
+        help="Compute the features on thumbnails, to match a monitor running with FEATURE_THUMBNAIL_SIZE",
+    )
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    version = args.dataset_version or dataset_version(args.dvc_file)
+    start = time.perf_counter()
+    extractor_version = ImageFeatureExtractor(args.thumbnail_size).version
+    df = compute_reference_features(args.images, args.labels, args.workers, args.thumbnail_size)
+    path = write_snapshot(df, snapshot_path(args.output_dir, version, extractor_version), version, extractor_version)
+    logger.info(
+        "Wrote %d reference rows to %s in %.1f s (dataset %s, extractor %s)",
+        len(df),
+        path,
+        time.perf_counter() - start,
+        version,
+        extractor_version,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Background jobs that build Evidently drift reports.
+
+Submitting a report returns a job right away; a worker thread reads the reference and current data
+and a worker process renders the report, so the API's event loop and threads are never busy with
+Evidently. Jobs are keyed by (days, hour the window ends, reference dataset version, feature
+extractor version): a request for a report that is queued, running or already built within the
+same hour gets that job back instead of building the report again. Failed jobs are not reused.
+
+Job state lives in the process that serves the API, so with several server workers a client should
+poll the worker it submitted to (or run the API with one worker per monitor).
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import HTTPException
+
+from .feature_stats import hour_bucket
+
+logger = logging.getLogger(__name__)
+
+# Reports built at the same time, each in its own process
+DRIFT_REPORT_WORKERS = int(os.getenv("DRIFT_REPORT_WORKERS", "1"))
+# Finished jobs remembered for polling and reuse; the oldest are forgotten first
+DRIFT_REPORT_MAX_JOBS = int(os.getenv("DRIFT_REPORT_MAX_JOBS", "100"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+@dataclass
+class DriftReportJob:
+    job_id: str
+    key: Tuple[Any, ...]
+    days: int
+    status: str = "queued"
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    report_url: Optional[str] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    future: Future = field(default_factory=Future, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    @property
+    def report_path(self) -> Optional[str]:
+        # The report name that GET /monitoring/report/{report_name} serves
+        return os.path.basename(self.report_url) if self.report_url else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "days_analyzed": self.days,
+            "report_path": self.report_path,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class DriftReportJobs:
+    """Queue of drift report jobs for one monitor, deduplicated by report key."""
+
+    def __init__(
+        self,
+        monitor: Any,
+        workers: int = DRIFT_REPORT_WORKERS,
+        max_jobs: int = DRIFT_REPORT_MAX_JOBS,
+        render_executor: Optional[Executor] = None,
+    ):
+        self.monitor = monitor
+        self.workers = max(1, workers)
+        self.max_jobs = max(1, max_jobs)
+        self._runner = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="drift-report")
+        # Started on the first job; spawned, since forking copies the API's threads and connections
+        self._render_executor = render_executor
+        self._owns_render_executor = render_executor is None
+        self._jobs: "OrderedDict[str, DriftReportJob]" = OrderedDict()
+        self._by_key: Dict[Tuple[Any, ...], str] = {}
+        self._lock = threading.Lock()
+
+    def key(self, days: int) -> Tuple[Any, ...]:
+        return (
+            days,
+            hour_bucket(datetime.now()).isoformat(),
+            getattr(self.monitor, "reference_version", None),
+            self.monitor.feature_extractor.version,
+        )
+
+    def submit(self, days: int = 7) -> DriftReportJob:
+        """The job building the report for `days`: an existing one for the same key, or a new one."""
+        key = self.key(days)
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key, ""))
+            if existing is not None and existing.status != "failed":
+                return existing
+            job = DriftReportJob(job_id=uuid.uuid4().hex, key=key, days=days)
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+            self._forget_old_jobs()
+        try:
+            self._runner.submit(self._run, job)
+        except RuntimeError:
+            # Submitted after close(): the runner no longer takes work
+            self._cancel([job])
+            return job
+        logger.info(f"Queued drift report job {job.job_id} for the last {days} days")
+        return job
+
+    def get(self, job_id: str) -> Optional[DriftReportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def close(self) -> None:
+        """
+        Cancel queued jobs, failing them so that anyone waiting on them is answered; a report being
+        rendered is left to finish in its process.
+        """
+        self._runner.shutdown(wait=False, cancel_futures=True)
+        if self._owns_render_executor and self._render_executor is not None:
+            self._render_executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job.status == "queued"]
+        self._cancel(queued)
+
+    def _cancel(self, jobs: List[DriftReportJob]) -> None:
+        cancelled = []
+        with self._lock:
+            for job in jobs:
+                # A job the runner started in the meantime finishes on its own
+                if job.status == "queued":
+                    job.status, job.error, job.status_code = "failed", "Server is shutting down", 503
+                    job.finished_at = datetime.now()
+                    cancelled.append(job)
+        for job in cancelled:
+            job.future.set_result(job)
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job.job_id]
+            if self._by_key.get(job.key) == job.job_id:
+                del self._by_key[job.key]
+
+    def _render(self, reference_data: pd.DataFrame, current_data: pd.DataFrame, columns) -> bytes:
+        from .monitor import render_drift_report
+
+        with self._lock:
+            if self._render_executor is None:
+                self._render_executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            executor = self._render_executor
+        try:
+            return executor.submit(render_drift_report, reference_data, current_data, columns).result()
+        except BrokenProcessPool:
+            # A crashed worker breaks the pool for good; start a new one for the next job
+            with self._lock:
+                if self._owns_render_executor and self._render_executor is executor:
+                    self._render_executor = None
+            raise
+
+    def _run(self, job: DriftReportJob) -> None:
+        with self._lock:
+            if job.status != "queued":
+                # Cancelled by close() before the runner got to it
+                return
+            job.status, job.started_at = "running", datetime.now()
+        try:
+            job.report_url = self.monitor.generate_brain_tumor_drift_report(job.days, render=self._render)
+            job.status = "succeeded"
+        except HTTPException as e:
+            job.status, job.error, job.status_code = "failed", str(e.detail), e.status_code
+        except Exception as e:
+            logger.error(f"Drift report job {job.job_id} failed: {e}")
+            job.status, job.error, job.status_code = "failed", str(e), 500
+        job.finished_at = datetime.now()
+        logger.info(f"Drift report job {job.job_id} {job.status}")
+        job.future.set_result(job)
@@ -0,0 +1,253 @@
+"""
+Storage for drift reports and a local cache of them for serving.
+
+Reports are written to and read from a ReportStorage: Supabase Storage in deployments, or a local
+directory (REPORT_STORAGE=local) for offline development and tests. ReportCache keeps the reports
+served recently on local disk, each as the HTML plus gzip and (when the brotli package is installed)
+brotli variants compressed once when the report is fetched, within a byte budget. Reports are
+immutable once uploaded, so a cached report never goes stale; its ETag is the hash of its HTML.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+REPORT_STORAGE = os.getenv("REPORT_STORAGE", "supabase").lower()
+REPORT_STORAGE_DIR = os.getenv("REPORT_STORAGE_DIR", "monitoring/reports")
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "medview-report-cache"))
+REPORT_CACHE_MAX_MB = float(os.getenv("REPORT_CACHE_MAX_MB", "256"))
+
+# gzip 9 and brotli 9 take well under a second on a 5 MB Evidently report; brotli 11 takes ~10 s
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Preferred first when a client accepts several
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+report_cache_hits = Counter("report_cache_hits_total", "Report requests served from the local report cache")
+report_cache_misses = Counter("report_cache_misses_total", "Report requests fetched from report storage")
+report_cache_bytes = Gauge("report_cache_bytes", "Bytes of reports and their compressed variants on local disk")
+
+
+def check_report_name(name: str) -> str:
+    """Report names are plain file names; anything that could leave the storage directory is rejected."""
+    if not name or name != os.path.basename(name) or name.startswith(".") or "\\" in name:
+        raise ValueError(f"Invalid report name {name!r}")
+    return name
+
+
+class ReportStorage:
+    """Where drift reports are uploaded to and downloaded from."""
+
+    def upload(self, name: str, data: bytes, content_type: str = "text/html") -> str:
+        """Store a report and return its URL."""
+        raise NotImplementedError
+
+    def download(self, name: str) -> Optional[bytes]:
+        """The report's bytes, or None if there is no such report."""
+        raise NotImplementedError
+
+
+class SupabaseReportStorage(ReportStorage):
+    def __init__(self, client: Any, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def upload(self, name: str, data: bytes, content_type: str = "text/html") -> str:
+        storage = self.client.storage.from_(self.bucket)
+        storage.upload(check_report_name(name), data, {"content-type": content_type})
+        return storage.get_public_url(name)
+
+    def download(self, name: str) -> Optional[bytes]:
+        logger.info(f"Trying to download from Supabase bucket '{self.bucket}' with object path '{name}'")
+        return self.client.storage.from_(self.bucket).download(check_report_name(name)) or None
+
+
+class LocalReportStorage(ReportStorage):
+    def __init__(self, root: str = REPORT_STORAGE_DIR):
+        self.root = Path(root)
+
+    def upload(self, name: str, data: bytes, content_type: str = "text/html") -> str:
+        path = self.root / check_report_name(name)
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_atomic(path, data)
+        return str(path)
+
+    def download(self, name: str) -> Optional[bytes]:
+        path = self.root / check_report_name(name)
+        return path.read_bytes() if path.is_file() else None
+
+
+@dataclass
+class CachedReport:
+    name: str
+    etag: str
+    # Files by content encoding, "identity" for the HTML itself
+    paths: Dict[str, Path] = field(default_factory=dict)
+    size: int = 0
+
+    def etag_for(self, encoding: str) -> str:
+        # Each encoding is a different representation, so it gets its own strong ETag
+        return self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+
+    def select(self, accept_encoding: Optional[str]) -> str:
+        """The stored encoding to send for an Accept-Encoding header."""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            coding, _, params = part.partition(";")
+            _, _, q = params.strip().partition("q=")
+            try:
+                if q and float(q) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(coding.strip().lower())
+        for encoding in ENCODING_SUFFIXES:
+            if encoding in self.paths and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names one of this report's representations."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or any(self.etag_for(encoding) in tags for encoding in self.paths)
+
+
+class ReportCache:
+    """Byte-budgeted LRU cache of reports and their precompressed variants on local disk."""
+
+    def __init__(
+        self,
+        storage: ReportStorage,
+        cache_dir: str = REPORT_CACHE_DIR,
+        max_bytes: int = int(REPORT_CACHE_MAX_MB * 2**20),
+    ):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        # One directory per process, so workers never evict files another one is serving;
+        # left over from an earlier run with the same pid, it is stale
+        self.cache_dir = Path(cache_dir) / str(os.getpid())
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[str, CachedReport]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # One download per report at a time, however many requests ask for it
+        self._loading: Dict[str, threading.Lock] = {}
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, name: str) -> Optional[CachedReport]:
+        """The cached report, fetched from storage and compressed on a miss; None if it does not exist."""
+        check_report_name(name)
+        entry = self._lookup(name)
+        if entry is not None:
+            report_cache_hits.inc()
+            return entry
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            entry = self._lookup(name)
+            if entry is not None:
+                report_cache_hits.inc()
+                return entry
+            report_cache_misses.inc()
+            try:
+                data = self.storage.download(name)
+                return self._store(name, data) if data is not None else None
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+
+    def open(self, report: CachedReport, encoding: str) -> Optional[BinaryIO]:
+        """
+        The file of one of the report's variants, opened for reading; None if the report no longer exists.
+        It is opened under the lock eviction unlinks under, and an open file stays readable once unlinked.
+        A report evicted since get() is fetched again: reports are immutable, so it has the same files.
+        """
+        while True:
+            with self._lock:
+                try:
+                    return report.paths[encoding].open("rb")
+                except FileNotFoundError:
+                    pass
+            report = self.get(report.name)
+            if report is None:
+                return None
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in list(self._entries):
+                self._remove(name)
+
+    def _lookup(self, name: str) -> Optional[CachedReport]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+            return entry
+
+    def _store(self, name: str, data: bytes) -> CachedReport:
+        digest = hashlib.sha256(data).hexdigest()
+        entry = CachedReport(name=name, etag=f'"{digest[:32]}"')
+        variants = {"identity": data, "gzip": gzip.compress(data, GZIP_LEVEL, mtime=0)}
+        try:
+            import brotli
+
+            variants["br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+        except ImportError:
+            pass
+        # Named after the content, so a file is never rewritten while it is being sent
+        stem = self.cache_dir / digest
+        for encoding, content in variants.items():
+            path = stem.with_suffix(ENCODING_SUFFIXES.get(encoding, ".html"))
+            _write_atomic(path, content)
+            entry.paths[encoding] = path
+            entry.size += len(content)
+        logger.info(
+            "Cached report %s: %s",
+            name,
+            ", ".join(f"{encoding} {len(content)} bytes" for encoding, content in variants.items()),
+        )
+        with self._lock:
+            if name in self._entries:
+                self._remove(name)
+            self._entries[name] = entry
+            self._bytes += entry.size
+            # The newest report stays, even when it alone is over the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+            report_cache_bytes.set(self._bytes)
+        return entry
+
+    def _remove(self, name: str) -> None:
+        entry = self._entries.pop(name)
+        self._bytes -= entry.size
+        if not any(other.etag == entry.etag for other in self._entries.values()):
+            for path in entry.paths.values():
+                path.unlink(missing_ok=True)
+        report_cache_bytes.set(self._bytes)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
@@ -0,0 +1,43 @@
+"""
+Uniform sampling of query results that are too large to load, for drift analysis.
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def reservoir_sample(chunks: Iterable[pd.DataFrame], size: int, seed: Optional[int] = None) -> pd.DataFrame:
+    """
+    A uniform sample of at most `size` rows from a stream of DataFrame chunks (Algorithm R), holding
+    only the sample and the current chunk in memory. Row order in the sample is arbitrary.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir: Optional[pd.DataFrame] = None
+    seen = 0
+    for chunk in chunks:
+        if reservoir is None:
+            reservoir = chunk.iloc[:0]
+        fill = max(0, min(size - len(reservoir), len(chunk)))
+        if fill:
+            reservoir = pd.concat([reservoir, chunk.iloc[:fill]], ignore_index=True)
+            seen += fill
+            chunk = chunk.iloc[fill:]
+        if chunk.empty:
+            continue
+
+        # Row t (1-based over the whole stream) replaces a uniform slot with probability size / t
+        positions = seen + 1 + np.arange(len(chunk))
+        slots = (rng.random(len(chunk)) * positions).astype(np.int64)
+        accepted = np.flatnonzero(slots < size)
+        seen += len(chunk)
+        if not accepted.size:
+            continue
+        # When rows of one chunk pick the same slot, the later one wins, as in the sequential algorithm
+        winners = pd.Series(accepted, index=slots[accepted]).groupby(level=0).last()
+        reservoir = pd.concat(
+            [reservoir.drop(index=winners.index), chunk.iloc[winners.to_numpy()]],
+            ignore_index=True,
+        )
+    return reservoir if reservoir is not None else pd.DataFrame()
@@ -0,0 +1,94 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend.src.batching import PredictionBatcher
+
+
+def make_image(value):
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+class RecordingRunner:
+    def __init__(self, delay=0.0, fail=False):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, images):
+        self.batches.append(len(images))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ValueError("model exploded")
+        return [int(image[0, 0, 0]) for image in images]
+
+
+class TestPredictionBatcher:
+    def test_concurrent_requests_share_one_batch(self):
+        runner = RecordingRunner()
+
+        async def scenario():
+            batcher = PredictionBatcher(runner, max_batch_size=8, max_wait_ms=50)
+            batcher.start()
+            results = await asyncio.gather(*(batcher.submit(make_image(i)) for i in range(5)))
+            await batcher.stop()
+            return results
+
+        results = asyncio.run(scenario())
+        assert results == [0, 1, 2, 3, 4]
+        assert runner.batches == [5]
+
+    def test_batches_are_capped_at_max_batch_size(self):
+        runner = RecordingRunner()
+
+        async def scenario():
+            batcher = PredictionBatcher(runner, max_batch_size=2, max_wait_ms=50)
+            batcher.start()
+            results = await asyncio.gather(*(batcher.submit(make_image(i)) for i in range(5)))
+            await batcher.stop()
+            return results
+
+        results = asyncio.run(scenario())
+        assert results == [0, 1, 2, 3, 4]
+        assert runner.batches == [2, 2, 1]
+
+    def test_lone_request_waits_at_most_max_wait(self):
+        runner = RecordingRunner()
+
+        async def scenario():
+            batcher = PredictionBatcher(runner, max_batch_size=8, max_wait_ms=20)
+            batcher.start()
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            result = await batcher.submit(make_image(7))
+            elapsed = loop.time() - started
+            await batcher.stop()
+            return result, elapsed
+
+        result, elapsed = asyncio.run(scenario())
+        assert result == 7
+        assert elapsed < 1.0
+        assert runner.batches == [1]
+
+    def test_batch_failure_is_raised_to_every_caller(self):
+        runner = RecordingRunner(fail=True)
+
+        async def scenario():
+            batcher = PredictionBatcher(runner, max_batch_size=4, max_wait_ms=20)
+            batcher.start()
+            results = await asyncio.gather(
+                *(batcher.submit(make_image(i)) for i in range(3)),
+                return_exceptions=True,
+            )
+            await batcher.stop()
+            return results
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(r, ValueError) for r in results)
+
+    def test_submit_before_start_raises(self):
+        batcher = PredictionBatcher(RecordingRunner())
+        with pytest.raises(RuntimeError):
+            asyncio.run(batcher.submit(make_image(0)))
@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from backend.src.api import app
+from monitoring.core.report_jobs import DriftReportJobs
+
+
+class FakeMonitor:
+    def __init__(self):
+        self.feature_extractor = SimpleNamespace(version="v1")
+        self.reference_version = "abc123"
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = 0
+        self.fail = None
+
+    def generate_brain_tumor_drift_report(self, days, render):
+        self.calls += 1
+        self.release.wait(10)
+        if self.fail is not None:
+            raise self.fail
+        return f"https://storage.example/reports/brain_tumor_drift_report_{days}.html"
+
+
+@pytest.fixture
+def monitor():
+    """A fake monitor with its report jobs on app.state, restored after the test."""
+    saved = dict(app.state._state)
+    monitor = FakeMonitor()
+    app.state.monitor = monitor
+    app.state.report_jobs = DriftReportJobs(monitor, render_executor=ThreadPoolExecutor(max_workers=1))
+    yield monitor
+    app.state.report_jobs.close()
+    app.state._state.clear()
+    app.state._state.update(saved)
+
+
+def test_post_returns_a_job_to_poll(monitor):
+    client = TestClient(app)
+    monitor.release.clear()
+    response = client.post("/monitoring/drift-report?days=3")
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "running")
+    assert job["status_url"] == f"/monitoring/drift-report/jobs/{job['job_id']}"
+
+    # A second request for the same window gets the same job
+    assert client.post("/monitoring/drift-report?days=3").json()["job_id"] == job["job_id"]
+    monitor.release.set()
+    app.state.report_jobs.get(job["job_id"]).future.result(timeout=10)
+
+    status = client.get(job["status_url"]).json()
+    assert status["status"] == "succeeded"
+    assert status["report_path"] == "brain_tumor_drift_report_3.html"
+    assert client.post("/monitoring/drift-report?days=3").status_code == 200
+    assert monitor.calls == 1
+
+
+def test_unknown_job_is_not_found(monitor):
+    response = TestClient(app).get("/monitoring/drift-report/jobs/nope")
+    assert response.status_code == 404
+
+
+def test_get_waits_for_the_report_and_reuses_it(monitor):
+    client = TestClient(app)
+    for _ in range(2):
+        response = client.get("/monitoring/drift-report?days=7")
+        assert response.status_code == 200
+        assert response.json() == {
+            "message": "Brain tumor drift report generated successfully",
+            "report_path": "brain_tumor_drift_report_7.html",
+            "days_analyzed": 7,
+        }
+    assert monitor.calls == 1
+
+
+def test_get_reports_a_failed_job(monitor):
+    monitor.fail = HTTPException(status_code=500, detail="Error generating brain tumor drift report")
+    response = TestClient(app).get("/monitoring/drift-report?days=7")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Error generating brain tumor drift report"
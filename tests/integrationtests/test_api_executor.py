@@ -0,0 +1,137 @@
+import asyncio
+import io
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend.src.api import app
+from backend.src.executor import InferenceExecutor, InferenceQueueFullError
+
+client = TestClient(app)
+
+
+class TestInferenceExecutor:
+    def test_each_call_gets_its_own_predictor(self):
+        created = []
+
+        def factory():
+            created.append(object())
+            return created[-1]
+
+        barrier = threading.Barrier(2, timeout=5)
+        seen = []
+
+        def work(model=None):
+            seen.append(model)
+            barrier.wait()
+            return model
+
+        async def scenario():
+            executor = InferenceExecutor(factory, workers=2, max_queue=0)
+            try:
+                return await asyncio.gather(executor.predict(work), executor.predict(work))
+            finally:
+                executor.shutdown()
+
+        results = asyncio.run(scenario())
+        assert len(created) == 2
+        assert set(map(id, results)) == set(map(id, created))
+
+    def test_predictors_are_rebuilt_when_the_version_changes(self):
+        version = ["v1"]
+        built = []
+
+        def factory():
+            built.append(version[0])
+            return version[0]
+
+        async def scenario():
+            executor = InferenceExecutor(factory, workers=1, max_queue=0, version=lambda: version[0])
+            try:
+                first = await executor.predict(lambda model=None: model)
+                version[0] = "v2"
+                return first, await executor.predict(lambda model=None: model)
+            finally:
+                executor.shutdown()
+
+        assert asyncio.run(scenario()) == ("v1", "v2")
+        assert built == ["v1", "v2"]
+
+    def test_rejects_work_beyond_capacity(self):
+        release = threading.Event()
+
+        def block():
+            release.wait(5)
+            return "done"
+
+        async def scenario():
+            executor = InferenceExecutor(lambda: None, workers=1, max_queue=1)
+            try:
+                running = [asyncio.ensure_future(executor.run(block)) for _ in range(2)]
+                await asyncio.sleep(0)
+                with pytest.raises(InferenceQueueFullError):
+                    await executor.run(block)
+                release.set()
+                return await asyncio.gather(*running)
+            finally:
+                executor.shutdown()
+
+        assert asyncio.run(scenario()) == ["done", "done"]
+
+    def test_waiting_calls_run_when_a_slot_frees_up(self):
+        release = threading.Event()
+
+        def block():
+            release.wait(5)
+            return "done"
+
+        async def scenario():
+            executor = InferenceExecutor(lambda: None, workers=1, max_queue=0)
+            try:
+                running = asyncio.ensure_future(executor.run(block))
+                await asyncio.sleep(0)
+                waiting = asyncio.ensure_future(executor.run_waiting(lambda: "waited"))
+                await asyncio.sleep(0.05)
+                assert not waiting.done()
+                release.set()
+                return await asyncio.gather(running, waiting)
+            finally:
+                executor.shutdown()
+
+        assert asyncio.run(scenario()) == ["done", "waited"]
+
+
+class FullExecutor:
+    async def run(self, fn, *args, **kwargs):
+        raise InferenceQueueFullError("full")
+
+    async def predict(self, fn, *args):
+        raise InferenceQueueFullError("full")
+
+
+class TestPredictBackpressure:
+    def test_predict_returns_503_when_queue_is_full(self):
+        test_image = Image.new("RGB", (100, 100), color="red")
+        img_byte_arr = io.BytesIO()
+        test_image.save(img_byte_arr, format="JPEG")
+        app.state.inference_executor = FullExecutor()
+        try:
+            response = client.post(
+                "/predict",
+                files={"file": ("test.jpg", img_byte_arr.getvalue(), "image/jpeg")},
+            )
+        finally:
+            del app.state.inference_executor
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert "busy" in response.json()["detail"]
+
+    def test_health_is_served_while_inference_is_saturated(self):
+        app.state.inference_executor = FullExecutor()
+        try:
+            response = client.get("/health")
+        finally:
+            del app.state.inference_executor
+        assert response.status_code == 200
@@ -70,3 +70,138 @@ class TestPredictEndpoint:
             data = response.json()
             assert "Prediction failed" in data["detail"]
             mock_predict.assert_called_once()
+
+
+def fake_detections(images, model=None):
+    import torch
+    from ultralytics.engine.results import Results
+
+    boxes = torch.tensor([[5.0, 6.0, 50.0, 60.0, 0.8, 0.0]])
+    return [Results(image, path="", names={0: "negative", 1: "positive"}, boxes=boxes) for image in images]
+
+
+class TestPredictJsonMode:
+    def _image_bytes(self):
+        img_byte_arr = io.BytesIO()
+        Image.new("RGB", (100, 100), color="red").save(img_byte_arr, format="JPEG")
+        return img_byte_arr.getvalue()
+
+    def test_format_query_returns_detections_without_rendering(self):
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections), patch(
+            "backend.src.predict_helpers.get_prediction_from_array"
+        ) as mock_render_path, patch("ultralytics.engine.results.Results.plot") as mock_plot:
+            response = client.post(
+                "/predict?format=json",
+                files={"file": ("test.jpg", self._image_bytes(), "image/jpeg")},
+            )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        data = response.json()
+        assert data["num_detections"] == 1
+        assert data["detections"][0]["box"] == [5.0, 6.0, 50.0, 60.0]
+        assert data["detections"][0]["class_name"] == "negative"
+        mock_render_path.assert_not_called()
+        mock_plot.assert_not_called()
+
+    def test_accept_header_selects_json(self):
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections):
+            response = client.post(
+                "/predict",
+                files={"file": ("test.jpg", self._image_bytes(), "image/jpeg")},
+                headers={"Accept": "application/json"},
+            )
+        assert response.status_code == 200
+        assert response.json()["num_detections"] == 1
+
+    def test_image_accept_header_keeps_jpeg(self):
+        with patch("backend.src.predict_helpers.get_prediction_from_array") as mock_predict:
+            mock_predict.return_value = (np.full((100, 100, 3), 128, dtype=np.uint8), "dummy_result")
+            response = client.post(
+                "/predict",
+                files={"file": ("test.jpg", self._image_bytes(), "image/jpeg")},
+                headers={"Accept": "image/jpeg, application/json;q=0.5"},
+            )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+
+    def test_unknown_format_returns_400(self):
+        response = client.post(
+            "/predict?format=xml",
+            files={"file": ("test.jpg", self._image_bytes(), "image/jpeg")},
+        )
+        assert response.status_code == 400
+
+    def test_large_jpeg_is_decoded_reduced_and_boxes_map_to_upload(self):
+        img_byte_arr = io.BytesIO()
+        Image.new("RGB", (2000, 1400), color="red").save(img_byte_arr, format="JPEG")
+        seen_shapes = []
+
+        def detections(images, model=None):
+            seen_shapes.extend(image.shape[:2] for image in images)
+            return fake_detections(images, model)
+
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=detections):
+            response = client.post(
+                "/predict?format=json",
+                files={"file": ("large.jpg", img_byte_arr.getvalue(), "image/jpeg")},
+            )
+        assert response.status_code == 200
+        # Decoded at half resolution, reported in the coordinates of the uploaded image
+        assert seen_shapes == [(700, 1000)]
+        data = response.json()
+        assert data["image_size"] == [2000, 1400]
+        assert data["detections"][0]["box"] == [10.0, 12.0, 100.0, 120.0]
+
+    def test_monitor_logs_reduced_decodes_at_full_resolution(self):
+        img_byte_arr = io.BytesIO()
+        Image.new("RGB", (2000, 1400), color="red").save(img_byte_arr, format="JPEG")
+        logged_shapes = []
+
+        class FakeMonitor:
+            def log_prediction(self, image, prediction):
+                logged_shapes.append(image.shape)
+
+        app.state.monitor = FakeMonitor()
+        try:
+            with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections):
+                response = client.post(
+                    "/predict?format=json",
+                    files={"file": ("large.jpg", img_byte_arr.getvalue(), "image/jpeg")},
+                )
+        finally:
+            del app.state.monitor
+        assert response.status_code == 200
+        # The reference snapshot holds full-resolution images, so the monitor sees the upload as sent
+        assert logged_shapes == [(1400, 2000, 3)]
+
+
+class TestImageEncoding:
+    def _predict(self, url="/predict", headers=None):
+        img_byte_arr = io.BytesIO()
+        Image.new("RGB", (100, 100), color="red").save(img_byte_arr, format="JPEG")
+        with patch("backend.src.predict_helpers.get_prediction_from_array") as mock_predict:
+            mock_predict.return_value = (np.full((100, 100, 3), 128, dtype=np.uint8), "dummy_result")
+            return client.post(
+                url, files={"file": ("test.jpg", img_byte_arr.getvalue(), "image/jpeg")}, headers=headers
+            )
+
+    def test_default_is_jpeg_with_content_length(self):
+        response = self._predict()
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert response.content[:2] == b"\xff\xd8"
+
+    def test_accept_header_selects_webp(self):
+        response = self._predict(headers={"Accept": "image/webp, image/jpeg;q=0.8"})
+        assert response.headers["content-type"] == "image/webp"
+        assert response.content[8:12] == b"WEBP"
+
+    def test_accept_header_respects_q_values(self):
+        response = self._predict(headers={"Accept": "image/jpeg;q=0.5, image/png"})
+        assert response.headers["content-type"] == "image/png"
+        assert response.content[:8] == b"\x89PNG\r\n\x1a\n"
+
+    def test_format_query_selects_encoder(self):
+        response = self._predict(url="/predict?format=webp", headers={"Accept": "image/png"})
+        assert response.headers["content-type"] == "image/webp"
@@ -0,0 +1,149 @@
+import asyncio
+import io
+import json
+import threading
+import zipfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+from starlette.datastructures import Headers
+from ultralytics.engine.results import Results
+
+from backend.src import predict_helpers
+from backend.src.api import app
+from backend.src.executor import InferenceExecutor
+from backend.src.predict_helpers import BATCH_PREDICT_WINDOW
+
+client = TestClient(app)
+
+
+def jpeg_bytes(color="red", size=(100, 100)):
+    img_byte_arr = io.BytesIO()
+    Image.new("RGB", size, color=color).save(img_byte_arr, format="JPEG")
+    return img_byte_arr.getvalue()
+
+
+def fake_batch_prediction(images, model=None):
+    results = []
+    for image in images:
+        boxes = torch.tensor([[10.0, 20.0, 30.0, 40.0, 0.9, 1.0]])
+        results.append(Results(image, path="", names={0: "negative", 1: "positive"}, boxes=boxes))
+    return results
+
+
+def parse_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+class TestPredictBatchEndpoint:
+    def test_multiple_files_stream_one_line_each(self):
+        files = [("files", (f"slice{i}.jpg", jpeg_bytes(), "image/jpeg")) for i in range(3)]
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction):
+            response = client.post("/predict/batch", files=files)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = parse_ndjson(response)
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        assert {line["filename"] for line in lines} == {"slice0.jpg", "slice1.jpg", "slice2.jpg"}
+        detection = lines[0]["detections"][0]
+        assert lines[0]["num_detections"] == 1
+        assert detection["box"] == [10.0, 20.0, 30.0, 40.0]
+        assert detection["class_name"] == "positive"
+        assert abs(detection["confidence"] - 0.9) < 1e-4
+
+    def test_zip_archive_is_expanded(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("study/a.jpg", jpeg_bytes("red"))
+            zf.writestr("study/b.png", jpeg_bytes("blue"))
+            zf.writestr("study/notes.txt", b"not an image")
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction):
+            response = client.post(
+                "/predict/batch", files=[("files", ("study.zip", archive.getvalue(), "application/zip"))]
+            )
+        assert response.status_code == 200
+        lines = parse_ndjson(response)
+        assert {line["filename"] for line in lines} == {"study/a.jpg", "study/b.png"}
+        assert all("error" not in line for line in lines)
+
+    def test_invalid_files_are_reported_per_line(self):
+        files = [
+            ("files", ("good.jpg", jpeg_bytes(), "image/jpeg")),
+            ("files", ("bad.jpg", b"not really a jpeg", "image/jpeg")),
+            ("files", ("notes.txt", b"text", "text/plain")),
+        ]
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction):
+            response = client.post("/predict/batch", files=files)
+        assert response.status_code == 200
+        lines = {line["filename"]: line for line in parse_ndjson(response)}
+        assert lines["good.jpg"]["num_detections"] == 1
+        assert lines["bad.jpg"]["error"] == "Invalid image file"
+        assert lines["notes.txt"]["error"] == "File must be an image"
+
+    def test_invalid_zip_is_reported(self):
+        response = client.post("/predict/batch", files=[("files", ("broken.zip", b"PK-not-a-zip", "application/zip"))])
+        assert response.status_code == 200
+        assert parse_ndjson(response) == [{"index": 0, "filename": "broken.zip", "error": "Invalid zip archive"}]
+
+    def test_images_are_predicted_in_one_batch_per_window(self):
+        count = BATCH_PREDICT_WINDOW + 2
+        files = [("files", (f"slice{i}.jpg", jpeg_bytes(size=(100 + i, 100)), "image/jpeg")) for i in range(count)]
+        with patch(
+            "backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction
+        ) as predict:
+            response = client.post("/predict/batch", files=files)
+        assert [len(call.args[0]) for call in predict.call_args_list] == [BATCH_PREDICT_WINDOW, 2]
+        lines = {line["index"]: line for line in parse_ndjson(response)}
+        assert [lines[i]["image_size"] for i in range(count)] == [[100 + i, 100] for i in range(count)]
+
+    def test_full_executor_makes_the_upload_wait_instead_of_failing(self):
+        files = [("files", (f"slice{i}.jpg", jpeg_bytes(size=(100 + i, 100)), "image/jpeg")) for i in range(4)]
+        app.state.inference_executor = InferenceExecutor(lambda: None, workers=1, max_queue=0)
+        try:
+            with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction):
+                response = client.post("/predict/batch", files=files)
+        finally:
+            app.state.inference_executor.shutdown()
+            del app.state.inference_executor
+        lines = parse_ndjson(response)
+        assert len(lines) == 4
+        assert all(line["num_detections"] == 1 for line in lines)
+
+    def test_monitoring_runs_after_the_lines_are_sent(self):
+        release = threading.Event()
+        logged = []
+
+        class SlowMonitor:
+            def log_prediction(self, image, prediction):
+                release.wait(5)
+                logged.append(image.shape)
+
+        request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(monitor=SlowMonitor())))
+        files = [
+            UploadFile(
+                io.BytesIO(jpeg_bytes()), filename=f"slice{i}.jpg", headers=Headers({"content-type": "image/jpeg"})
+            )
+            for i in range(2)
+        ]
+
+        async def scenario():
+            lines = [line async for line in predict_helpers.stream_batch_predictions(request, files)]
+            # Every line was sent while the monitor was still busy
+            assert logged == []
+            release.set()
+            await asyncio.gather(*predict_helpers._batch_logging_tasks)
+            return lines
+
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_batch_prediction):
+            lines = asyncio.run(scenario())
+        assert len(lines) == 2
+        assert logged == [(100, 100, 3), (100, 100, 3)]
+
+    def test_no_files_returns_422(self):
+        response = client.post("/predict/batch")
+        assert response.status_code == 422
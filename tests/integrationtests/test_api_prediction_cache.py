@@ -0,0 +1,105 @@
+import io
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+from ultralytics.engine.results import Results
+
+from backend.src.api import app
+from backend.src.prediction_cache import PredictionCache
+
+client = TestClient(app)
+
+DETECTIONS = {"image_size": [100, 100], "num_detections": 0, "detections": []}
+INFO = {"confidence": 0.0, "class": "-1", "num_detections": 0, "model_version": "yolov8n"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPredictionCache:
+    def test_key_depends_on_contents_and_model_version(self):
+        assert PredictionCache.key(b"scan", "v1") == PredictionCache.key(b"scan", "v1")
+        assert PredictionCache.key(b"scan", "v1") != PredictionCache.key(b"scan", "v2")
+        assert PredictionCache.key(b"scan", "v1") != PredictionCache.key(b"other", "v1")
+
+    def test_entries_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = PredictionCache(ttl_seconds=10, clock=clock)
+        cache.put("a", DETECTIONS, INFO)
+        clock.now = 9.0
+        assert cache.get("a").detections == DETECTIONS
+        clock.now = 10.0
+        assert cache.get("a") is None
+        assert len(cache) == 0
+        assert cache.size_bytes == 0
+
+    def test_evicts_least_recently_used_within_byte_budget(self):
+        cache = PredictionCache(max_bytes=2500)
+        cache.put("a", DETECTIONS, INFO, media_type="image/jpeg", image=b"x" * 1000)
+        cache.put("b", DETECTIONS, INFO, media_type="image/jpeg", image=b"x" * 1000)
+        cache.get("a")
+        cache.put("c", DETECTIONS, INFO, media_type="image/jpeg", image=b"x" * 1000)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.size_bytes <= 2500
+
+    def test_image_lookup_misses_until_that_format_is_stored(self):
+        cache = PredictionCache()
+        cache.put("a", DETECTIONS, INFO)
+        assert cache.get("a", media_type="image/jpeg") is None
+        cache.put("a", DETECTIONS, INFO, media_type="image/jpeg", image=b"jpeg")
+        cache.put("a", DETECTIONS, INFO)
+        assert cache.get("a", media_type="image/jpeg").images["image/jpeg"] == b"jpeg"
+        assert cache.get("a", media_type="image/webp") is None
+
+
+def image_bytes(color="red"):
+    img_byte_arr = io.BytesIO()
+    Image.new("RGB", (100, 100), color=color).save(img_byte_arr, format="JPEG")
+    return img_byte_arr.getvalue()
+
+
+def fake_detections(images, model=None):
+    boxes = torch.tensor([[5.0, 6.0, 50.0, 60.0, 0.8, 0.0]])
+    return [Results(image, path="", names={0: "negative", 1: "positive"}, boxes=boxes) for image in images]
+
+
+class TestPredictWithCache:
+    def setup_method(self):
+        app.state.prediction_cache = PredictionCache()
+
+    def teardown_method(self):
+        del app.state.prediction_cache
+
+    def test_repeated_upload_is_served_from_cache(self):
+        with patch("backend.src.predict_helpers.get_prediction_from_array") as mock_predict:
+            mock_predict.return_value = (np.full((100, 100, 3), 128, dtype=np.uint8), "dummy_result")
+            first = client.post("/predict", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+            second = client.post("/predict", files={"file": ("b.jpg", image_bytes(), "image/jpeg")})
+            third = client.post("/predict", files={"file": ("c.jpg", image_bytes("blue"), "image/jpeg")})
+        assert first.status_code == second.status_code == third.status_code == 200
+        assert second.headers["content-type"] == "image/jpeg"
+        assert first.content == second.content
+        assert mock_predict.call_count == 2
+
+    def test_json_hit_and_image_miss_after_json_request(self):
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections) as mock_batch:
+            first = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+            second = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+        assert first.json() == second.json()
+        assert second.json()["num_detections"] == 1
+        assert mock_batch.call_count == 1
+
+        with patch("backend.src.predict_helpers.get_prediction_from_array") as mock_predict:
+            mock_predict.return_value = (np.full((100, 100, 3), 128, dtype=np.uint8), "dummy_result")
+            response = client.post("/predict", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+        assert response.headers["content-type"] == "image/jpeg"
+        mock_predict.assert_called_once()
@@ -0,0 +1,69 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.src.api import app
+from monitoring.core.report_store import LocalReportStorage, ReportCache
+
+HTML = b"<html><body>" + b"<p>drift</p>" * 5000 + b"</body></html>"
+
+
+@pytest.fixture
+def client(tmp_path):
+    """A client whose report cache reads from a local report directory, restored after the test."""
+    saved = dict(app.state._state)
+    storage = LocalReportStorage(str(tmp_path / "reports"))
+    storage.upload("brain_tumor_drift_report_1.html", HTML)
+    app.state.report_cache = ReportCache(storage, cache_dir=str(tmp_path / "cache"))
+    yield TestClient(app)
+    app.state._state.clear()
+    app.state._state.update(saved)
+
+
+def test_report_is_served_compressed_with_an_etag(client):
+    response = client.get("/monitoring/report/brain_tumor_drift_report_1.html", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"] == "text/html; charset=utf-8"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(gzip.compress(HTML, 9, mtime=0))
+    assert response.content == HTML
+
+
+def test_uncompressed_report_for_clients_without_gzip(client):
+    response = client.get("/monitoring/report/brain_tumor_drift_report_1.html", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == HTML
+
+
+def test_matching_etag_is_not_modified(client):
+    url = "/monitoring/report/brain_tumor_drift_report_1.html"
+    etag = client.get(url, headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_report_evicted_before_it_is_sent_is_still_served(client, monkeypatch):
+    cache = app.state.report_cache
+    get = cache.get
+
+    def get_then_evict(name):
+        report = get(name)
+        cache.clear()
+        monkeypatch.setattr(cache, "get", get)
+        return report
+
+    monkeypatch.setattr(cache, "get", get_then_evict)
+    response = client.get("/monitoring/report/brain_tumor_drift_report_1.html", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.content == HTML
+    assert len(cache) == 1
+
+
+def test_missing_report_is_not_found(client):
+    assert client.get("/monitoring/report/brain_tumor_drift_report_2.html").status_code == 404
+    assert client.get("/monitoring/report/..%2Fsecret.html").status_code == 404
@@ -0,0 +1,143 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+from ultralytics.engine.results import Results
+
+import backend.src.api as api
+import backend.src.predict_helpers as predict_helpers
+from backend.src.api import app
+
+
+def image_bytes():
+    img_byte_arr = io.BytesIO()
+    Image.new("RGB", (100, 100), color="red").save(img_byte_arr, format="JPEG")
+    return img_byte_arr.getvalue()
+
+
+def fake_detections(images, model=None):
+    boxes = torch.tensor([[5.0, 6.0, 50.0, 60.0, 0.8, 0.0]])
+    return [Results(image, path="", names={0: "negative", 1: "positive"}, boxes=boxes) for image in images]
+
+
+class FakeMonitor:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class DoneTask:
+    def done(self):
+        return True
+
+
+@pytest.fixture
+def app_state():
+    """Restore app.state after a test that runs the lifespan or sets startup attributes."""
+    saved = dict(app.state._state)
+    yield app.state
+    app.state._state.clear()
+    app.state._state.update(saved)
+    api.model_registry.clear()
+
+
+def test_heavy_dependencies_are_not_imported_with_the_api():
+    modules = ("evidently", "google.cloud.storage", "supabase", "torch", "ultralytics")
+    code = f"import sys, backend.src.api; print([m for m in {modules!r} if m in sys.modules])"
+    env = dict(os.environ, DATABASE_URL="postgresql://u:p@localhost:5432/db")
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+
+def test_onnx_thread_budget_does_not_import_torch():
+    code = (
+        "import sys, ml.predict as p; p.set_inference_threads(3); print('torch' in sys.modules, p._inference_threads)"
+    )
+    env = dict(os.environ, MODEL_PATH="models/best.onnx")
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ["False", "3"]
+
+
+def test_predict_is_served_while_the_monitor_starts(app_state, monkeypatch):
+    ready = threading.Event()
+    monitor = FakeMonitor()
+
+    def slow_monitor(database_url):
+        ready.wait(timeout=30)
+        return monitor
+
+    monkeypatch.setattr(api, "create_monitor", slow_monitor)
+    monkeypatch.setattr(api.model_registry, "loader", lambda path: object())
+    with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections):
+        with TestClient(app) as client:
+            response = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+            assert response.status_code == 200
+            assert response.json()["num_detections"] == 1
+
+            dashboard = client.get("/monitoring/dashboard")
+            assert dashboard.status_code == 503
+            assert dashboard.headers["retry-after"] == "10"
+
+            ready.set()
+            deadline = time.monotonic() + 10
+            while getattr(app.state, "monitor", None) is not monitor and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert app.state.monitor is monitor
+        # Shutting down writes the buffered prediction logs
+        assert monitor.closed
+
+
+def test_only_the_executor_models_are_loaded(app_state, monkeypatch):
+    loaded = []
+    monkeypatch.setattr(api, "create_monitor", lambda database_url: FakeMonitor())
+    monkeypatch.setattr(api.model_registry, "loader", lambda path: loaded.append(path) or object())
+    with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections):
+        with TestClient(app) as client:
+            response = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+            assert response.status_code == 200
+    # One model per inference worker and no shared copy next to them
+    assert len(loaded) == api.INFERENCE_WORKERS
+    assert len(api.model_registry) == 0
+
+
+def test_swapped_weights_serve_and_cache_under_the_new_version(app_state, monkeypatch, tmp_path):
+    weights = tmp_path / "model.pt"
+    weights.write_bytes(b"weights-v1")
+    for module in (api, predict_helpers):
+        monkeypatch.setattr(module, "MODEL_PATH", str(weights))
+    monkeypatch.setattr(api, "create_monitor", lambda database_url: FakeMonitor())
+    monkeypatch.setattr(api.model_registry, "loader", lambda path: open(path, "rb").read())
+    served = []
+
+    def detections(images, model=None):
+        served.append(model)
+        return fake_detections(images, model)
+
+    upload = image_bytes()
+    with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=detections):
+        with TestClient(app) as client:
+            client.post("/predict?format=json", files={"file": ("a.jpg", upload, "image/jpeg")})
+            weights.write_bytes(b"weights-v2, retrained")
+            response = client.post("/predict?format=json", files={"file": ("a.jpg", upload, "image/jpeg")})
+            cache = app.state.prediction_cache
+            new_version = api.model_registry.version(str(weights))
+
+    assert response.status_code == 200
+    assert served[-1] == b"weights-v2, retrained"
+    assert cache.get(cache.key(upload, new_version)) is not None
+
+
+def test_monitoring_endpoints_fail_when_the_monitor_did_not_start(app_state):
+    app_state.monitor_task = DoneTask()
+    response = TestClient(app).get("/monitoring/dashboard")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Monitor not initialized"
@@ -0,0 +1,74 @@
+import io
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+from ultralytics.engine.results import Results
+
+from backend.src.api import app
+from backend.src.timing import StageTimer
+
+client = TestClient(app)
+
+
+def image_bytes():
+    img_byte_arr = io.BytesIO()
+    Image.new("RGB", (100, 100), color="red").save(img_byte_arr, format="JPEG")
+    return img_byte_arr.getvalue()
+
+
+def fake_detections(images, model=None):
+    boxes = torch.tensor([[5.0, 6.0, 50.0, 60.0, 0.8, 0.0]])
+    speed = {"preprocess": 2.0, "inference": 30.0, "postprocess": 1.0}
+    return [Results(image, path="", names={0: "negative", 1: "positive"}, boxes=boxes, speed=speed) for image in images]
+
+
+class TestStageTimer:
+    def test_model_stages_are_split_from_the_wait(self):
+        timer = StageTimer("v1")
+        result = Results(
+            np.zeros((4, 4, 3), dtype=np.uint8),
+            path="",
+            names={},
+            speed={"preprocess": 2.0, "inference": 30.0, "postprocess": None},
+        )
+        timer.add_model_stages(result, 0.050)
+        assert timer.stages["preprocess"] == 0.002
+        assert timer.stages["inference"] == 0.030
+        assert "postprocess" not in timer.stages
+        assert abs(timer.stages["queue"] - 0.018) < 1e-9
+
+    def test_wait_without_speed_counts_as_inference(self):
+        timer = StageTimer("v1")
+        timer.add_model_stages("dummy_result", 0.05)
+        assert timer.stages == {"inference": 0.05}
+
+    def test_server_timing_lists_stages_and_total(self):
+        timer = StageTimer("v1")
+        timer.add("decode", 0.0125)
+        header = timer.server_timing()
+        assert header.startswith("decode;dur=12.50, total;dur=")
+
+
+class TestPredictTiming:
+    def test_stage_latencies_are_exported(self):
+        with patch("backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections):
+            response = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+        assert response.status_code == 200
+        assert "Server-Timing" not in response.headers
+        metrics = client.get("/metrics/").text
+        for stage in ("read", "decode", "preprocess", "inference", "postprocess", "queue"):
+            assert f'predict_stage_latency_seconds_count{{model_version="unknown",stage="{stage}"}}' in metrics
+
+    def test_server_timing_header_when_enabled(self):
+        with patch("backend.src.timing.PREDICT_SERVER_TIMING", True), patch(
+            "backend.src.predict_helpers.get_predictions_from_batch", side_effect=fake_detections
+        ):
+            response = client.post("/predict?format=json", files={"file": ("a.jpg", image_bytes(), "image/jpeg")})
+        assert response.status_code == 200
+        stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        assert stages[:2] == ["read", "cache"]
+        assert {"decode", "inference", "queue"} <= set(stages)
+        assert stages[-1] == "total"
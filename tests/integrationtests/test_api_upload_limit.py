@@ -0,0 +1,68 @@
+import asyncio
+import io
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from backend.src.api import app
+from backend.src.predict_helpers import read_upload
+
+client = TestClient(app)
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+class TestReadUpload:
+    def test_returns_view_of_contents(self):
+        data = bytes(range(256)) * 5000
+        contents = asyncio.run(read_upload(UploadFile(CountingFile(data)), max_size=len(data)))
+        assert isinstance(contents, memoryview)
+        assert contents.tobytes() == data
+
+    def test_declared_size_over_limit_is_rejected_without_reading(self):
+        file = CountingFile(b"x" * 2048)
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(read_upload(UploadFile(file, size=2048), max_size=1024))
+        assert exc_info.value.status_code == 413
+        assert file.bytes_read == 0
+
+    def test_undeclared_size_stops_reading_at_limit(self):
+        file = CountingFile(b"x" * (4 * 1024 * 1024))
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(read_upload(UploadFile(file), max_size=1024 * 1024))
+        assert exc_info.value.status_code == 413
+        assert file.bytes_read < 2 * 1024 * 1024
+
+
+class TestUploadSizeLimitMiddleware:
+    def test_oversized_content_length_is_rejected_before_parsing(self):
+        with patch("backend.src.api.read_upload") as mock_read:
+            response = client.post("/predict", files={"file": ("large.jpg", b"x" * (11 * 1024 * 1024), "image/jpeg")})
+        assert response.status_code == 413
+        assert "File size exceeds maximum limit of 10MB" in response.json()["detail"]
+        mock_read.assert_not_called()
+
+    def test_chunked_upload_is_cut_off_at_limit(self):
+        def body():
+            yield b'--boundary\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+            yield b"Content-Type: image/jpeg\r\n\r\n"
+            for _ in range(64):
+                yield b"x" * (256 * 1024)
+            yield b"\r\n--boundary--\r\n"
+
+        response = client.post(
+            "/predict", content=body(), headers={"Content-Type": "multipart/form-data; boundary=boundary"}
+        )
+        assert response.status_code == 413
+        assert "File size exceeds maximum limit" in response.json()["detail"]
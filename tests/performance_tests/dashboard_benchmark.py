@@ -0,0 +1,111 @@
+"""
+Latency of the monitoring dashboard query as predictions_log grows: the aggregate over today's rows
+of predictions_log it used to run against the hourly rollups it reads now (with the cache disabled).
+
+Runs against a throwaway SQLite database; from the repository root:
+    python -m tests.performance_tests.dashboard_benchmark --rows 10000 100000 1000000
+"""
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+from sqlalchemy import create_engine, insert, text
+
+from monitoring.core import monitor as monitor_module
+from monitoring.core.feature_stats import accumulate, upsert_stats
+from monitoring.core.log_writer import PREDICTIONS_LOG_COLUMNS, predictions_log
+from monitoring.core.monitor import BrainTumorImageMonitor
+
+# The old dashboard query, with SQLite spellings of MODE() and CURRENT_DATE
+SCAN_QUERY = text(
+    """
+    SELECT
+        COUNT(*),
+        AVG(prediction_confidence),
+        (SELECT prediction_class FROM predictions_log WHERE DATE(timestamp) = DATE('now', 'localtime')
+         GROUP BY prediction_class ORDER BY COUNT(*) DESC LIMIT 1),
+        AVG(tumor_detection_confidence),
+        COUNT(CASE WHEN prediction_class = 'malignant' THEN 1 END),
+        COUNT(CASE WHEN prediction_class = 'benign' THEN 1 END),
+        COUNT(CASE WHEN prediction_class = 'normal' THEN 1 END)
+    FROM predictions_log
+    WHERE DATE(timestamp) = DATE('now', 'localtime')
+"""
+)
+
+
+def fake_rows(start: int, count: int, now: datetime, span: timedelta, rng: np.random.Generator) -> List[dict]:
+    offsets = rng.uniform(0, span.total_seconds(), count)
+    rows = []
+    for i in range(count):
+        row = {
+            name: float(value) for name, value in zip(PREDICTIONS_LOG_COLUMNS, rng.random(len(PREDICTIONS_LOG_COLUMNS)))
+        }
+        row.update(
+            timestamp=now - timedelta(seconds=float(offsets[i])),
+            prediction_class=("benign", "malignant", "normal")[(start + i) % 3],
+            model_version="yolov8n",
+        )
+        rows.append(row)
+    return rows
+
+
+def median_ms(fn: Callable[[], object], runs: int) -> float:
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return 1000 * float(np.median(timings))
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark the monitoring dashboard as the prediction log grows")
+    p.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 500000])
+    p.add_argument("--days", type=float, default=30, help="Days of history the rows are spread over")
+    p.add_argument("--runs", type=int, default=5)
+    args = p.parse_args()
+
+    monitor_module.DASHBOARD_CACHE_TTL_SECONDS = 0
+    BrainTumorImageMonitor._load_reference_data = lambda self: None
+    rng = np.random.default_rng(0)
+    now, span = datetime.now(), timedelta(days=args.days)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'monitor.db'}")
+        columns = ", ".join(
+            f"{name} TEXT" if name in ("prediction_class", "model_version") else name
+            for name in PREDICTIONS_LOG_COLUMNS
+        )
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE TABLE predictions_log (id INTEGER PRIMARY KEY, {columns})"))
+            conn.execute(text("CREATE INDEX idx_predictions_log_timestamp ON predictions_log (timestamp)"))
+        monitor = BrainTumorImageMonitor(str(engine.url), reports_dir=str(Path(tmp) / "reports"))
+
+        logged = 0
+        print(f"{'rows':>10s} {'scan ms':>10s} {'rollup ms':>10s}")
+        for total in sorted(args.rows):
+            while logged < total:
+                batch = fake_rows(logged, min(5000, total - logged), now, span, rng)
+                with engine.begin() as conn:
+                    conn.execute(insert(predictions_log), batch)
+                    upsert_stats(conn, *accumulate(batch))
+                logged += len(batch)
+
+            def scan():
+                with engine.connect() as conn:
+                    return conn.execute(SCAN_QUERY).fetchone()
+
+            scan_ms = median_ms(scan, args.runs)
+            rollup_ms = median_ms(monitor.get_brain_tumor_dashboard_data, args.runs)
+            print(f"{total:10d} {scan_ms:10.2f} {rollup_ms:10.2f}")
+        monitor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Throughput of the monitoring feature extractor in images per second: the pixel-by-pixel statistics
+extract_features used to compute, the fused histogram version and extract_features_batch.
+
+Run from the repository root:
+    python -m tests.performance_tests.feature_extraction_benchmark --size 512 512 --images 64
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from monitoring.core.feature_extractor import FEATURE_EXTRACTION_WORKERS, ImageFeatureExtractor
+
+
+def direct_features(extractor: ImageFeatureExtractor, image: np.ndarray) -> Dict[str, float]:
+    """extract_features as it was before the statistics were taken from histograms."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    brightness_mean, brightness_std = np.mean(gray), np.std(gray)
+    contrast_mean = np.mean(np.abs(np.diff(gray, axis=1)))
+    contrast_std = np.std(np.abs(np.diff(gray, axis=1)))
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+    hist = hist / hist.sum()
+    entropy = -np.sum(hist * np.log2(hist + 1e-10))
+    mean_intensity, std_intensity = np.mean(gray), np.std(gray)
+    skewness = np.mean(((gray - mean_intensity) / std_intensity) ** 3)
+    kurtosis = np.mean(((gray - mean_intensity) / std_intensity) ** 4) - 3
+    return {
+        "brightness_mean": float(brightness_mean),
+        "brightness_std": float(brightness_std),
+        "contrast_mean": float(contrast_mean),
+        "contrast_std": float(contrast_std),
+        "entropy": float(entropy),
+        "skewness": float(skewness),
+        "kurtosis": float(kurtosis),
+        **extractor._extract_tumor_specific_features(gray),
+    }
+
+
+def synthetic_scans(width: int, height: int, count: int) -> List[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0) for _ in range(count)]
+
+
+def images_per_second(fn: Callable[[], object], images: int, runs: int) -> float:
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return images / float(np.median(timings))
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark monitoring feature extraction")
+    p.add_argument("--size", type=int, nargs=2, default=[512, 512], metavar=("WIDTH", "HEIGHT"))
+    p.add_argument("--images", type=int, default=64)
+    p.add_argument("--workers", type=int, default=FEATURE_EXTRACTION_WORKERS, help="Threads for the batch API")
+    p.add_argument("--runs", type=int, default=5)
+    args = p.parse_args()
+
+    extractor = ImageFeatureExtractor()
+    scans = synthetic_scans(*args.size, args.images)
+    rows = {
+        "direct (before)": lambda: [direct_features(extractor, image) for image in scans],
+        "fused": lambda: [extractor.extract_features(image) for image in scans],
+        f"fused batch, {args.workers} threads": lambda: extractor.extract_features_batch(scans, args.workers),
+    }
+    print(f"{args.images} scans of {args.size[0]}x{args.size[1]}, median of {args.runs} runs")
+    for name, fn in rows.items():
+        print(f"{name:32s} {images_per_second(fn, args.images, args.runs):8.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
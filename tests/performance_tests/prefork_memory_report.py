@@ -0,0 +1,127 @@
+"""
+Per-worker memory of the API served by `uvicorn --workers N` against the pre-fork server
+(`backend.src.serve`), with and without memory-mapped weights.
+
+For every worker count the server is started, each worker is warmed up with /predict requests and
+the unique (USS), proportional (PSS) and resident (RSS) memory of every worker process is read.
+USS is what a worker alone costs: adding one more worker grows the host's memory use by about its USS.
+
+Run from the repository root (DATABASE_URL and the weights must be available to the app):
+    python -m tests.performance_tests.prefork_memory_report --workers 1 2 4 8
+"""
+
+import argparse
+import io
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import pandas as pd
+import psutil
+import requests
+from PIL import Image
+
+MODES: Dict[str, Dict[str, str]] = {
+    "uvicorn": {},
+    "prefork": {},
+    "prefork+mmap": {"MMAP_WEIGHTS": "true"},
+}
+
+
+def command(mode: str, app: str, port: int, workers: int) -> List[str]:
+    if mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--workers", str(workers)]
+    return [sys.executable, "-m", "backend.src.serve", "--app", app, "--port", str(port), "--workers", str(workers)]
+
+
+def worker_processes(server: psutil.Process) -> List[psutil.Process]:
+    # uvicorn's spawn context also starts a resource tracker, which is not a worker
+    return [
+        child
+        for child in server.children(recursive=True)
+        if "resource_tracker" not in " ".join(child.cmdline()) and "semaphore_tracker" not in " ".join(child.cmdline())
+    ]
+
+
+def wait_until_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def warm_up(base_url: str, workers: int, requests_per_worker: int = 4) -> None:
+    """Send /predict requests so that every worker has run its predictor at least once (most likely)."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), color="gray").save(buffer, format="JPEG")
+    contents = buffer.getvalue()
+    for i in range(workers * requests_per_worker):
+        # Distinct uploads, so the prediction cache never answers
+        body = contents + i.to_bytes(4, "big")
+        requests.post(f"{base_url}/predict?format=json", files={"file": ("scan.jpg", body, "image/jpeg")}, timeout=120)
+
+
+def measure(mode: str, app: str, port: int, workers: int, timeout: float) -> Dict[str, float]:
+    env = dict(os.environ, **MODES[mode])
+    server = subprocess.Popen(command(mode, app, port, workers), env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(f"{base_url}/health", timeout)
+        parent = psutil.Process(server.pid)
+        deadline = time.monotonic() + timeout
+        # `uvicorn --workers 1` serves from the parent process itself
+        expected = 0 if mode == "uvicorn" and workers == 1 else workers
+        while len(worker_processes(parent)) < expected and time.monotonic() < deadline:
+            time.sleep(0.5)
+        warm_up(base_url, workers)
+        time.sleep(1)
+        workers_found = worker_processes(parent)
+        infos = [process.memory_full_info() for process in workers_found or [parent]]
+        master = parent.memory_full_info() if workers_found else None
+        mb = 1024 * 1024
+        return {
+            "mode": mode,
+            "workers": workers,
+            "uss_per_worker_mb": sum(info.uss for info in infos) / len(infos) / mb,
+            "pss_per_worker_mb": sum(info.pss for info in infos) / len(infos) / mb,
+            "rss_per_worker_mb": sum(info.rss for info in infos) / len(infos) / mb,
+            "master_uss_mb": master.uss / mb if master else 0.0,
+            "total_pss_mb": (sum(info.pss for info in infos) + (master.pss if master else 0)) / mb,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Report per-worker USS of uvicorn workers against pre-forked workers")
+    p.add_argument("--app", default="backend.src.api:app")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the server to start")
+    p.add_argument("--output", type=str, default=None, help="Also write the report to this CSV file")
+    args = p.parse_args()
+
+    rows = [
+        measure(mode, args.app, args.port, workers, args.timeout) for workers in args.workers for mode in args.modes
+    ]
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark of /predict preprocessing: the old squash-resize + ultralytics letterbox path against the
+single-pass `letterbox_batch`, and full against reduced-resolution JPEG decoding.
+
+Run from the repository root:
+    python -m tests.performance_tests.preprocess_benchmark --size 2400 1800 --runs 50
+    python -m tests.performance_tests.preprocess_benchmark --weights ml/models/yolov8n/weights/epoch10_yolov8n.pt
+"""
+
+import argparse
+import io
+import time
+from typing import Callable, Dict
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from ultralytics.data.augment import LetterBox
+
+from backend.src.predict_helpers import decode_image, decode_upload
+from ml.utils import letterbox_batch, resize_image
+
+
+def legacy_preprocess(image: np.ndarray) -> torch.Tensor:
+    """What a request used to go through: squash to 640x640, then ultralytics' letterbox and conversion."""
+    squashed = resize_image(image, size=(640, 640))
+    letterboxed = LetterBox((640, 640), auto=True, stride=32)(image=squashed)
+    tensor = np.ascontiguousarray(letterboxed[..., ::-1].transpose(2, 0, 1)[None])
+    return torch.from_numpy(tensor).float() / 255.0
+
+
+def fused_preprocess(image: np.ndarray) -> torch.Tensor:
+    batch, _ = letterbox_batch([image], 640, auto=True)
+    return torch.from_numpy(batch)
+
+
+def time_ms(fn: Callable[[], object], runs: int) -> Dict[str, float]:
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"p50": float(np.percentile(timings, 50)), "p95": float(np.percentile(timings, 95))}
+
+
+def synthetic_jpeg(width: int, height: int) -> bytes:
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (51, 51), 0)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark single-pass letterbox preprocessing against the old path")
+    p.add_argument("--size", type=int, nargs=2, default=[2400, 1800], metavar=("WIDTH", "HEIGHT"))
+    p.add_argument("--runs", type=int, default=50, help="Timed iterations per variant")
+    p.add_argument("--weights", type=str, default=None, help="Also time end-to-end prediction with these weights")
+    args = p.parse_args()
+
+    contents = synthetic_jpeg(*args.size)
+    image = decode_image(contents)
+    rows = {
+        "decode (full)": time_ms(lambda: decode_image(contents), args.runs),
+        "decode (reduced)": time_ms(lambda: decode_upload(contents), args.runs),
+        "preprocess (squash + letterbox)": time_ms(lambda: legacy_preprocess(image), args.runs),
+        "preprocess (single-pass letterbox)": time_ms(lambda: fused_preprocess(image), args.runs),
+    }
+    reduced, _ = decode_upload(contents)
+    rows["preprocess (single-pass, reduced decode)"] = time_ms(lambda: fused_preprocess(reduced), args.runs)
+
+    if args.weights:
+        from ultralytics import YOLO
+
+        from ml.predict import TorchBackend
+
+        model = YOLO(args.weights)
+        backend = TorchBackend(args.weights)
+        squashed = resize_image(image, size=(640, 640))
+        rows["predict (old path)"] = time_ms(
+            lambda: model.predict(source=squashed, imgsz=640, conf=0.5, verbose=False), args.runs
+        )
+        rows["predict (TorchBackend)"] = time_ms(lambda: backend.predict(reduced, conf=0.5), args.runs)
+
+    print(f"Input {args.size[0]}x{args.size[1]} JPEG, {len(contents) / 1024:.0f} KB, {args.runs} runs")
+    for name, timing in rows.items():
+        print(f"{name:45s} p50 {timing['p50']:8.2f} ms   p95 {timing['p95']:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+API startup benchmark: import time of `backend.src.api`, time until the server answers, latency of
+the first /predict request and time until the monitoring subsystem is up.
+
+Run from the repository root (DATABASE_URL and the weights must be available to the app):
+    python -m tests.performance_tests.startup_benchmark --runs 5
+"""
+
+import argparse
+import io
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import requests
+from PIL import Image
+
+IMPORTS = {
+    "import backend.src.api": "import backend.src.api",
+    # What importing the API used to pull in before the monitoring stack was imported lazily
+    "import backend.src.api + monitoring stack": "import backend.src.api, monitoring.core.monitor, evidently",
+}
+
+
+def import_seconds(statement: str) -> float:
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def poll(url: str, deadline: float, ok: tuple = (200,)) -> Optional[int]:
+    """GET `url` until it answers with a status in `ok` (or anything but 503 when `ok` is empty)."""
+    while time.monotonic() < deadline:
+        try:
+            status = requests.get(url, timeout=2).status_code
+            if status in ok or (not ok and status != 503):
+                return status
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def startup_seconds(app: str, port: int, timeout: float, delay: float = 0.0) -> Dict[str, float]:
+    base_url = f"http://127.0.0.1:{port}"
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), color="gray").save(buffer, format="JPEG")
+    start = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + timeout
+        if poll(f"{base_url}/health", deadline) is None:
+            raise TimeoutError(f"{app} did not come up within {timeout:.0f}s")
+        serving = time.monotonic()
+        time.sleep(delay)
+        sent = time.monotonic()
+        files = {"file": ("scan.jpg", buffer.getvalue(), "image/jpeg")}
+        requests.post(f"{base_url}/predict?format=json", files=files, timeout=timeout).raise_for_status()
+        first_predict = time.monotonic()
+        monitor_status = poll(f"{base_url}/monitoring/dashboard", deadline, ok=())
+        monitoring = time.monotonic()
+        return {
+            "serving_s": serving - start,
+            "first_predict_ms": (first_predict - sent) * 1000,
+            # Includes a monitor that failed to start (e.g. without GCS credentials); NaN if still starting
+            "monitoring_s": monitoring - start if monitor_status is not None else float("nan"),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark API import and startup time")
+    p.add_argument("--app", default="backend.src.api:app")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--timeout", type=float, default=300)
+    p.add_argument(
+        "--delay", type=float, default=0.0, help="Seconds between the server answering and the first /predict"
+    )
+    args = p.parse_args()
+    os.environ.setdefault("PYTHONPATH", os.getcwd())
+
+    for name, statement in IMPORTS.items():
+        timings = [import_seconds(statement) for _ in range(args.runs)]
+        print(f"{name:45s} median {statistics.median(timings):6.2f} s")
+
+    runs: List[Dict[str, float]] = [
+        startup_seconds(args.app, args.port, args.timeout, args.delay) for _ in range(args.runs)
+    ]
+    for key, label in (
+        ("serving_s", "server answering /health (s)"),
+        ("first_predict_ms", f"first /predict {args.delay:.0f} s after that (ms)"),
+        ("monitoring_s", "monitoring up or failed (s)"),
+    ):
+        print(f"{label:45s} median {statistics.median(run[key] for run in runs):6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Error of the approximate (thumbnail) monitoring features against the exact ones, per feature and
+thumbnail size, together with the extraction throughput of each mode.
+
+Run from the repository root on the training split (or --synthetic when the data is not pulled):
+    python -m tests.performance_tests.thumbnail_feature_report --sizes 64 128 256 512
+    python -m tests.performance_tests.thumbnail_feature_report --images data/BrainTumor/BrainTumorYolov8/valid/images
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from monitoring.core.feature_extractor import ImageFeatureExtractor
+
+# Features computed from the pixels; the others do not depend on the thumbnail
+PIXEL_FEATURES = [
+    "brightness_mean",
+    "brightness_std",
+    "contrast_mean",
+    "contrast_std",
+    "entropy",
+    "skewness",
+    "kurtosis",
+]
+
+
+def load_images(image_dir: str, limit: int) -> List[np.ndarray]:
+    paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))[:limit]
+    images = [cv2.imread(str(p)) for p in paths]
+    return [image for image in images if image is not None]
+
+
+def synthetic_scans(count: int, size: int = 640) -> List[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [cv2.GaussianBlur(rng.integers(0, 255, (size, size, 3), dtype=np.uint8), (15, 15), 0) for _ in range(count)]
+
+
+def extract(extractor: ImageFeatureExtractor, images: List[np.ndarray]) -> Tuple[pd.DataFrame, float]:
+    start = time.perf_counter()
+    rows = [extractor.extract_features(image) for image in images]
+    return pd.DataFrame(rows)[PIXEL_FEATURES], len(images) / (time.perf_counter() - start)
+
+
+def error_report(exact: pd.DataFrame, approx: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for feature in PIXEL_FEATURES:
+        error = (approx[feature] - exact[feature]).abs()
+        # Relative to the spread of the feature over the split, which is what the drift tests compare against
+        spread = exact[feature].std() or 1.0
+        report[feature] = {
+            "mean_abs_error": error.mean(),
+            "p95_abs_error": error.quantile(0.95),
+            "mean_error_in_std": error.mean() / spread,
+            "bias_in_std": (approx[feature] - exact[feature]).mean() / spread,
+        }
+    return report
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Validate thumbnail feature extraction against the exact features")
+    p.add_argument("--images", default="data/BrainTumor/BrainTumorYolov8/train/images")
+    p.add_argument("--limit", type=int, default=500, help="Images to use from the split")
+    p.add_argument("--synthetic", action="store_true", help="Use synthetic scans instead of the split")
+    p.add_argument("--synthetic-size", type=int, default=640, help="Side of the synthetic scans")
+    p.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256, 512])
+    p.add_argument("--output", default=None, help="Also write the report to this CSV file")
+    args = p.parse_args()
+
+    images = (
+        synthetic_scans(args.limit, args.synthetic_size) if args.synthetic else load_images(args.images, args.limit)
+    )
+    if not images:
+        raise SystemExit(f"No images found in {args.images}; pull the data with dvc or pass --synthetic")
+    exact, exact_rate = extract(ImageFeatureExtractor(thumbnail_size=0), images)
+    print(f"{len(images)} images, exact features: {exact_rate:.0f} images/s")
+
+    rows = []
+    for size in args.sizes:
+        approx, rate = extract(ImageFeatureExtractor(thumbnail_size=size), images)
+        for feature, errors in error_report(exact, approx).items():
+            rows.append({"thumbnail": size, "images_per_s": rate, "feature": feature, **errors})
+    report = pd.DataFrame(rows)
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
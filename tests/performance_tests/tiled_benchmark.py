@@ -0,0 +1,76 @@
+"""
+Throughput of tiled high-resolution inference (`ml.predict.predict_tiled`) against the default path,
+which letterboxes the whole scan down to a single 640x640 model input.
+
+Run from the repository root:
+    python -m tests.performance_tests.tiled_benchmark --weights ml/models/yolov8n/weights/epoch10_yolov8n.pt
+    python -m tests.performance_tests.tiled_benchmark --size 2400 1800 --images 4 --max-batch 4 8 16
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from ml.predict import BEST_MODEL_PATH, TILE_OVERLAP, TILE_SIZE, load_backend, predict_tiled
+from ml.utils import tile_image
+
+
+def synthetic_scans(width: int, height: int, count: int) -> List[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [
+        cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (51, 51), 0) for _ in range(count)
+    ]
+
+
+def throughput(fn: Callable[[], object], images: int, runs: int) -> Dict[str, float]:
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    p50 = float(np.percentile(timings, 50))
+    return {"p50_ms": p50 * 1000, "images_per_s": images / p50}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Benchmark tiled inference against single-resize inference")
+    p.add_argument("--weights", type=str, default=BEST_MODEL_PATH)
+    p.add_argument("--backend", type=str, default=None, help="torch, onnx or onnx-int8 (default: from extension)")
+    p.add_argument("--size", type=int, nargs=2, default=[2400, 1800], metavar=("WIDTH", "HEIGHT"))
+    p.add_argument("--images", type=int, default=4, help="Scans per request batch")
+    p.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    p.add_argument("--overlap", type=int, default=TILE_OVERLAP)
+    p.add_argument("--max-batch", type=int, nargs="+", default=[1, 8, 16], help="Tile batch limits to compare")
+    p.add_argument("--runs", type=int, default=10, help="Timed iterations per variant")
+    args = p.parse_args()
+
+    model = load_backend(args.weights, args.backend)
+    scans = synthetic_scans(*args.size, args.images)
+    tiles_per_scan = len(tile_image(scans[0], args.tile_size, args.overlap)[0])
+
+    rows = {"single resize": throughput(lambda: model.predict(scans, conf=0.5), args.images, args.runs)}
+    for max_batch in args.max_batch:
+        for include_full in (False, True):
+            name = f"tiled, batch {max_batch}" + (" + full image" if include_full else "")
+            rows[name] = throughput(
+                lambda: predict_tiled(
+                    scans, model, args.tile_size, args.overlap, max_batch=max_batch, include_full=include_full
+                ),
+                args.images,
+                args.runs,
+            )
+
+    print(
+        f"{args.images} scans of {args.size[0]}x{args.size[1]}, {tiles_per_scan} tiles of {args.tile_size} "
+        f"(overlap {args.overlap}) per scan, {args.runs} runs"
+    )
+    for name, row in rows.items():
+        print(f"{name:32s} p50 {row['p50_ms']:9.1f} ms   {row['images_per_s']:7.2f} scans/s")
+
+
+if __name__ == "__main__":
+    main()
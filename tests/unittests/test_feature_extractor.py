@@ -0,0 +1,110 @@
+"""Unit tests for the monitoring image feature extractor."""
+
+import cv2
+import numpy as np
+import pytest
+
+from monitoring.core.feature_extractor import FEATURE_EXTRACTOR_VERSION, ImageFeatureExtractor, thumbnail
+
+INTENSITY_FEATURES = (
+    "brightness_mean",
+    "brightness_std",
+    "contrast_mean",
+    "contrast_std",
+    "entropy",
+    "skewness",
+    "kurtosis",
+    "mean_intensity",
+    "std_intensity",
+)
+
+
+def direct_intensity_features(gray):
+    """The statistics as extract_features computed them pixel by pixel (entropy in float32) before."""
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
+    hist = hist / hist.sum()
+    mean, std = np.mean(gray), np.std(gray)
+    return {
+        "brightness_mean": mean,
+        "brightness_std": std,
+        "contrast_mean": np.mean(np.abs(np.diff(gray, axis=1))),
+        "contrast_std": np.std(np.abs(np.diff(gray, axis=1))),
+        "entropy": -np.sum(hist * np.log2(hist + 1e-10)),
+        "skewness": np.mean(((gray - mean) / std) ** 3),
+        "kurtosis": np.mean(((gray - mean) / std) ** 4) - 3,
+        "mean_intensity": mean,
+        "std_intensity": std,
+    }
+
+
+def scan(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 255, shape, dtype=np.uint8), (9, 9), 0)
+
+
+@pytest.mark.parametrize("shape", [(512, 512, 3), (480, 640, 3), (37, 100)])
+def test_fused_features_match_direct_computation(shape):
+    image = scan(shape)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    features = ImageFeatureExtractor().extract_features(image)
+
+    expected = direct_intensity_features(gray)
+    for name in INTENSITY_FEATURES:
+        assert features[name] == pytest.approx(float(expected[name]), rel=1e-6, abs=1e-9), name
+    assert (features["image_width"], features["image_height"]) == (shape[1], shape[0])
+
+
+def test_uniform_image_has_undefined_shape_moments():
+    features = ImageFeatureExtractor().extract_features(np.full((16, 16, 3), 7, dtype=np.uint8))
+    assert features["brightness_mean"] == 7.0
+    assert features["brightness_std"] == 0.0
+    assert np.isnan(features["skewness"]) and np.isnan(features["kurtosis"])
+
+
+def test_non_uint8_images_use_the_direct_computation():
+    image = scan((32, 48)).astype(np.float32)
+    features = ImageFeatureExtractor().extract_features(image)
+    assert features["brightness_mean"] == pytest.approx(float(np.mean(image)))
+    assert features["contrast_mean"] == pytest.approx(float(np.mean(np.abs(np.diff(image, axis=1)))))
+
+
+def test_batch_matches_single_image_extraction():
+    extractor = ImageFeatureExtractor()
+    images = [scan((64 + i, 80, 3), seed=i) for i in range(6)]
+    batch = extractor.extract_features_batch(images, workers=3)
+
+    assert [f["image_height"] for f in batch] == [64.0 + i for i in range(6)]
+    for image, features in zip(images, batch):
+        single = extractor.extract_features(image)
+        for name in INTENSITY_FEATURES:
+            assert features[name] == single[name]
+
+
+def test_thumbnail_limits_the_longer_side():
+    image = scan((1000, 750, 3))
+    small = thumbnail(image, 256)
+    assert max(small.shape[:2]) <= 256
+    assert small.shape[2] == 3 and small.flags["C_CONTIGUOUS"]
+
+
+def test_approximate_mode_keeps_original_size_and_close_statistics():
+    image = scan((1024, 1536, 3))
+    exact = ImageFeatureExtractor(thumbnail_size=0).extract_features(image)
+    approx = ImageFeatureExtractor(thumbnail_size=256).extract_features(image)
+
+    for name in ("image_width", "image_height", "image_channels", "image_size_bytes"):
+        assert approx[name] == exact[name]
+    for name in ("brightness_mean", "brightness_std", "entropy"):
+        assert approx[name] == pytest.approx(exact[name], rel=0.01), name
+
+
+def test_approximate_mode_has_its_own_version_and_skips_small_images():
+    exact, approx = ImageFeatureExtractor(thumbnail_size=0), ImageFeatureExtractor(thumbnail_size=256)
+    assert exact.version == FEATURE_EXTRACTOR_VERSION
+    assert approx.version == f"{FEATURE_EXTRACTOR_VERSION}-thumb256"
+
+    image = scan((200, 240, 3))
+    np.random.seed(0)
+    small_exact = exact.extract_features(image)
+    np.random.seed(0)
+    assert approx.extract_features(image) == small_exact
@@ -0,0 +1,213 @@
+"""Unit tests for the hourly feature statistics used for drift analysis."""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, insert, text
+
+from monitoring.core import monitor as monitor_module
+from monitoring.core.drift_detector import DriftDetector
+from monitoring.core.feature_stats import (
+    RunningStats,
+    accumulate,
+    create_tables,
+    load_class_counts,
+    load_feature_stats,
+    merge_all,
+    rebuild_stats,
+    upsert_stats,
+)
+from monitoring.core.log_writer import PREDICTIONS_LOG_COLUMNS, PredictionLogWriter, predictions_log
+from monitoring.core.monitor import BrainTumorImageMonitor
+
+
+def make_rows(count, start, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(count):
+        row = {name: float(rng.normal(100, 20)) for name in PREDICTIONS_LOG_COLUMNS}
+        row.update(
+            timestamp=start + timedelta(minutes=7 * i),
+            prediction_class=["benign", "malignant", "normal"][i % 3],
+            model_version="yolov8n",
+        )
+        rows.append(row)
+    return rows
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'monitor.db'}")
+    columns = ", ".join(
+        f"{name} TEXT" if name in ("prediction_class", "model_version") else name for name in PREDICTIONS_LOG_COLUMNS
+    )
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE predictions_log (id INTEGER PRIMARY KEY, {columns})"))
+    create_tables(engine)
+    return engine
+
+
+def test_streaming_and_merged_statistics_match_numpy():
+    values = np.random.default_rng(1).normal(50, 7, 1000)
+    streamed = RunningStats()
+    for value in values:
+        streamed.update(value)
+    merged = merge_all(RunningStats.from_values(chunk) for chunk in np.array_split(values, 13))
+
+    for stats in (streamed, merged):
+        assert stats.count == 1000
+        assert stats.mean == pytest.approx(values.mean())
+        assert stats.std == pytest.approx(values.std(ddof=1))
+        assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_missing_values_are_skipped():
+    stats = RunningStats.from_values([1.0, None, np.nan, 3.0])
+    assert (stats.count, stats.mean) == (2, 2.0)
+    assert RunningStats().merge(stats) == stats
+
+
+def test_upserts_merge_into_persisted_buckets(engine):
+    rows = make_rows(60, datetime(2025, 7, 1, 9, 30))
+    # Two flushes that both touch the hour buckets in the middle
+    for batch in (rows[:25], rows[25:]):
+        with engine.begin() as conn:
+            upsert_stats(conn, *accumulate(batch))
+
+    with engine.connect() as conn:
+        stats = load_feature_stats(conn, datetime(2025, 7, 1))
+        counts = load_class_counts(conn, datetime(2025, 7, 1))
+        buckets = conn.execute(text("SELECT COUNT(DISTINCT bucket) FROM feature_stats_hourly")).scalar()
+
+    expected = np.array([row["entropy"] for row in rows])
+    assert buckets == 8
+    assert stats["entropy"].count == 60
+    assert stats["entropy"].mean == pytest.approx(expected.mean())
+    assert stats["entropy"].std == pytest.approx(expected.std(ddof=1))
+    assert stats["entropy"].max == expected.max()
+    assert counts == {"benign": 20, "malignant": 20, "normal": 20}
+
+
+def test_window_only_merges_buckets_since_its_start(engine):
+    rows = make_rows(60, datetime(2025, 7, 1, 9, 30))
+    with engine.begin() as conn:
+        upsert_stats(conn, *accumulate(rows))
+        stats = load_feature_stats(conn, datetime(2025, 7, 1, 14, 45))
+    expected = [row["entropy"] for row in rows if row["timestamp"] >= datetime(2025, 7, 1, 14)]
+    assert stats["entropy"].count == len(expected)
+    assert stats["entropy"].mean == pytest.approx(np.mean(expected))
+
+
+def test_log_writer_updates_statistics_with_the_rows(engine, tmp_path):
+    writer = PredictionLogWriter(
+        engine, batch_size=16, flush_ms=0, spill_dir=str(tmp_path / "spill"), feature_stats=True
+    )
+    rows = make_rows(40, datetime(2025, 7, 1, 9, 30))
+    for row in rows:
+        writer.submit(row)
+    writer.close()
+
+    with engine.connect() as conn:
+        logged = conn.execute(text("SELECT COUNT(*) FROM predictions_log")).scalar()
+        stats = load_feature_stats(conn, datetime(2025, 7, 1))
+    assert logged == stats["brightness_mean"].count == 40
+
+
+def test_drift_from_statistics_equals_drift_from_rows():
+    detector = DriftDetector()
+    reference = pd.DataFrame(make_rows(80, datetime(2025, 6, 1), seed=2))
+    current = pd.DataFrame(make_rows(50, datetime(2025, 7, 1), seed=3))
+    from_rows = detector.analyze_feature_drift(reference, current)
+    from_stats = detector.analyze_feature_stats(
+        {f: RunningStats.from_values(reference[f]) for f in detector.key_features},
+        merge_all_chunks(current, detector.key_features),
+    )
+
+    assert from_rows.keys() == from_stats.keys() == set(detector.key_features)
+    for feature, result in from_rows.items():
+        for name, value in result.items():
+            assert from_stats[feature][name] == pytest.approx(value), (feature, name)
+
+
+def merge_all_chunks(df, features):
+    chunks = np.array_split(np.arange(len(df)), 5)
+    return {f: merge_all(RunningStats.from_values(df[f].iloc[chunk]) for chunk in chunks) for f in features}
+
+
+def test_monitor_analyzes_drift_from_hourly_statistics(engine, tmp_path, monkeypatch):
+    reference = pd.DataFrame(make_rows(80, datetime(2025, 6, 1), seed=2))
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data", lambda self: reference)
+    monitor = BrainTumorImageMonitor(str(engine.url), reports_dir=str(tmp_path / "reports"))
+    monkeypatch.setattr(monitor, "get_current_data", lambda days: pytest.fail("read the rows"))
+
+    rows = make_rows(30, datetime.now() - timedelta(hours=3), seed=4)
+    with engine.begin() as conn:
+        upsert_stats(conn, *accumulate(rows))
+    analysis = monitor.analyze_feature_drift(days=1)
+    monitor.close()
+
+    expected = np.array([row["entropy"] for row in rows])
+    assert analysis["entropy"]["current_mean"] == pytest.approx(expected.mean())
+    assert analysis["entropy"]["current_std"] == pytest.approx(expected.std(ddof=1))
+
+
+def insert_rows(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(insert(predictions_log), rows)
+
+
+def test_rebuild_recomputes_buckets_from_the_log(engine):
+    rows = make_rows(60, datetime(2025, 7, 1, 9, 30))
+    insert_rows(engine, rows)
+    # A stale bucket inside the range is replaced, one outside it is kept
+    with engine.begin() as conn:
+        upsert_stats(conn, *accumulate(rows[:10]))
+        upsert_stats(conn, *accumulate(make_rows(5, datetime(2025, 6, 30, 8))))
+
+    assert rebuild_stats(engine, datetime(2025, 7, 1), datetime(2025, 7, 2), chunk_size=7) == 60
+    with engine.connect() as conn:
+        stats = load_feature_stats(conn, datetime(2025, 6, 30), ["entropy"])
+        counts = load_class_counts(conn, datetime(2025, 7, 1))
+    expected = np.array([row["entropy"] for row in rows])
+    assert stats.keys() == {"entropy"}
+    assert stats["entropy"].count == 65
+    with engine.connect() as conn:
+        rebuilt = load_feature_stats(conn, datetime(2025, 7, 1))["entropy"]
+    assert (rebuilt.count, rebuilt.mean) == (60, pytest.approx(expected.mean()))
+    assert counts == {"benign": 20, "malignant": 20, "normal": 20}
+
+
+@pytest.fixture
+def monitor(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data", lambda self: None)
+    monitor = BrainTumorImageMonitor(str(engine.url), reports_dir=str(tmp_path / "reports"))
+    yield monitor
+    monitor.close()
+
+
+def test_dashboard_reads_todays_rollups(engine, monitor):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rows = make_rows(7, today, seed=5) + make_rows(3, today - timedelta(days=1), seed=6)
+    rows[0]["prediction_class"] = "malignant"
+    with engine.begin() as conn:
+        upsert_stats(conn, *accumulate(rows))
+
+    data = monitor.get_brain_tumor_dashboard_data()
+    assert data["total_predictions_today"] == 7
+    assert (data["malignant_count"], data["benign_count"], data["normal_count"]) == (3, 2, 2)
+    assert data["most_common_class"] == "malignant"
+    assert data["average_confidence"] == pytest.approx(np.mean([r["prediction_confidence"] for r in rows[:7]]))
+    assert data["avg_tumor_confidence"] == pytest.approx(np.mean([r["tumor_detection_confidence"] for r in rows[:7]]))
+
+
+def test_dashboard_is_cached_for_the_ttl(engine, monitor, monkeypatch):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    assert monitor.get_brain_tumor_dashboard_data()["total_predictions_today"] == 0
+    with engine.begin() as conn:
+        upsert_stats(conn, *accumulate(make_rows(4, today)))
+
+    assert monitor.get_brain_tumor_dashboard_data()["total_predictions_today"] == 0
+    monkeypatch.setattr(monitor_module, "DASHBOARD_CACHE_TTL_SECONDS", 0)
+    assert monitor.get_brain_tumor_dashboard_data()["total_predictions_today"] == 4
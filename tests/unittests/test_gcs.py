@@ -0,0 +1,137 @@
+"""Unit tests for the concurrent GCS fetcher, against a local directory standing in for a bucket."""
+
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from ml.dataset_statistics import download_gcs_files
+from ml.gcs import GCSFetcher, pair_labels
+from monitoring.core.monitor import BrainTumorImageMonitor
+
+
+class FakeBlob:
+    def __init__(self, client, name, path):
+        self.client = client
+        self.name = name
+        self.path = path
+
+    def download_as_bytes(self):
+        with self.client.lock:
+            self.client.downloads.append(self.name)
+            self.client.in_flight += 1
+            self.client.max_in_flight = max(self.client.max_in_flight, self.client.in_flight)
+        time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.in_flight -= 1
+        return Path(self.path).read_bytes()
+
+    def exists(self):
+        raise AssertionError("labels are paired from the listing")
+
+
+class FakeClient:
+    """The subset of google.cloud.storage.Client the fetcher uses, serving files under `root/<bucket>/`."""
+
+    def __init__(self, root, latency=0.0):
+        self.root = Path(root)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.listings = []
+        self.downloads = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def list_blobs(self, bucket_name, prefix=""):
+        self.listings.append(prefix)
+        bucket = self.root / bucket_name
+        for path in sorted(bucket.rglob("*")):
+            name = path.relative_to(bucket).as_posix()
+            if path.is_file() and name.startswith(prefix):
+                yield FakeBlob(self, name, path)
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    split = tmp_path / "brain-tumor-data" / "BrainTumorYolov8" / "train"
+    (split / "images").mkdir(parents=True)
+    (split / "labels").mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(8):
+        cv2.imwrite(str(split / "images" / f"scan_{i}.jpg"), rng.integers(0, 255, (32, 40, 3), dtype=np.uint8))
+        if i != 3:
+            (split / "labels" / f"scan_{i}.txt").write_text(f"{i % 2} 0.5 0.5 0.2 0.2\n")
+    (split / "labels" / "orphan.txt").write_text("1 0.5 0.5 0.1 0.1\n")
+    return tmp_path
+
+
+def test_pair_labels_matches_images_by_split_and_stem(bucket):
+    client = FakeClient(bucket)
+    pairs = pair_labels(client.list_blobs("brain-tumor-data", "BrainTumorYolov8/"))
+
+    assert [Path(p.image.name).name for p in pairs] == [f"scan_{i}.jpg" for i in range(8)]
+    assert [p.label.name if p.label else None for p in pairs][2:4] == [
+        "BrainTumorYolov8/train/labels/scan_2.txt",
+        None,
+    ]
+
+
+def test_fetch_labeled_images_lists_once_and_decodes_in_memory(bucket):
+    client = FakeClient(bucket)
+    fetcher = GCSFetcher("brain-tumor-data", client=client, max_workers=4)
+    samples = list(fetcher.fetch_labeled_images(fetcher.list_labeled("BrainTumorYolov8/train/")))
+
+    assert client.listings == ["BrainTumorYolov8/train/"]
+    assert len(samples) == 8
+    assert all(sample.image.shape == (32, 40, 3) for sample in samples)
+    assert [sample.label.split()[0] if sample.label else None for sample in samples] == [
+        "0",
+        "1",
+        "0",
+        None,
+        "0",
+        "1",
+        "0",
+        "1",
+    ]
+    # 8 images and 7 labels, the orphan label is never downloaded
+    assert len(client.downloads) == 15
+
+
+def test_fetcher_downloads_concurrently_within_its_bound(bucket):
+    client = FakeClient(bucket, latency=0.05)
+    fetcher = GCSFetcher("brain-tumor-data", client=client, max_workers=4)
+    blobs = fetcher.list_blobs("BrainTumorYolov8/train/images/")
+
+    start = time.perf_counter()
+    downloaded = list(fetcher.download(blobs))
+    elapsed = time.perf_counter() - start
+
+    assert [blob.name for blob, _ in downloaded] == [blob.name for blob in blobs]
+    assert client.max_in_flight == 4
+    assert elapsed < 8 * 0.05
+
+
+def test_download_gcs_files_writes_every_blob(bucket, tmp_path):
+    fetcher = GCSFetcher("brain-tumor-data", client=FakeClient(bucket), max_workers=3)
+    blobs = fetcher.list_blobs("BrainTumorYolov8/train/labels/")
+    files = download_gcs_files(blobs, str(tmp_path / "labels"), fetcher)
+
+    assert sorted(Path(f).name for f in files) == sorted(Path(b.name).name for b in blobs)
+    assert Path(files[0]).read_bytes() == Path(blobs[0].path).read_bytes()
+
+
+def test_monitor_reference_data_from_fake_bucket(bucket, tmp_path, monkeypatch):
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data", lambda self: None)
+    monitor = BrainTumorImageMonitor(f"sqlite:///{tmp_path / 'monitor.db'}", reports_dir=str(tmp_path / "reports"))
+    fetcher = GCSFetcher("brain-tumor-data", client=FakeClient(bucket), max_workers=4)
+
+    df = monitor._load_reference_data_from_gcs(n_images=5, fetcher=fetcher)
+
+    assert len(df) == 5
+    assert set(df["prediction_class"]) <= {"0", "1", "unknown"}
+    assert (df["image_width"] == 40).all()
+    assert (df["model_version"] == "reference").all()
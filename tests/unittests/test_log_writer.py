@@ -0,0 +1,236 @@
+"""Unit tests for the buffered predictions_log writer."""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from monitoring.core import log_writer
+from monitoring.core.log_writer import PREDICTIONS_LOG_COLUMNS, PredictionLogWriter
+from monitoring.core.monitor import BrainTumorImageMonitor
+
+
+def make_row(i):
+    row = {name: float(i) for name in PREDICTIONS_LOG_COLUMNS}
+    row.update(timestamp=datetime(2025, 7, 1, 12, 0, i % 60), prediction_class=str(i % 2), model_version="yolov8n")
+    return row
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'monitor.db'}")
+    columns = ", ".join(
+        f"{name} TEXT" if name in ("prediction_class", "model_version") else name for name in PREDICTIONS_LOG_COLUMNS
+    )
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE predictions_log (id INTEGER PRIMARY KEY, {columns})"))
+    return engine
+
+
+def count_commits(engine):
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    return commits
+
+
+def row_count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM predictions_log")).scalar()
+
+
+def dropped(reason):
+    return log_writer.prediction_log_dropped.labels(reason=reason)._value.get()
+
+
+def test_writer_batches_rows_into_few_transactions(engine, tmp_path):
+    commits = count_commits(engine)
+    writer = PredictionLogWriter(engine, batch_size=50, flush_ms=200, spill_dir=str(tmp_path / "spill"))
+    for i in range(120):
+        assert writer.submit(make_row(i))
+    writer.flush()
+    writer.close()
+
+    assert row_count(engine) == 120
+    # 50 + 50 + 20 rows, instead of one commit per row
+    assert len(commits) <= 4
+
+
+def test_writer_flushes_a_partial_batch_after_the_interval(engine, tmp_path):
+    writer = PredictionLogWriter(engine, batch_size=100, flush_ms=20, spill_dir=str(tmp_path / "spill"))
+    writer.submit(make_row(1))
+    writer.flush()
+    assert row_count(engine) == 1
+    writer.close()
+
+
+def test_close_writes_queued_rows(engine, tmp_path):
+    writer = PredictionLogWriter(engine, batch_size=10, flush_ms=5000, spill_dir=str(tmp_path / "spill"))
+    for i in range(25):
+        writer.submit(make_row(i))
+    writer.close()
+    assert row_count(engine) == 25
+
+
+def blocked_writer(engine, tmp_path, overflow, **kwargs):
+    """A writer whose first insert waits for the returned event, so its queue fills up."""
+    release = threading.Event()
+    event.listen(engine, "before_cursor_execute", lambda *args: release.wait(10))
+    writer = PredictionLogWriter(
+        engine, max_queue=2, batch_size=1, flush_ms=0, overflow=overflow, spill_dir=str(tmp_path / "spill"), **kwargs
+    )
+    writer.submit(make_row(0))
+    # Wait until the writer has taken the first row and is stuck inserting it
+    while writer._queue.qsize():
+        time.sleep(0.01)
+    return writer, release
+
+
+def test_drop_policy_discards_rows_when_the_queue_is_full(engine, tmp_path):
+    writer, release = blocked_writer(engine, tmp_path, "drop")
+    before = dropped("overflow")
+    results = [writer.submit(make_row(i)) for i in range(1, 5)]
+    release.set()
+    writer.close()
+
+    assert results == [True, True, False, False]
+    assert dropped("overflow") - before == 2
+    assert row_count(engine) == 3
+
+
+def test_block_policy_waits_for_room_then_gives_up(engine, tmp_path):
+    writer, release = blocked_writer(engine, tmp_path, "block", block_timeout=0.05)
+    results = [writer.submit(make_row(i)) for i in range(1, 4)]
+    release.set()
+    # Now the writer drains the queue, so a blocked submit gets through
+    assert writer.submit(make_row(4))
+    writer.close()
+
+    assert results == [True, True, False]
+    assert row_count(engine) == 4
+
+
+def test_spill_policy_keeps_overflow_and_replays_it(engine, tmp_path):
+    writer, release = blocked_writer(engine, tmp_path, "spill")
+    results = [writer.submit(make_row(i)) for i in range(1, 6)]
+    assert all(results)
+    assert writer.spill_path.read_text().count("\n") == 3
+
+    release.set()
+    writer.flush()
+    for _ in range(100):
+        if row_count(engine) == 6:
+            break
+        time.sleep(0.05)
+    writer.close()
+
+    assert row_count(engine) == 6
+    assert not any((tmp_path / "spill").iterdir())
+    with engine.connect() as conn:
+        timestamps = conn.execute(text("SELECT timestamp FROM predictions_log")).scalars().all()
+    assert all(str(value).startswith("2025-07-01") for value in timestamps)
+
+
+def test_failed_insert_is_spilled_with_the_spill_policy(tmp_path):
+    # No predictions_log table, so every insert fails
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    writer = PredictionLogWriter(engine, batch_size=10, flush_ms=0, overflow="spill", spill_dir=str(tmp_path / "spill"))
+    writer.submit(make_row(1))
+    writer.flush()
+    writer.close()
+    assert writer.spill_path.read_text().count("\n") == 1
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write_spill_file(path, rows, extra=""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(log_writer._encode_row(row) + "\n" for row in rows) + extra)
+
+
+def wait_for_rows(engine, count):
+    for _ in range(100):
+        if row_count(engine) >= count:
+            break
+        time.sleep(0.05)
+    return row_count(engine)
+
+
+def test_spill_files_of_exited_processes_are_replayed_and_live_ones_left_alone(engine, tmp_path):
+    spill_dir = tmp_path / "spill"
+    dead = spill_dir / f"predictions_log.{exited_pid()}.ndjson"
+    live = spill_dir / f"predictions_log.{os.getppid()}.ndjson"
+    # The last line was cut short when its process was killed
+    write_spill_file(dead, [make_row(1), make_row(2)], extra='{"timestamp": "2025-07-01T12')
+    write_spill_file(live, [make_row(3)])
+    before = dropped("corrupt")
+
+    writer = PredictionLogWriter(engine, batch_size=10, flush_ms=0, spill_dir=str(spill_dir))
+    writer.submit(make_row(0))
+    assert wait_for_rows(engine, 3) == 3
+    # The writer thread survived the unreadable line and keeps writing
+    writer.submit(make_row(4))
+    writer.flush()
+    writer.close()
+
+    assert row_count(engine) == 4
+    assert dropped("corrupt") - before == 1
+    assert sorted(path.name for path in spill_dir.iterdir()) == [live.name]
+
+
+def test_spilled_rows_are_kept_until_they_are_written(tmp_path):
+    # No predictions_log table, so every insert fails
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    spill_dir = tmp_path / "spill"
+    write_spill_file(spill_dir / f"predictions_log.{exited_pid()}.ndjson", [make_row(1), make_row(2)])
+    writer = PredictionLogWriter(engine, batch_size=1, flush_ms=0, overflow="spill", spill_dir=str(spill_dir))
+    writer._replay_spilled()
+
+    (kept,) = list(spill_dir.iterdir())
+    assert kept.name.startswith(f"predictions_log.{os.getpid()}.")
+    assert [json.loads(line)["entropy"] for line in kept.read_text().splitlines()] == [1.0, 2.0]
+
+
+def test_unserializable_rows_are_dropped_when_spilling(engine, tmp_path):
+    writer = PredictionLogWriter(engine, overflow="spill", spill_dir=str(tmp_path / "spill"))
+    before = dropped("spill")
+    writer._spill([{**make_row(1), "entropy": object()}, make_row(2)])
+    assert dropped("spill") - before == 1
+    assert writer.spill_path.read_text().count("\n") == 1
+
+
+def test_writer_thread_survives_errors(engine, tmp_path, monkeypatch):
+    writer = PredictionLogWriter(engine, batch_size=10, flush_ms=0, spill_dir=str(tmp_path / "spill"))
+    monkeypatch.setattr(writer, "_replay_spilled", lambda: 1 / 0)
+    writer.submit(make_row(1))
+    time.sleep(0.3)
+    writer.submit(make_row(2))
+    writer.flush()
+    assert writer._thread.is_alive()
+    writer.close()
+    assert row_count(engine) == 2
+
+
+def test_unknown_overflow_policy_is_rejected(engine):
+    with pytest.raises(ValueError):
+        PredictionLogWriter(engine, overflow="ignore")
+
+
+def test_monitor_logs_predictions_through_the_writer(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data", lambda self: None)
+    monitor = BrainTumorImageMonitor(str(engine.url), reports_dir=str(tmp_path / "reports"))
+    image = np.random.default_rng(0).integers(0, 255, (32, 32, 3), dtype=np.uint8)
+    for _ in range(3):
+        monitor.log_prediction(image, {"confidence": 0.9, "class": "1", "num_detections": 1})
+    monitor.close()
+    assert row_count(engine) == 3
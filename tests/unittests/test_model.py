@@ -166,4 +166,122 @@ def test_get_prediction_from_array_valid():
     except ModuleNotFoundError:
         pytest.skip("ultralytics not installed")
     assert isinstance(ann, np.ndarray)
+    # The annotated image keeps the input resolution instead of being squashed to 640x640
+    assert ann.shape == (100, 200, 3)
+
+
+# -------------------------------------------------------------------------
+# Tests for ModelRegistry
+# -------------------------------------------------------------------------
+class CountingLoader:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(path)
+        return DummyYOLOPred(path)
+
+
+def test_model_registry_loads_weights_once(tmp_path):
+    weights = tmp_path / "model.pt"
+    weights.write_bytes(b"weights-v1")
+    loader = CountingLoader()
+    registry = predict.ModelRegistry(max_models=2, loader=loader)
+    first = registry.get(str(weights))
+    second = registry.get(str(weights))
+    assert first is second
+    assert loader.calls == [str(weights)]
+
+
+def test_model_registry_reloads_when_weights_change(tmp_path):
+    weights = tmp_path / "model.pt"
+    weights.write_bytes(b"weights-v1")
+    loader = CountingLoader()
+    registry = predict.ModelRegistry(max_models=2, loader=loader)
+    old_version = registry.version(str(weights))
+    first = registry.get(str(weights))
+    weights.write_bytes(b"weights-v2-longer")
+    second = registry.get(str(weights))
+    assert first is not second
+    assert registry.version(str(weights)) != old_version
+    assert len(loader.calls) == 2
+
+
+def test_model_registry_evicts_least_recently_used(tmp_path):
+    paths = []
+    for i in range(3):
+        weights = tmp_path / f"model{i}.pt"
+        weights.write_bytes(f"weights-{i}".encode())
+        paths.append(str(weights))
+    loader = CountingLoader()
+    registry = predict.ModelRegistry(max_models=2, loader=loader)
+    registry.get(paths[0])
+    registry.get(paths[1])
+    registry.get(paths[0])
+    registry.get(paths[2])
+    assert len(registry) == 2
+    registry.get(paths[0])
+    assert loader.calls.count(paths[0]) == 1
+    registry.get(paths[1])
+    assert loader.calls.count(paths[1]) == 2
+
+
+def test_model_registry_preload_hands_out_preloaded_instances(tmp_path):
+    weights = tmp_path / "model.pt"
+    weights.write_bytes(b"weights-v1")
+    loader = CountingLoader()
+    registry = predict.ModelRegistry(loader=loader)
+    registry.preload(str(weights), instances=2)
+    # Only the private instances; the shared model is loaded on first get()
+    assert len(loader.calls) == 2
+    assert len(registry) == 0
+    first = registry.new_instance(str(weights))
+    second = registry.new_instance(str(weights))
+    assert first is not second
+    assert len(loader.calls) == 2
+    registry.new_instance(str(weights))
+    assert len(loader.calls) == 3
+
+
+def test_get_prediction_from_array_uses_given_model():
+    img = np.zeros((640, 640, 3), dtype=np.uint8)
+    ann, result = predict.get_prediction_from_array(img, model=DummyYOLOPred("unused"))
+    assert isinstance(result, DummyRes)
     assert ann.shape == (640, 640, 3)
+
+
+class TileModel:
+    """Fake model that finds one box in the middle of every source and records the batches it gets."""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, source, imgsz=640, conf=0.5, **kwargs):
+        import torch
+        from ultralytics.engine.results import Results
+
+        self.batches.append([image.shape[:2] for image in source])
+        results = []
+        for image in source:
+            h, w = image.shape[:2]
+            boxes = torch.tensor([[w / 2 - 10, h / 2 - 10, w / 2 + 10, h / 2 + 10, 0.9, 0.0]])
+            results.append(Results(image, path="", names={0: "tumor"}, boxes=boxes, speed={"inference": 5.0}))
+        return results
+
+
+def test_predict_tiled_batches_tiles_and_maps_boxes_to_image():
+    pytest.importorskip("ultralytics")
+    model = TileModel()
+    large = np.zeros((1000, 1500, 3), dtype=np.uint8)
+    small = np.zeros((300, 400, 3), dtype=np.uint8)
+    results = predict.predict_tiled([large, small], model, tile_size=640, overlap=128, max_batch=4)
+    # 6 tiles and the whole image for the large scan, the small one as is, 4 at a time
+    assert [len(batch) for batch in model.batches] == [4, 4]
+    assert model.batches[0][0] == (640, 640)
+    large_boxes = results[0].boxes.data.numpy()
+    assert len(large_boxes) == 7
+    assert [310, 310, 330, 330] in large_boxes[:, :4].tolist()
+    assert [1170, 670, 1190, 690] in large_boxes[:, :4].tolist()
+    assert results[0].orig_shape == (1000, 1500)
+    assert results[0].speed["inference"] == 35.0
+    assert results[1].boxes.data[:, :4].tolist() == [[190, 140, 210, 160]]
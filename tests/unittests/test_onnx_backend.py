@@ -0,0 +1,238 @@
+# tests/unittests/test_onnx_backend.py
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from ml.utils import (
+    letterbox,
+    merge_tile_detections,
+    nms,
+    postprocess_detections,
+    scale_boxes_to_original,
+    tile_image,
+    tile_origins,
+)
+
+# -------------------------------------------------------------------------
+# Tests for the NumPy pre- and postprocessing helpers
+# -------------------------------------------------------------------------
+
+
+def test_letterbox_keeps_aspect_ratio_and_pads_to_square():
+    img = np.zeros((320, 640, 3), dtype=np.uint8)
+    padded, ratio, pad = letterbox(img, 640)
+    assert padded.shape == (640, 640, 3)
+    assert ratio == 1.0
+    assert pad == (0, 160)
+    assert padded[0, 0, 0] == 114
+
+
+def test_scale_boxes_to_original_inverts_letterbox():
+    boxes = np.array([[100.0, 210.0, 300.0, 410.0]], dtype=np.float32)
+    scaled = scale_boxes_to_original(boxes, ratio=0.5, pad=(0, 160), original_shape=(640, 1280))
+    assert np.allclose(scaled, [[200.0, 100.0, 600.0, 500.0]])
+
+
+def test_nms_suppresses_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7], dtype=np.float32)
+    assert nms(boxes, scores, iou_threshold=0.5).tolist() == [0, 2]
+    assert nms(boxes, scores, iou_threshold=0.5, max_det=1).tolist() == [0]
+
+
+def test_nms_intersection_over_smaller_suppresses_contained_boxes():
+    boxes = np.array([[0, 0, 100, 100], [60, 10, 100, 50]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    assert nms(boxes, scores, iou_threshold=0.5).tolist() == [0, 1]
+    assert nms(boxes, scores, iou_threshold=0.5, metric="ios").tolist() == [0]
+
+
+def test_tiles_cover_image_with_overlap():
+    assert tile_origins(500, 640, 128) == [0]
+    assert tile_origins(1500, 640, 128) == [0, 512, 860]
+    image = np.zeros((1000, 1500, 3), dtype=np.uint8)
+    tiles, offsets = tile_image(image, 640, 128)
+    assert len(tiles) == 6
+    assert all(tile.shape == (640, 640, 3) for tile in tiles)
+    assert offsets[-1] == (860, 360)
+    assert np.shares_memory(tiles[0], image)
+
+
+def test_merge_tile_detections_keeps_one_box_per_lesion():
+    # The same lesion seen whole in one tile and cut off in its neighbour, plus one of another class
+    detections = [
+        np.array([[450, 100, 600, 200, 0.9, 1]], dtype=np.float32),
+        np.array([[0, 100, 88, 200, 0.6, 1], [10, 10, 50, 50, 0.7, 0]], dtype=np.float32),
+    ]
+    merged = merge_tile_detections(detections, [(0, 0), (512, 0)], iou=0.5)
+    assert np.allclose(merged, [[450, 100, 600, 200, 0.9, 1], [522, 10, 562, 50, 0.7, 0]])
+
+
+def test_postprocess_detections_is_class_aware():
+    # Two identical boxes with different classes must both survive NMS
+    prediction = np.zeros((4 + 2, 3), dtype=np.float32)
+    prediction[:4, 0] = prediction[:4, 1] = [50, 50, 20, 20]
+    prediction[4, 0] = 0.9
+    prediction[5, 1] = 0.8
+    prediction[4, 2] = 0.1
+    detections = postprocess_detections(prediction, conf=0.5)
+    assert detections.shape == (2, 6)
+    assert detections[:, 5].tolist() == [0.0, 1.0]
+    assert np.allclose(detections[0, :4], [40, 40, 60, 60])
+
+
+# -------------------------------------------------------------------------
+# Parity between the PyTorch and ONNX Runtime backends
+# -------------------------------------------------------------------------
+
+
+def box_iou(a, b):
+    inter_w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    inter_h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = inter_w * inter_h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter + 1e-9)
+
+
+@pytest.fixture(scope="module")
+def torch_weights(tmp_path_factory):
+    """Use the trained weights when present, otherwise a randomly initialised yolov8n that still fires boxes."""
+    from ml.predict import BEST_MODEL_PATH
+
+    if os.path.isfile(BEST_MODEL_PATH):
+        return BEST_MODEL_PATH
+    import torch
+    from ultralytics import YOLO
+
+    torch.manual_seed(0)
+    model = YOLO("yolov8n.yaml")
+    net = model.model
+    # Calibrate batch norm statistics so activations are not degenerate, then bias the class head
+    for module in net.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.momentum = None
+    net.train()
+    with torch.no_grad():
+        for _ in range(2):
+            net(torch.rand(2, 3, 640, 640))
+    net.eval()
+    for head in net.model[-1].cv3:
+        head[-1].bias.data.fill_(-12.0)
+    path = tmp_path_factory.mktemp("weights") / "random_yolov8n.pt"
+    model.save(str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def onnx_weights(torch_weights, tmp_path_factory):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from ml.export import export_onnx
+
+    output = tmp_path_factory.mktemp("onnx") / "model.onnx"
+    return export_onnx(torch_weights, str(output), simplify=False)
+
+
+def test_torch_backend_letterboxes_once_and_maps_boxes_to_original(torch_weights):
+    from ultralytics import YOLO
+
+    from ml.predict import TorchBackend
+
+    backend = TorchBackend(torch_weights)
+    reference = YOLO(torch_weights)
+    rng = np.random.default_rng(2)
+    image = cv2.GaussianBlur(rng.integers(0, 255, (480, 800, 3), dtype=np.uint8), (31, 31), 0)
+
+    result = backend.predict(image, conf=0.5)[0]
+    expected = reference.predict(image, imgsz=640, conf=0.5, verbose=False)[0]
+    assert result.orig_shape == (480, 800)
+    assert result.orig_img is image
+    assert len(expected.boxes) > 0
+    boxes, expected_boxes = result.boxes.data.cpu().numpy(), expected.boxes.data.cpu().numpy()
+    matched = sum(
+        any(box_iou(box, other) > 0.95 and abs(box[4] - other[4]) < 0.02 for other in boxes) for box in expected_boxes
+    )
+    assert matched >= 0.9 * len(expected_boxes)
+
+
+def test_torch_backend_with_mapped_weights_matches_heap_weights(torch_weights, tmp_path, monkeypatch):
+    import ml.predict as predict
+
+    monkeypatch.setattr(predict, "MMAP_WEIGHTS_DIR", str(tmp_path))
+    backend = predict.TorchBackend(torch_weights)
+    mapped = predict.TorchBackend(torch_weights, mmap=True)
+    assert len(list(tmp_path.glob("*.fused.pt"))) == 1
+    rng = np.random.default_rng(3)
+    image = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (31, 31), 0)
+
+    result = mapped.predict(image, conf=0.5)[0]
+    expected = backend.predict(image, conf=0.5)[0]
+    assert np.allclose(result.boxes.data.numpy(), expected.boxes.data.numpy(), atol=1e-3)
+
+
+def test_onnx_backend_matches_torch_backend(torch_weights, onnx_weights):
+    from ml.predict import OnnxBackend, TorchBackend
+
+    torch_backend = TorchBackend(torch_weights)
+    onnx_backend = OnnxBackend(onnx_weights)
+    rng = np.random.default_rng(0)
+    images = [cv2.GaussianBlur(rng.integers(0, 255, (640, 640, 3), dtype=np.uint8), (31, 31), 0) for _ in range(2)]
+
+    torch_results = torch_backend.predict(images, conf=0.5)
+    onnx_results = onnx_backend.predict(images, conf=0.5)
+    assert len(torch_results) == len(onnx_results) == 2
+    assert sum(len(result.boxes) for result in torch_results) > 0
+
+    for torch_result, onnx_result in zip(torch_results, onnx_results):
+        torch_boxes = torch_result.boxes.data.cpu().numpy()
+        onnx_boxes = onnx_result.boxes.data.cpu().numpy()
+        assert onnx_result.orig_shape == torch_result.orig_shape
+        assert abs(len(torch_boxes) - len(onnx_boxes)) <= max(1, len(torch_boxes) // 20)
+        matched = 0
+        for box in torch_boxes:
+            candidates = onnx_boxes[onnx_boxes[:, 5] == box[5]]
+            if any(box_iou(box, other) > 0.98 and abs(box[4] - other[4]) < 0.01 for other in candidates):
+                matched += 1
+        assert matched >= 0.95 * len(torch_boxes)
+
+
+# -------------------------------------------------------------------------
+# INT8 quantization
+# -------------------------------------------------------------------------
+
+
+@pytest.fixture(scope="module")
+def calibration_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("calibration")
+    rng = np.random.default_rng(1)
+    for i in range(3):
+        image = cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (31, 31), 0)
+        cv2.imwrite(str(directory / f"{i}.jpg"), image)
+    return str(directory)
+
+
+def test_static_quantized_model_loads_through_onnx_backend(onnx_weights, calibration_dir, tmp_path):
+    from ml.predict import OnnxBackend, load_backend
+    from ml.quantize import quantize_model
+
+    output = quantize_model(
+        onnx_weights, str(tmp_path / "model.int8.onnx"), calibration_dir=calibration_dir, num_calibration_images=3
+    )
+    assert os.path.getsize(output) < os.path.getsize(onnx_weights) / 2
+
+    backend = load_backend(output, "onnx-int8")
+    assert isinstance(backend, OnnxBackend)
+    image = cv2.imread(os.path.join(calibration_dir, "0.jpg"))
+    results = backend.predict([image, image])
+    assert len(results) == 2
+    assert results[0].orig_shape == (480, 640)
+    assert results[0].boxes.data.shape[1] == 6
+
+
+def test_quantize_model_rejects_unknown_mode(onnx_weights, tmp_path):
+    from ml.quantize import quantize_model
+
+    with pytest.raises(ValueError):
+        quantize_model(onnx_weights, str(tmp_path / "model.int8.onnx"), mode="int4")
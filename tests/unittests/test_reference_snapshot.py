@@ -0,0 +1,98 @@
+"""Unit tests for the precomputed drift monitoring reference snapshot."""
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from monitoring.core import reference_snapshot
+from monitoring.core.feature_extractor import FEATURE_EXTRACTOR_VERSION
+from monitoring.core.monitor import BrainTumorImageMonitor
+
+
+@pytest.fixture
+def train_split(tmp_path):
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    images.mkdir()
+    labels.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(6):
+        cv2.imwrite(str(images / f"scan_{i}.jpg"), rng.integers(0, 255, (64, 48, 3), dtype=np.uint8))
+        if i < 5:
+            (labels / f"scan_{i}.txt").write_text(f"{i % 2} 0.5 0.5 0.2 0.2\n")
+    (images / "notes.txt").write_text("not an image")
+    return images, labels
+
+
+def test_snapshot_version_is_the_dvc_directory_hash(tmp_path):
+    dvc_file = tmp_path / "train.dvc"
+    dvc_file.write_text("outs:\n- md5: c9b3c4c332bb09831e587e06ba0fe779.dir\n  path: train\n")
+    assert reference_snapshot.dataset_version(str(dvc_file)) == "c9b3c4c332bb09831e587e06ba0fe779"
+
+
+def test_reference_features_are_reproducible_across_workers(train_split):
+    images, labels = train_split
+    serial = reference_snapshot.compute_reference_features(str(images), str(labels), workers=1)
+    parallel = reference_snapshot.compute_reference_features(str(images), str(labels), workers=2)
+
+    assert len(serial) == 6
+    assert list(serial["prediction_class"]) == ["0", "1", "0", "1", "0", "unknown"]
+    assert (serial["model_version"] == "reference").all()
+    assert serial.equals(parallel)
+
+
+def test_snapshot_round_trip_keeps_rows_and_versions(train_split, tmp_path):
+    images, labels = train_split
+    df = reference_snapshot.compute_reference_features(str(images), str(labels), workers=1)
+    path = reference_snapshot.write_snapshot(df, reference_snapshot.snapshot_path(tmp_path / "ref", "abc"), "abc")
+
+    assert path.name == f"reference_features_abc_{FEATURE_EXTRACTOR_VERSION}.parquet"
+    loaded = reference_snapshot.load_snapshot(path)
+    assert loaded.equals(df)
+    metadata = reference_snapshot.snapshot_metadata(path)
+    assert metadata["dataset_version"] == "abc"
+    assert metadata["extractor_version"] == FEATURE_EXTRACTOR_VERSION
+    assert metadata["num_images"] == 6
+
+
+def test_find_snapshot_matches_versions(tmp_path):
+    df = pd.DataFrame({"brightness_mean": [1.0]})
+    old = reference_snapshot.write_snapshot(df, reference_snapshot.snapshot_path(tmp_path, "old"), "old")
+    new = reference_snapshot.write_snapshot(df, reference_snapshot.snapshot_path(tmp_path, "new"), "new")
+    stale = reference_snapshot.snapshot_path(tmp_path, "new", "v0")
+    reference_snapshot.write_snapshot(df, stale, "new", "v0")
+
+    assert reference_snapshot.find_snapshot(str(tmp_path), "old") == old
+    assert reference_snapshot.find_snapshot(str(tmp_path), "missing") is None
+    # Without a pinned version the newest snapshot of the current extractor wins
+    new.touch()
+    assert reference_snapshot.find_snapshot(str(tmp_path), None) == new
+    assert reference_snapshot.find_snapshot(str(tmp_path / "empty"), None) is None
+
+
+def test_monitor_loads_the_snapshot_without_gcs(train_split, tmp_path, monkeypatch):
+    images, labels = train_split
+    df = reference_snapshot.compute_reference_features(str(images), str(labels), workers=1)
+    reference_snapshot.write_snapshot(df, reference_snapshot.snapshot_path(tmp_path / "ref", "abc"), "abc")
+
+    def no_gcs(self, n_images=50):
+        raise AssertionError("GCS must not be used when a snapshot exists")
+
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data_from_gcs", no_gcs)
+    monitor = BrainTumorImageMonitor(
+        f"sqlite:///{tmp_path / 'monitor.db'}",
+        reports_dir=str(tmp_path / "reports"),
+        reference_snapshot_dir=str(tmp_path / "ref"),
+    )
+    assert monitor.get_reference_data().equals(df)
+
+
+def test_monitor_falls_back_to_gcs_without_a_snapshot(tmp_path, monkeypatch):
+    fallback = pd.DataFrame({"brightness_mean": [1.0]})
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data_from_gcs", lambda self: fallback)
+    monitor = BrainTumorImageMonitor(
+        f"sqlite:///{tmp_path / 'monitor.db'}",
+        reports_dir=str(tmp_path / "reports"),
+        reference_snapshot_dir=str(tmp_path / "ref"),
+    )
+    assert monitor.get_reference_data() is fallback
@@ -0,0 +1,127 @@
+"""Unit tests for the background drift report jobs."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from monitoring.core import monitor as monitor_module
+from monitoring.core.report_jobs import DriftReportJobs
+
+
+class FakeMonitor:
+    """Builds reports through the job's render function, like BrainTumorImageMonitor."""
+
+    def __init__(self, fail=None):
+        self.feature_extractor = SimpleNamespace(version="v1")
+        self.reference_version = "abc123"
+        self.fail = fail
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate_brain_tumor_drift_report(self, days, render):
+        self.calls.append(days)
+        self.release.wait(10)
+        if self.fail is not None:
+            raise self.fail
+        html = render("reference", "current", ["brightness_mean"])
+        return f"https://storage.example/reports/report_{days}_{len(self.calls)}.html?{html.decode()}"
+
+
+@pytest.fixture(autouse=True)
+def fake_render(monkeypatch):
+    monkeypatch.setattr(monitor_module, "render_drift_report", lambda reference, current, columns: b"html")
+
+
+def make_jobs(monitor, **kwargs):
+    return DriftReportJobs(monitor, render_executor=ThreadPoolExecutor(max_workers=1), **kwargs)
+
+
+def finished(job):
+    return job.future.result(timeout=10)
+
+
+def test_job_builds_the_report():
+    monitor = FakeMonitor()
+    jobs = make_jobs(monitor)
+    job = finished(jobs.submit(7))
+
+    assert job.status == "succeeded"
+    assert job.report_path == "report_7_1.html?html"
+    assert job.to_dict()["days_analyzed"] == 7
+    assert jobs.get(job.job_id) is job
+    jobs.close()
+
+
+def test_requests_for_the_same_window_share_one_job():
+    monitor = FakeMonitor()
+    monitor.release.clear()
+    jobs = make_jobs(monitor)
+    running = jobs.submit(7)
+    # While the first job runs, and after it finished, the same report is not built again
+    assert jobs.submit(7) is running
+    monitor.release.set()
+    finished(running)
+    assert jobs.submit(7) is running
+    assert finished(jobs.submit(30)) is not running
+    assert monitor.calls == [7, 30]
+    jobs.close()
+
+
+def test_new_reference_or_extractor_version_builds_a_new_report():
+    monitor = FakeMonitor()
+    jobs = make_jobs(monitor)
+    first = finished(jobs.submit(7))
+    monitor.reference_version = "def456"
+    second = finished(jobs.submit(7))
+    monitor.feature_extractor.version = "v1-thumb256"
+    third = finished(jobs.submit(7))
+    assert len({first.job_id, second.job_id, third.job_id}) == 3
+    jobs.close()
+
+
+def test_failed_jobs_report_the_error_and_are_retried():
+    monitor = FakeMonitor(fail=HTTPException(status_code=400, detail="Insufficient data"))
+    jobs = make_jobs(monitor)
+    failed = finished(jobs.submit(7))
+    assert (failed.status, failed.status_code, failed.error) == ("failed", 400, "Insufficient data")
+
+    monitor.fail = None
+    retried = finished(jobs.submit(7))
+    assert retried is not failed and retried.status == "succeeded"
+    jobs.close()
+
+
+def test_old_finished_jobs_are_forgotten():
+    jobs = make_jobs(FakeMonitor(), max_jobs=2)
+    first = finished(jobs.submit(1))
+    for days in (2, 3):
+        finished(jobs.submit(days))
+    jobs.submit(4)
+    assert jobs.get(first.job_id) is None
+    jobs.close()
+
+
+def test_close_fails_queued_jobs_so_waiters_are_answered():
+    monitor = FakeMonitor()
+    monitor.release.clear()
+    jobs = make_jobs(monitor, workers=1)
+    running = jobs.submit(7)
+    queued = jobs.submit(30)
+    while not monitor.calls:
+        time.sleep(0.01)
+    jobs.close()
+
+    cancelled = finished(queued)
+    assert (cancelled.status, cancelled.status_code) == ("failed", 503)
+    late = finished(jobs.submit(1))
+    assert late.status == "failed"
+
+    # The job already running still finishes
+    monitor.release.set()
+    assert finished(running).status == "succeeded"
+    assert monitor.calls == [7]
@@ -0,0 +1,88 @@
+"""Unit tests for drift report storage and the local report cache."""
+
+import gzip
+
+import pytest
+
+from monitoring.core.report_store import LocalReportStorage, ReportCache, check_report_name
+
+HTML = b"<html><body>" + b"<p>drift</p>" * 5000 + b"</body></html>"
+
+
+class CountingStorage(LocalReportStorage):
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = 0
+
+    def download(self, name):
+        self.downloads += 1
+        return super().download(name)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = CountingStorage(str(tmp_path / "reports"))
+    storage.upload("report_a.html", HTML)
+    return storage
+
+
+def test_local_storage_round_trip(storage, tmp_path):
+    assert storage.upload("report_b.html", b"<html/>") == str(tmp_path / "reports" / "report_b.html")
+    assert storage.download("report_b.html") == b"<html/>"
+    assert storage.download("missing.html") is None
+
+
+@pytest.mark.parametrize("name", ["../secret.html", "a/b.html", ".hidden", "", "..\\x.html"])
+def test_names_outside_the_storage_are_rejected(name):
+    with pytest.raises(ValueError):
+        check_report_name(name)
+
+
+def test_cache_downloads_once_and_keeps_compressed_variants(storage, tmp_path):
+    cache = ReportCache(storage, cache_dir=str(tmp_path / "cache"))
+    report = cache.get("report_a.html")
+    assert cache.get("report_a.html") is report
+    assert storage.downloads == 1
+
+    assert report.paths["identity"].read_bytes() == HTML
+    assert gzip.decompress(report.paths["gzip"].read_bytes()) == HTML
+    assert report.paths["gzip"].stat().st_size < len(HTML) / 10
+    assert cache.get("missing.html") is None
+
+
+def test_encoding_negotiation_and_etags(storage, tmp_path):
+    report = ReportCache(storage, cache_dir=str(tmp_path / "cache")).get("report_a.html")
+    assert report.select("gzip, deflate") == "gzip"
+    assert report.select("gzip;q=0, deflate") == "identity"
+    assert report.select(None) == "identity"
+    if "br" in report.paths:
+        assert report.select("gzip, br") == "br"
+
+    assert report.etag_for("gzip") != report.etag_for("identity")
+    assert report.matches(report.etag_for("gzip"))
+    assert report.matches(f'"other", W/{report.etag}')
+    assert not report.matches('"other"')
+
+
+def test_cache_evicts_least_recently_used_reports_within_its_budget(storage, tmp_path):
+    storage.upload("report_b.html", HTML.replace(b"drift", b"other"))
+    cache = ReportCache(storage, cache_dir=str(tmp_path / "cache"), max_bytes=1)
+    first = cache.get("report_a.html")
+    cache.get("report_b.html")
+
+    assert len(cache) == 1
+    assert not first.paths["identity"].exists()
+    assert cache.size_bytes == sum(path.stat().st_size for path in cache.get("report_b.html").paths.values())
+
+
+def test_open_files_survive_eviction_and_evicted_reports_are_fetched_again(storage, tmp_path):
+    cache = ReportCache(storage, cache_dir=str(tmp_path / "cache"))
+    report = cache.get("report_a.html")
+    with cache.open(report, "gzip") as file:
+        cache.clear()
+        assert not report.paths["gzip"].exists()
+        assert gzip.decompress(file.read()) == HTML
+
+    with cache.open(report, "identity") as file:
+        assert file.read() == HTML
+    assert storage.downloads == 2
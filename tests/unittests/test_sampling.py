@@ -0,0 +1,78 @@
+"""Unit tests for the sampled, windowed current data used for drift analysis."""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, insert, text
+
+from monitoring.core import monitor as monitor_module
+from monitoring.core.log_writer import PREDICTIONS_LOG_COLUMNS, predictions_log
+from monitoring.core.monitor import BrainTumorImageMonitor
+from monitoring.core.sampling import reservoir_sample
+
+
+def chunked(df, size):
+    return (df.iloc[i : i + size] for i in range(0, len(df), size))
+
+
+def test_reservoir_keeps_everything_below_the_cap():
+    df = pd.DataFrame({"x": range(30), "name": [str(i) for i in range(30)]})
+    sample = reservoir_sample(chunked(df, 7), 50)
+    assert sorted(sample["x"]) == list(range(30))
+    assert sample.dtypes.equals(df.dtypes)
+
+
+def test_reservoir_sample_is_uniform():
+    df = pd.DataFrame({"x": np.arange(1000)})
+    hits = np.zeros(1000)
+    for seed in range(300):
+        sample = reservoir_sample(chunked(df, 64), 100, seed=seed)
+        assert len(sample) == 100 and sample["x"].is_unique
+        hits[sample["x"].to_numpy()] += 1
+    # Every row is kept with probability 0.1, early and late rows alike
+    assert hits[:500].mean() == pytest.approx(30, rel=0.05)
+    assert hits[500:].mean() == pytest.approx(30, rel=0.05)
+
+
+def test_reservoir_of_nothing_is_empty():
+    assert reservoir_sample(iter([]), 10).empty
+
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'monitor.db'}")
+    columns = ", ".join(
+        f"{name} TEXT" if name in ("prediction_class", "model_version") else name for name in PREDICTIONS_LOG_COLUMNS
+    )
+    now = datetime.now()
+    rows = []
+    for i in range(500):
+        row = {name: float(i) for name in PREDICTIONS_LOG_COLUMNS}
+        row.update(timestamp=now - timedelta(hours=i), prediction_class="benign", model_version="yolov8n")
+        rows.append(row)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE predictions_log (id INTEGER PRIMARY KEY, {columns})"))
+        conn.execute(insert(predictions_log), rows)
+
+    monkeypatch.setattr(BrainTumorImageMonitor, "_load_reference_data", lambda self: None)
+    monkeypatch.setattr(monitor_module, "CURRENT_DATA_CHUNK_SIZE", 32)
+    monitor = BrainTumorImageMonitor(str(engine.url), reports_dir=str(tmp_path / "reports"))
+    yield monitor
+    monitor.close()
+
+
+def test_current_data_honours_the_window(monitor):
+    current = monitor.get_current_data(days=7)
+    # One prediction per hour: the last 7 days hold 168 of the 500
+    assert len(current) == 168
+    assert current["entropy"].max() == 167
+    assert current["timestamp"].is_monotonic_decreasing
+
+
+def test_current_data_is_sampled_down_to_the_cap(monitor, monkeypatch):
+    monkeypatch.setattr(monitor_module, "CURRENT_DATA_SAMPLE_SIZE", 50)
+    current = monitor.get_current_data(days=30)
+    assert len(current) == 50
+    assert current["entropy"].is_unique and current["entropy"].max() < 500